@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+
+class AnkiConnectStub:
+    """Local stand-in for the AnkiConnect add-on, answering the actions the application sends."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Create the server; port 0 picks a free port.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+
+        self.requests = 0
+        self.notes = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this every response waits for a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with stub._lock:
+                    stub.requests += 1
+                data = json.dumps(stub.handle(body["action"], body.get("params", {}))).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        """Address to pass to AnkiConnectClient."""
+
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Answer one action.
+
+        :param action: Name of the AnkiConnect action.
+        :param params: Parameters of the action.
+        :return: A dictionary with "result" and "error" keys.
+        """
+
+        if action == "multi":
+            return {"result": [self.handle(item["action"], item.get("params", {})) for item in params["actions"]],
+                    "error": None}
+        if action == "version":
+            return {"result": 6, "error": None}
+        if action == "modelNames":
+            return {"result": [], "error": None}
+        if action in ("createDeck", "createModel"):
+            return {"result": 1, "error": None}
+        if action == "canAddNotes":
+            return {"result": [bool(note["fields"].get("Question")) for note in params["notes"]], "error": None}
+        if action == "addNotes":
+            with self._lock:
+                first = self.notes + 1
+                self.notes += len(params["notes"])
+            return {"result": list(range(first, first + len(params["notes"]))), "error": None}
+        if action == "importPackage":
+            if not os.path.exists(params["path"]):
+                return {"result": None, "error": f"{params['path']} does not exist"}
+            return {"result": True, "error": None}
+
+        return {"result": None, "error": f"unsupported action: {action}"}
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,101 @@
+import json
+import random
+from typing import List, Tuple
+
+KB = 1024
+MB = 1024 * KB
+
+_SYLLABLES = ("an", "ki", "mo", "ra", "te", "lu", "son", "vi", "dor", "pe", "qua", "ex", "in", "tro", "gen",
+              "al", "ber", "cy", "um", "ph", "sta", "lo", "ne", "ri", "cho", "mat", "is", "or", "ve", "ta")
+
+
+def _vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    return ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(size)]
+
+
+def make_text(size: int, seed: int = 0) -> str:
+    """
+    Build a deterministic source document of paragraphs and sentences made of pseudo-words.
+
+    :param size: Length of the document in characters.
+    :param seed: Seed of the generator; the same size and seed always give the same text.
+    :return: The document.
+    """
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = rng.choices(vocabulary, k=rng.randint(8, 20))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+
+    return "\n\n".join(paragraphs)[:size]
+
+
+def make_cards(count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Build deterministic, unique question/answer pairs.
+
+    :param count: Number of cards.
+    :param seed: Seed of the generator.
+    :return: Pairs of question and answer.
+    """
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+
+    return [(f"{index}. What is {' '.join(rng.choices(vocabulary, k=rng.randint(3, 8)))}?",
+             " ".join(rng.choices(vocabulary, k=rng.randint(5, 25))).capitalize() + ".")
+            for index in range(count)]
+
+
+def make_response(size: int, json_mode: bool = False, seed: int = 0) -> str:
+    """
+    Build a model response of about the given size, in the formats models actually answer with.
+
+    Text responses mix plain "Front:/Back:" lines with numbered, bold and "Q:/A:" variants and a few
+    stray lines, so the parser takes its slower paths too.
+
+    :param size: Approximate length of the response in characters.
+    :param json_mode: Build a JSON array of {"front", "back"} objects instead of text.
+    :param seed: Seed of the generator.
+    :return: The response.
+    """
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+
+    parts = []
+    length = 0
+    index = 0
+    while length < size:
+        question = f"What is {' '.join(rng.choices(vocabulary, k=rng.randint(3, 8)))}?"
+        answer = " ".join(rng.choices(vocabulary, k=rng.randint(5, 25))).capitalize() + "."
+        index += 1
+
+        if json_mode:
+            part = json.dumps({"front": question, "back": answer})
+        else:
+            style = index % 10
+            if style < 6:
+                part = f"Front: {question}\nBack: {answer}\n"
+            elif style < 8:
+                part = f"{index}. **Question:** {question}\n   **Answer:** {answer}\n"
+            elif style < 9:
+                part = f"Q: {question}\nA: {answer}\n"
+            else:
+                part = f"Here is card {index}:\nFront: {question}\nBack: {answer}\n"
+
+        parts.append(part)
+        length += len(part) + 1
+
+    if json_mode:
+        return "[" + ",\n".join(parts) + "]"
+    return "\n".join(parts)
@@ -0,0 +1,477 @@
+"""
+Benchmarks of the generation, parse, review, package and AnkiConnect stages.
+
+Run from the project root, e.g.:
+
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --suite parse --suite package --output before.json
+    python -m benchmarks.run --compare before.json
+
+Results are written as JSON so runs of different commits can be compared.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.anki_stub import AnkiConnectStub
+from benchmarks.corpus import KB, MB, make_text, make_cards, make_response
+from utils.anki_connection_utils import AnkiConnectClient
+from utils.card_utils import CardStore, SAVED, DELETED
+from utils.generation_utils import generate_flashcards, CHUNK_MAX_TOKENS, MAX_WORKERS
+from utils.llm_utils import FakeBackend, FakeLLMServer, HTTPBackend
+from utils.package_utils import create_model, write_package, write_notes, append_package
+from utils.bulk_package_utils import default_workers, write_notes_bulk
+from utils.writer_utils import ApkgShardWriter, SHARD_NOTES
+from utils.text_preprocessing_utils import preprocess_response, CardStreamParser
+
+DEFAULT_OUTPUT = os.path.join("benchmarks", "results.json")
+
+CORPUS_SIZES = [KB, 10 * KB, 100 * KB, MB, 10 * MB]
+QUICK_CORPUS_SIZES = [KB, 10 * KB, 100 * KB, MB]
+PACKAGE_SIZES = [100, 10_000, 100_000]
+QUICK_PACKAGE_SIZES = [100, 10_000]
+STREAM_DELTA = 16
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Tuple[Dict[str, float], Any]:
+    """
+    Time a function several times.
+
+    :param fn: Function to time.
+    :param repeat: Number of runs.
+    :return: The best and median time in seconds, and the result of the last run.
+    """
+
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+
+    return {"seconds": statistics.median(times), "best_seconds": min(times), "repeat": repeat}, result
+
+
+def result(suite: str, case: str, params: Dict[str, Any], timing: Dict[str, float], **values: Any) -> Dict[str, Any]:
+    """
+    Build one benchmark result.
+
+    :param suite: Name of the suite.
+    :param case: Name of the case within the suite.
+    :param params: Parameters of the case; suite, case and params together identify a result across runs.
+    :param timing: Dictionary returned by measure.
+    :param values: Derived measurements such as throughputs.
+    :return: The result dictionary.
+    """
+
+    return {"suite": suite, "case": case, "params": params, **timing,
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in values.items()}}
+
+
+def bench_generation(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Split, request (fake model) and parse synthetic corpora end to end."""
+
+    results = []
+    in_process = FakeBackend(latency=options.latency)
+    server = FakeLLMServer(FakeBackend(latency=options.latency)).start()
+    backends = [("fake", in_process), ("fake_http", HTTPBackend(server.api_base, pool_size=MAX_WORKERS))]
+
+    try:
+        for size in options.corpus_sizes:
+            text = make_text(size)
+            for name, backend in backends:
+                if name == "fake_http" and size > MB:
+                    continue
+                timing, cards = measure(lambda: generate_flashcards(text, max_tokens=CHUNK_MAX_TOKENS,
+                                                                    max_workers=MAX_WORKERS, backend=backend),
+                                        options.repeat)
+                results.append(result("generation", name, {"bytes": size, "latency": options.latency}, timing,
+                                      cards=len(cards), mb_per_s=size / MB / timing["seconds"]))
+    finally:
+        server.stop()
+
+    return results
+
+
+def bench_parse(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Parse synthetic model responses, whole and streamed in small deltas."""
+
+    def stream(response):
+        parser = CardStreamParser()
+        cards = 0
+        for start in range(0, len(response), STREAM_DELTA):
+            cards += len(parser.feed(response[start:start + STREAM_DELTA]))
+        return cards + len(parser.close())
+
+    results = []
+    for size in options.corpus_sizes:
+        for mode in ("text", "json"):
+            response = make_response(size, json_mode=mode == "json")
+
+            timing, cards = measure(lambda: len(preprocess_response(response)), options.repeat)
+            results.append(result("parse", f"preprocess_response_{mode}", {"bytes": size}, timing,
+                                  cards=cards, mb_per_s=size / MB / timing["seconds"],
+                                  cards_per_s=cards / timing["seconds"]))
+
+            if size <= MB:
+                timing, cards = measure(lambda: stream(response), options.repeat)
+                results.append(result("parse", f"stream_{mode}", {"bytes": size, "delta": STREAM_DELTA}, timing,
+                                      cards=cards, mb_per_s=size / MB / timing["seconds"]))
+
+    return results
+
+
+def bench_review(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Load cards into a CardStore and review every one of them, without widgets; also report its memory use."""
+
+    def review(flash_cards):
+        store = CardStore(flash_cards)
+        for index in range(0, len(store), 2):
+            store.set_status(index, SAVED)
+        store.set_status_range(0, len(store), DELETED)
+        return len(store.saved())
+
+    results = []
+    for count in options.package_sizes:
+        flash_cards = {index: {"question": question, "answer": answer}
+                       for index, (question, answer) in enumerate(make_cards(count))}
+        timing, _ = measure(lambda: review(flash_cards), options.repeat)
+
+        # The card texts already exist, so this is what the store adds on top of them.
+        tracemalloc.start()
+        store = CardStore(flash_cards)
+        store_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        results.append(result("review", "card_store", {"cards": count}, timing,
+                              cards_per_s=count / timing["seconds"], bytes_per_card=store_bytes / len(store)))
+
+    return results
+
+
+def bench_package(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Write .apkg packages with genanki and with the bulk engine, in shards, and append a few new cards to a deck.
+    """
+
+    results = []
+    model = create_model()
+    workers = sorted({1, default_workers()})
+
+    for count in options.package_sizes:
+        cards = make_cards(count)
+        notes = [(None, question, answer) for question, answer in cards]
+        with tempfile.TemporaryDirectory() as package_dir:
+            path = os.path.join(package_dir, "Notes.apkg")
+            timing, _ = measure(lambda: write_notes(notes, "Benchmark", path, model, None, bulk=False),
+                                options.repeat)
+            results.append(result("package", "write_notes_genanki", {"notes": count}, timing,
+                                  notes_per_s=count / timing["seconds"]))
+
+            for worker_count in workers:
+                timing, _ = measure(lambda: write_notes_bulk(notes, "Benchmark", path, model, workers=worker_count),
+                                    options.repeat)
+                results.append(result("package", "write_notes_bulk", {"notes": count, "workers": worker_count},
+                                      timing, notes_per_s=count / timing["seconds"]))
+
+            def write_shards():
+                with ApkgShardWriter(package_dir, "Shards", model, SHARD_NOTES) as writer:
+                    writer.write_many(cards)
+                return writer.paths
+
+            timing, paths = measure(write_shards, options.repeat)
+            results.append(result("package", "write_shards", {"notes": count, "shard_size": SHARD_NOTES}, timing,
+                                  notes_per_s=count / timing["seconds"], shards=len(paths)))
+
+            timing, path = measure(lambda: write_package(cards, "Benchmark", package_dir, model=model),
+                                   options.repeat)
+            results.append(result("package", "write_package", {"notes": count}, timing,
+                                  notes_per_s=count / timing["seconds"], bytes=os.path.getsize(path)))
+
+            # The first append indexes the deck in the manifest; only the second one is the steady state.
+            append_package(cards, "Benchmark", package_dir, model=model)
+            new_cards = make_cards(100, seed=count)
+            timing, _ = measure(lambda: append_package(new_cards, "Benchmark", package_dir, model=model), 1)
+            results.append(result("package", "append_100_new", {"notes": count}, timing))
+
+    return results
+
+
+def bench_anki_connect(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Round trips to a local AnkiConnect stub."""
+
+    results = []
+    stub = AnkiConnectStub()
+    client = AnkiConnectClient(stub.url)
+
+    try:
+        calls = 200
+        timing, _ = measure(lambda: [client.invoke("version") for _ in range(calls)], options.repeat)
+        results.append(result("anki_connect", "round_trip", {"calls": calls}, timing,
+                              ms_per_call=timing["seconds"] / calls * 1000))
+
+        for count in options.package_sizes:
+            cards = make_cards(count)
+            before = stub.requests
+            timing, _ = measure(lambda: client.add_notes("Benchmark", "Model", cards), options.repeat)
+            results.append(result("anki_connect", "add_notes", {"notes": count}, timing,
+                                  requests=(stub.requests - before) // options.repeat,
+                                  notes_per_s=count / timing["seconds"]))
+
+        with tempfile.TemporaryDirectory() as package_dir:
+            path = write_package(make_cards(100), "Benchmark", package_dir)
+            timing, _ = measure(lambda: client.import_package(path), options.repeat)
+            results.append(result("anki_connect", "import_package", {"notes": 100}, timing))
+    finally:
+        stub.stop()
+
+    return results
+
+
+def _open_display() -> Tuple[Optional[Any], Optional[str]]:
+    """
+    Make sure an X display is available, starting a virtual one if needed.
+
+    :return: The started virtual display (or None), and the reason the GUI cannot be benchmarked (or None).
+    """
+
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None, None
+
+    try:
+        from xvfbwrapper import Xvfb
+    except ImportError:
+        return None, "no DISPLAY and xvfbwrapper is not installed"
+
+    display = Xvfb(width=1280, height=800)
+    try:
+        display.start()
+    except Exception as error:
+        return None, f"could not start Xvfb: {error}"
+    return display, None
+
+
+def bench_gui(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Start the application, switch scenes, and open and scroll the review window under a (virtual) display."""
+
+    display, reason = _open_display()
+    if reason is not None:
+        return [{"suite": "gui", "case": "toplevel_window", "params": {}, "skipped": reason}]
+
+    try:
+        from main import App
+        from ui_components import ToplevelWindow
+
+        def start_app():
+            app = App()
+            app.update()
+            return app
+
+        timing, root = measure(start_app, 1)
+        results = [result("gui", "app_start", {}, timing)]
+
+        switches = 20
+
+        def switch_scenes():
+            for _ in range(switches // 2):
+                root.change_to_api_scene()
+                root.update_idletasks()
+                root.change_to_flashcard_scene()
+                root.update_idletasks()
+
+        timing, _ = measure(switch_scenes, options.repeat)
+        results.append(result("gui", "scene_switch", {"switches": switches}, timing,
+                              ms_per_switch=timing["seconds"] / switches * 1000))
+
+        for count in [count for count in options.package_sizes if count <= 10_000]:
+            flash_cards = {index: {"question": question, "answer": answer}
+                           for index, (question, answer) in enumerate(make_cards(count))}
+            windows = []
+
+            def open_window():
+                window = ToplevelWindow(flash_cards, root)
+                window.update()
+                windows.append(window)
+
+            timing, _ = measure(open_window, options.repeat)
+            results.append(result("gui", "toplevel_window_open", {"cards": count}, timing))
+
+            window = windows[-1]
+            steps = 100
+
+            def scroll():
+                for step in range(steps):
+                    window.card_list.on_scrollbar("moveto", step / steps)
+                    window.update_idletasks()
+
+            timing, _ = measure(scroll, options.repeat)
+            results.append(result("gui", "toplevel_window_scroll", {"cards": count, "steps": steps}, timing,
+                                  ms_per_step=timing["seconds"] / steps * 1000))
+
+            for window in windows:
+                window.destroy()
+
+        root.destroy()
+        return results
+    finally:
+        if display is not None:
+            display.stop()
+
+
+def _import_times(statement: str) -> Tuple[float, List[Dict[str, Any]]]:
+    """
+    Import modules in a fresh interpreter with -X importtime.
+
+    :param statement: Python statement to run, e.g. "import main".
+    :return: The wall time of the interpreter in seconds, and one entry per imported module.
+    """
+
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                             capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                        "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+
+    return wall, modules
+
+
+def bench_startup(options: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Import the GUI and CLI entry points in fresh interpreters, with -X importtime details."""
+
+    results = []
+    baseline = min(_import_times("pass")[0] for _ in range(options.repeat))
+
+    for entry_point in ("main", "cli"):
+        runs = [_import_times(f"import {entry_point}") for _ in range(options.repeat)]
+        walls = [wall for wall, _ in runs]
+        modules = runs[walls.index(min(walls))][1]
+        end = next(index for index, module in enumerate(modules) if module["module"] == entry_point)
+        start = end
+        while start > 0 and modules[start - 1]["depth"] > 0:
+            start -= 1
+
+        # -X importtime lists a module after everything it imports, so the entry point's tree ends with it.
+        heaviest = sorted((module for module in modules[start:end] if module["depth"] <= 2),
+                          key=lambda module: module["cumulative_us"], reverse=True)[:options.importtime_top]
+        total = modules[end]
+
+        results.append(result("startup", f"import_{entry_point}", {},
+                              {"seconds": statistics.median(walls), "best_seconds": min(walls),
+                               "repeat": options.repeat},
+                              interpreter_seconds=baseline, import_ms=total["cumulative_us"] / 1000,
+                              modules=len(modules), importtime=heaviest))
+
+    return results
+
+
+SUITES = {
+    "startup": bench_startup,
+    "generation": bench_generation,
+    "parse": bench_parse,
+    "review": bench_review,
+    "package": bench_package,
+    "anki_connect": bench_anki_connect,
+    "gui": bench_gui,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(entry: Dict[str, Any]) -> str:
+    return f"{entry['suite']}/{entry['case']} {json.dumps(entry['params'], sort_keys=True)}"
+
+
+def print_results(results: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    Print one line per result, with the change against a baseline run if one is given.
+
+    :param results: Results of this run.
+    :param baseline: Results of an earlier run.
+    """
+
+    previous = {_key(entry): entry for entry in baseline or [] if "seconds" in entry}
+
+    for entry in results:
+        if "skipped" in entry:
+            print(f"{_key(entry):<70} skipped: {entry['skipped']}")
+            continue
+
+        line = f"{_key(entry):<70} {entry['seconds'] * 1000:>10.1f} ms"
+        if _key(entry) in previous:
+            line += f"  ({previous[_key(entry)]['seconds'] / entry['seconds']:.2f}x vs baseline)"
+        print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the flashcard pipeline.")
+    parser.add_argument("--suite", action="append", choices=list(SUITES),
+                        help="Suite to run; repeat the option to run several (default: all).")
+    parser.add_argument("--quick", action="store_true", help="Leave out the 10 MB corpus and the 100k note deck.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is reported.")
+    parser.add_argument("--importtime-top", type=int, default=25,
+                        help="Number of slowest imports listed per entry point by the startup suite.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency of the fake model in seconds.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file of an earlier run to compare with.")
+    options = parser.parse_args(argv)
+
+    options.corpus_sizes = QUICK_CORPUS_SIZES if options.quick else CORPUS_SIZES
+    options.package_sizes = QUICK_PACKAGE_SIZES if options.quick else PACKAGE_SIZES
+
+    results = []
+    for name in options.suite or list(SUITES):
+        print(f"Running {name}...", file=sys.stderr)
+        results.extend(SUITES[name](options))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": options.quick,
+            "repeat": options.repeat,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    print_results(results, baseline)
+
+    with open(options.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {options.output}", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
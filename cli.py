@@ -0,0 +1,744 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from utils.anki_connection_utils import save_package_to_app, push_cards_to_app, get_client, AnkiConnectError
+from utils.cache_utils import get_response_cache
+from utils.dedup_utils import get_duplicate_index
+from utils.coverage_utils import PendingCoverage, get_coverage_index
+from utils.search_utils import get_search_index, CARDS, SOURCES, SEARCH_LIMIT
+from utils.library_utils import DeckLibrary, PAGE_SIZE
+from utils.file_utils import get_package_dir, get_library_cache_dir
+from utils.llm_utils import (create_backend, LLMBackend, FakeBackend, FakeLLMServer, BACKENDS,
+                             FAKE_LATENCY, FAKE_TOKEN_LATENCY, FAKE_ERROR_RATE)
+from utils.generation_utils import (split_into_chunks, cached_request, parse_response, describe_error,
+                                    SYSTEM_PROMPT, JSON_SYSTEM_PROMPT)
+from utils.settings_utils import get_settings
+from utils.queue_utils import JobQueue, get_job_store, PRIORITIES
+from utils.rate_limit_utils import rate_limited, get_rate_limiter, format_limiter
+from utils.metrics_utils import RunMetrics, get_metrics_store, format_totals
+from utils.text_preprocessing_utils import ParseReport
+from utils.package_utils import create_model, write_package, append_package
+from utils.writer_utils import create_writer, CardWriter, EXPORT_FORMATS
+
+SOURCE_EXTENSIONS = (".txt", ".md", ".markdown")
+STATE_FILENAME = ".batch_state.json"
+
+
+def collect_sources(paths: List[str]) -> List[str]:
+    """
+    Expand the given files and directories into a sorted list of source documents.
+
+    :param paths: Files or directories given on the command line.
+    :return: Absolute paths of the text and markdown files found.
+    """
+
+    sources = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for filename in filenames:
+                    if filename.lower().endswith(SOURCE_EXTENSIONS):
+                        sources.add(os.path.abspath(os.path.join(root, filename)))
+        elif os.path.isfile(path):
+            sources.add(os.path.abspath(path))
+        else:
+            print(f"Skipping missing path: {path}", file=sys.stderr)
+
+    return sorted(sources)
+
+
+def load_state(state_path: str) -> Dict:
+    """
+    Load the progress of a previous run.
+
+    :param state_path: Path of the state file.
+    :return: The state dictionary, empty if there was no previous run.
+    """
+
+    if os.path.exists(state_path):
+        with open(state_path, "r") as state_file:
+            return json.load(state_file)
+    return {"completed": {}}
+
+
+def save_state(state: Dict, state_path: str) -> None:
+    """
+    Atomically write the progress of the current run.
+
+    :param state: The state dictionary.
+    :param state_path: Path of the state file.
+    """
+
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(tmp_path, state_path)
+
+
+def deck_title_for(source: str) -> str:
+    """
+    Derive the deck title from the name of a source document.
+
+    :param source: Path of the source document.
+    :return: The file name without its extension.
+    """
+
+    return os.path.splitext(os.path.basename(source))[0]
+
+
+def deliver(cards: List, deck_title: str, args: argparse.Namespace, model) -> bool:
+    """
+    Write the cards of one deck to a package or the --format files, or push them into Anki with --push.
+
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the deck.
+    :param args: Parsed command line arguments.
+    :param model: genanki Model of the notes.
+    :return: False if the cards could not be pushed into Anki.
+    """
+
+    if args.push:
+        try:
+            note_ids = push_cards_to_app(cards, deck_title, model)
+            print(f"{deck_title}: {sum(1 for note_id in note_ids if note_id)} notes added to Anki")
+        except AnkiConnectError as error:
+            print(f"{deck_title}: {error}", file=sys.stderr)
+            return False
+        get_duplicate_index().add_many(cards, f"anki:{deck_title}")
+        return True
+
+    if args.format != "apkg" or args.shard_size:
+        writer = create_writer(args.format, args.output, deck_title, model, args.shard_size)
+        try:
+            writer.write_many(cards)
+        except BaseException:
+            writer.abort()
+            raise
+        finish_writer(writer, args)
+        return True
+
+    if args.append:
+        package_path = append_package(cards, deck_title, args.output, model=model)
+        if package_path is None:
+            print(f"{deck_title}: no new cards")
+            return True
+    else:
+        package_path = write_package(cards, deck_title, args.output, model=model)
+
+    get_duplicate_index().index_package(package_path)
+    print(f"{deck_title}: {len(cards)} cards -> {package_path}")
+    if args.import_to_anki:
+        save_package_to_app(package_path)
+    return True
+
+
+def finish_writer(writer: CardWriter, args: argparse.Namespace) -> None:
+    """
+    Close the writer of the --format files of one deck, then index and, with --import, import its .apkg shards.
+
+    :param writer: Writer the cards of the deck were written to.
+    :param args: Parsed command line arguments.
+    """
+
+    writer.close()
+    print(f"{writer.deck_title}: {writer.count} cards -> {', '.join(writer.paths)}")
+    if args.format == "apkg":
+        for package_path in writer.paths:
+            get_duplicate_index().index_package(package_path)
+            if args.import_to_anki:
+                save_package_to_app(package_path)
+
+
+def backend_from_args(args: argparse.Namespace) -> Optional[LLMBackend]:
+    """
+    Create the chat backend from config.json and the --backend and --api-base options.
+
+    The backend waits for the RATE_LIMIT_RPM and RATE_LIMIT_TPM limits of config.json.
+
+    :param args: Parsed command line arguments.
+    :return: The backend, or None after printing why the configuration is invalid.
+    """
+
+    api_data = get_settings().values()
+    if args.backend:
+        api_data["BACKEND"] = args.backend
+    if args.api_base:
+        api_data["API_BASE"] = args.api_base
+    try:
+        return rate_limited(create_backend(api_data))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return None
+
+
+def run_generate(args: argparse.Namespace) -> int:
+    """
+    Convert source documents into Anki packages.
+
+    All chunks of all documents share one pool of --concurrency workers. A document is packaged as soon as
+    its last chunk is done, and recorded in the state file so an interrupted run can be resumed. Chunks found
+    in the source coverage index are not sent to the model; the cards they produced before are reused. The
+    generated chunks are recorded in the index once their deck is delivered.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    if args.format != "apkg" and (args.push or args.append or args.import_to_anki):
+        print("--push, --append and --import need --format apkg", file=sys.stderr)
+        return 1
+    if args.shard_size and args.append:
+        print("--append cannot be combined with --shard-size", file=sys.stderr)
+        return 1
+
+    settings = get_settings()
+    model_name = args.model or settings.model
+    backend = backend_from_args(args)
+    if backend is None:
+        return 1
+
+    sources = collect_sources(args.paths)
+    if not sources:
+        print("No .txt or .md documents found", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    state_path = os.path.join(args.output, STATE_FILENAME)
+    state = load_state(state_path) if args.resume else {"completed": {}}
+
+    documents = {}
+    for source in sources:
+        with open(source, "r", encoding="utf-8") as source_file:
+            text = source_file.read()
+
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        entry = state["completed"].get(source, {})
+        if entry.get("sha256") == digest and ("package" in entry) != bool(args.merge):
+            print(f"Skipping {source} (already converted)")
+            continue
+
+        documents[source] = {"sha256": digest, "text": text, "chunks": split_into_chunks(text, args.chunk_tokens)}
+
+    system_prompt = JSON_SYSTEM_PROMPT if args.json else SYSTEM_PROMPT
+    cache = None if args.no_cache else get_response_cache()
+    duplicate_index = get_duplicate_index()
+    duplicate_index.index_package_dir(args.output)
+    coverage = get_coverage_index()
+    search_index = get_search_index()
+    model = create_model()
+    failed = 0
+    done_chunks = 0
+
+    # Chunks that already produced cards in an earlier run are not generated again; their cards are reused.
+    pending = {source: PendingCoverage(coverage, source, backend.identity) for source in documents}
+    covered = {source: pending[source].find_many(document["chunks"]) if args.skip_covered else {}
+               for source, document in documents.items()}
+    total_chunks = sum(len(document["chunks"]) - len(covered[source]) for source, document in documents.items())
+    print(f"{len(documents)} documents, {total_chunks} chunks to generate")
+    reused = sum(len(chunks) for chunks in covered.values())
+    if reused:
+        print(f"{reused} chunks already have cards, which are reused; pass --regenerate to generate them again")
+
+    run = RunMetrics("cli", model_name, args.chunk_tokens, args.concurrency, backend.name)
+    metrics = {source: {index: run.new_request(len(run.requests))
+                        for index in range(len(document["chunks"])) if index not in covered[source]}
+               for source, document in documents.items()}
+    responses = {source: [None] * len(document["chunks"]) for source, document in documents.items()}
+    remaining = {source: len(metrics[source]) for source in documents}
+
+    reports = {source: ParseReport() for source in documents}
+    dropped = {source: 0 for source in documents}
+    # With --format tsv or jsonl, or --shard-size, the cards of a document are written as its chunks finish,
+    # in source order, instead of being collected until the whole document is done.
+    streaming = not (args.merge or args.push or args.append) and (args.format != "apkg" or args.shard_size)
+    writers = {}
+    written = {source: [] for source in documents}
+
+    # The cards of one chunk, reused from the coverage index or parsed from its response.
+    def chunk_cards(source: str, index: int) -> List:
+        if index in covered[source]:
+            return list(covered[source][index].cards)
+        cards = [(card["question"], card["answer"]) for card in
+                 parse_response(responses[source][index], reports[source], metrics[source][index],
+                                f"chunk {index + 1}")]
+        pending[source].add(documents[source]["chunks"][index], cards)
+        return cards
+
+    def drop_duplicates(source: str, cards: List) -> List:
+        if not args.drop_duplicates:
+            return cards
+        # The package being rewritten for this document does not count as an earlier copy.
+        own_package = os.path.join(args.output, f"{args.merge or deck_title_for(source)}.apkg")
+        unique = [card for card in cards
+                  if (duplicate_index.find_duplicate(*card) or {"source": own_package})["source"] == own_package]
+        dropped[source] += len(cards) - len(unique)
+        return unique
+
+    # Writes the finished chunks of a document up to the first one still being generated.
+    def write_ready(source: str) -> None:
+        if source not in writers:
+            writers[source] = create_writer(args.format, args.output, deck_title_for(source), model,
+                                            args.shard_size)
+        chunks = documents[source]["chunks"]
+        while len(written[source]) < len(chunks):
+            index = len(written[source])
+            if index not in covered[source] and responses[source][index] is None:
+                break
+            cards = drop_duplicates(source, chunk_cards(source, index))
+            writers[source].write_many(cards)
+            written[source].append(cards)
+            # The response is not needed once its cards are written.
+            responses[source][index] = None
+
+    # Packages the cards of a document whose chunks are all done; False if they could not be delivered.
+    def complete(source: str) -> bool:
+        cards = []
+        if streaming:
+            write_ready(source)
+            for chunk in written.pop(source):
+                cards.extend(chunk)
+        else:
+            for index in range(len(documents[source]["chunks"])):
+                cards.extend(chunk_cards(source, index))
+            cards = drop_duplicates(source, cards)
+
+        report = reports[source]
+        if not report.ok:
+            print(f"{source}: {report.summary()}", file=sys.stderr)
+            for issue in report.issues:
+                print(f"  {issue}", file=sys.stderr)
+        if args.drop_duplicates:
+            print(f"{source}: dropped {dropped[source]} duplicate cards")
+        entry = {"sha256": documents[source]["sha256"], "cards": cards}
+
+        if streaming:
+            finish_writer(writers.pop(source), args)
+        elif not args.merge and not deliver(cards, deck_title_for(source), args, model):
+            return False
+        if not args.merge:
+            pending[source].record(cards)
+            entry = {"sha256": documents[source]["sha256"], "package": deck_title_for(source), "cards": []}
+
+        search_index.add_cards(cards, args.merge or deck_title_for(source), source, model_name, "cli")
+        search_index.add_source(source, documents[source]["text"])
+
+        state["completed"][source] = entry
+        save_state(state, state_path)
+        return True
+
+    for source in [source for source, count in remaining.items() if count == 0]:
+        if not documents[source]["chunks"]:
+            state["completed"][source] = {"sha256": documents[source]["sha256"], "cards": []}
+        elif not complete(source):
+            failed += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {
+            executor.submit(cached_request, documents[source]["chunks"][index], model_name, system_prompt, cache,
+                            settings.max_retries, metrics=request, backend=backend): (source, index)
+            for source, requests in metrics.items()
+            for index, request in requests.items()
+        }
+
+        try:
+            for future in as_completed(futures):
+                source, index = futures[future]
+                done_chunks += 1
+
+                try:
+                    responses[source][index] = future.result()
+                except Exception as error:
+                    metrics[source][index].error = describe_error(error)
+                    print(f"[{done_chunks}/{total_chunks}] {source}: chunk {index + 1} failed: "
+                          f"{metrics[source][index].error}", file=sys.stderr)
+                    remaining[source] = -1
+                    failed += 1
+                    if source in writers:
+                        # The document is not complete, so the files written so far are removed.
+                        writers.pop(source).abort()
+                    continue
+
+                if remaining[source] < 0:
+                    continue
+
+                remaining[source] -= 1
+                print(f"[{done_chunks}/{total_chunks}] {source}: chunk {index + 1} done")
+
+                if remaining[source] == 0:
+                    if not complete(source):
+                        failed += 1
+                elif streaming:
+                    write_ready(source)
+        except BaseException:
+            # An interrupted run leaves no partial files behind.
+            for writer in writers.values():
+                writer.abort()
+            raise
+
+    if args.merge:
+        cards = [tuple(card) for source in sources for card in state["completed"].get(source, {}).get("cards", [])]
+        if not deliver(cards, args.merge, args, model):
+            failed += 1
+        else:
+            for source in documents:
+                pending[source].record(cards)
+
+    save_state(state, state_path)
+
+    run.finish()
+    if run.requests:
+        get_metrics_store().record(run)
+        print(run.summary())
+        print(format_limiter(get_rate_limiter().stats()))
+
+    if failed:
+        print(f"{failed} chunks or decks failed; run the same command again to retry them", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_index_duplicates(args: argparse.Namespace) -> int:
+    """
+    Update the duplicate card index from deck packages and, optionally, a running Anki.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    duplicate_index = get_duplicate_index()
+    added = sum(duplicate_index.index_package_dir(directory) for directory in args.dirs)
+    print(f"{added} cards indexed from packages")
+
+    if args.anki:
+        try:
+            print(f"{duplicate_index.index_anki_notes(get_client(), args.query)} cards indexed from Anki")
+        except AnkiConnectError as error:
+            print(error, file=sys.stderr)
+            return 1
+
+    print(f"{len(duplicate_index)} cards in the index")
+    return 0
+
+
+def run_metrics(args: argparse.Namespace) -> int:
+    """
+    Summarize the recorded generation metrics and optionally export them.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    store = get_metrics_store()
+    since = time.time() - args.days * 86400 if args.days else 0.0
+    print(format_totals(store.totals(since)))
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as output:
+            print(f"{store.export_jsonl(output, since)} requests exported to {args.export}")
+
+    return 0
+
+
+def run_library(args: argparse.Namespace) -> int:
+    """
+    List the packages of a deck directory, or print one page of the notes of a package.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    library = DeckLibrary(args.dir, get_library_cache_dir())
+    if args.package is None:
+        packages = library.packages(args.search or "")
+        for info in packages:
+            print(f"{info.notes:>7} notes  {os.path.basename(info.path)}  ({info.title})")
+        print(f"{len(packages)} packages, {sum(info.notes for info in packages)} notes")
+        return 0
+
+    path = args.package if os.path.exists(args.package) else os.path.join(args.dir, args.package)
+    try:
+        package = library.open(path)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    try:
+        search = args.search or ""
+        total = package.count(search)
+        offset = (args.page - 1) * args.page_size
+        for number, note in enumerate(package.notes(offset, args.page_size, search), start=offset + 1):
+            print(f"{number}. {note.question}\n   {note.answer}")
+        print(f"Page {args.page} of {max(1, -(-total // args.page_size))}, {total} notes")
+    finally:
+        package.close()
+
+    return 0
+
+
+def run_search(args: argparse.Namespace) -> int:
+    """
+    Search the saved cards or the source texts they were generated from.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    search_index = get_search_index()
+    if args.index_packages:
+        print(f"Indexed {search_index.index_package_dir(args.index_packages)} notes of changed packages")
+
+    started = time.perf_counter()
+    try:
+        hits = search_index.search(" ".join(args.query), SOURCES if args.sources else CARDS, args.limit, args.fts)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    for number, hit in enumerate(hits, start=1):
+        if hit.kind == SOURCES:
+            print(f"{number}. {hit.title}\n   {hit.snippet}")
+        else:
+            print(f"{number}. [{hit.title or 'no deck'}] {hit.question}\n   {hit.answer}")
+            if hit.source:
+                print(f"   from {hit.source} ({hit.origin}{', ' + hit.model if hit.model else ''})")
+
+    cards, sources = search_index.counts()
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms ({cards} cards, {sources} source texts indexed)")
+    return 0
+
+
+def run_queue(args: argparse.Namespace) -> int:
+    """
+    Add documents to the persistent job queue, list it, change jobs or process it until it is empty.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    settings = get_settings()
+    store = get_job_store()
+
+    if args.action == "add":
+        sources = collect_sources(args.paths)
+        for source in sources:
+            with open(source, "r", encoding="utf-8", errors="replace") as source_file:
+                text = source_file.read()
+            job_id = store.add(text, os.path.splitext(os.path.basename(source))[0], args.priority, source,
+                               args.model or settings.model, args.chunk_tokens)
+            print(f"{job_id}: {source}")
+        print(f"{len(sources)} documents queued")
+        return 0 if sources else 1
+
+    if args.action == "list":
+        for job in store.jobs():
+            print(f"{job.job_id:>5}  {job.priority:>3}  {job.describe():<30}  {job.title}")
+        counts = store.counts()
+        print(", ".join(f"{count} {state}" for state, count in sorted(counts.items())) or "The queue is empty")
+        return 0
+
+    if args.action in ("cancel", "retry", "remove"):
+        for job_id in args.ids:
+            if args.action == "remove":
+                store.remove(job_id)
+            elif not getattr(store, args.action)(job_id):
+                print(f"Job {job_id} does not allow {args.action} in its current state", file=sys.stderr)
+        return 0
+
+    if args.action == "priority":
+        for job_id in args.ids:
+            store.set_priority(job_id, args.priority)
+        return 0
+
+    backend = backend_from_args(args)
+    if backend is None:
+        return 1
+
+    queue = JobQueue(store, args.workers, backend=backend,
+                     cache=None if args.no_cache else get_response_cache(),
+                     max_retries=settings.max_retries,
+                     on_change=lambda job: print(f"{job.job_id}: {job.title}: {job.describe()}"),
+                     coverage=get_coverage_index() if args.skip_covered else None,
+                     search_index=get_search_index())
+    recovered = queue.start(exit_when_idle=True)
+    if recovered:
+        print(f"Resuming {recovered} interrupted jobs")
+
+    try:
+        # Joining in short steps keeps Ctrl+C responsive.
+        while queue.running:
+            queue.join(0.5)
+    except KeyboardInterrupt:
+        print("Stopping after the current chunks; run again to resume")
+        queue.stop()
+        queue.join()
+
+    counts = store.counts()
+    print(", ".join(f"{count} {state}" for state, count in sorted(counts.items())))
+    print(format_limiter(get_rate_limiter().stats()))
+    return 0
+
+
+def run_serve_fake(args: argparse.Namespace) -> int:
+    """
+    Serve a fake OpenAI-compatible chat model for offline load tests.
+
+    :param args: Parsed command line arguments.
+    :return: Process exit code.
+    """
+
+    backend = FakeBackend(latency=args.latency, token_latency=args.token_latency,
+                          error_rate=args.error_rate, seed=args.seed, requests_per_minute=args.rpm)
+    server = FakeLLMServer(backend, args.host, args.port)
+    print(f"Serving a fake chat model at {server.api_base}; press Ctrl+C to stop")
+    print(f"Use it with: generate --backend http --api-base {server.api_base} ...")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser.
+
+    :return: The argument parser with all subcommands.
+    """
+
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Anki cards creator without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Convert text and markdown documents into Anki decks.")
+    generate.add_argument("paths", nargs="+", help="Files or directories with .txt/.md documents.")
+    generate.add_argument("-o", "--output", default=get_package_dir(), help="Directory for the exported decks.")
+    generate.add_argument("-c", "--concurrency", type=int, default=settings.max_workers,
+                          help="Maximum number of requests in flight (default: MAX_WORKERS from config.json).")
+    generate.add_argument("-m", "--model", help="Chat model, defaults to the MODEL from config.json.")
+    generate.add_argument("--backend", choices=BACKENDS, help="Chat backend, defaults to the BACKEND from config.json.")
+    generate.add_argument("--api-base", help="Base URL of the http backend, e.g. http://localhost:8000/v1.")
+    generate.add_argument("--merge", metavar="DECK_TITLE", help="Write all cards into one deck with this title.")
+    generate.add_argument("--chunk-tokens", type=int, default=settings.chunk_tokens,
+                          help="Token budget of one chunk (default: CHUNK_TOKENS from config.json).")
+    generate.add_argument("--json", action="store_true",
+                          help="Ask the model for a JSON array of cards instead of Front:/Back: lines.")
+    generate.add_argument("--no-cache", action="store_true", help="Do not use the response cache.")
+    generate.add_argument("--no-resume", dest="resume", action="store_false",
+                          help="Ignore the progress of a previous run.")
+    generate.add_argument("--append", action="store_true",
+                          help="Add only the new cards to existing decks, as small .partN.apkg packages.")
+    generate.add_argument("--import", dest="import_to_anki", action="store_true",
+                          help="Import the packages into a running Anki through AnkiConnect.")
+    generate.add_argument("--push", action="store_true",
+                          help="Add the notes to a running Anki through AnkiConnect instead of writing packages.")
+    generate.add_argument("--format", choices=EXPORT_FORMATS, default="apkg",
+                          help="Output format: Anki packages, tab-separated text for Anki's import dialog, "
+                               "or one JSON object per card.")
+    generate.add_argument("--shard-size", type=int, default=0, metavar="NOTES",
+                          help="Split each .apkg deck into packages of at most NOTES notes.")
+    generate.add_argument("--regenerate", dest="skip_covered", action="store_false",
+                          help="Generate every chunk, also the ones that already produced cards in an earlier run.")
+    generate.add_argument("--drop-duplicates", action="store_true",
+                          help="Leave out cards that duplicate already indexed ones.")
+    generate.set_defaults(func=run_generate)
+
+    index_duplicates = subparsers.add_parser("index-duplicates", help="Update the duplicate card index.")
+    index_duplicates.add_argument("dirs", nargs="*", default=[get_package_dir()],
+                                  help="Directories with .apkg files (default: deck_packages).")
+    index_duplicates.add_argument("--anki", action="store_true",
+                                  help="Also index the notes of a running Anki through AnkiConnect.")
+    index_duplicates.add_argument("--query", default="deck:*", help="Anki search query selecting the notes.")
+    index_duplicates.set_defaults(func=run_index_duplicates)
+
+    metrics = subparsers.add_parser("metrics", help="Summarize the token, cost and latency metrics of generations.")
+    metrics.add_argument("--days", type=float, help="Only include generations of the last DAYS days.")
+    metrics.add_argument("--export", metavar="FILE", help="Write one JSON line per request to FILE.")
+    metrics.set_defaults(func=run_metrics)
+
+    library = subparsers.add_parser("library", help="List deck packages or page through the notes of one.")
+    library.add_argument("package", nargs="?", help="Package to show, a path or a file name in --dir.")
+    library.add_argument("--dir", default=get_package_dir(), help="Directory with the .apkg files.")
+    library.add_argument("-s", "--search", help="Only show decks or notes containing this text.")
+    library.add_argument("-p", "--page", type=int, default=1, help="Page of notes to show.")
+    library.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Notes per page.")
+    library.set_defaults(func=run_library)
+
+    search = subparsers.add_parser("search", help="Full-text search of the saved cards or their source texts.")
+    search.add_argument("query", nargs="+", help="Words to search for; the last one also matches as a prefix.")
+    search.add_argument("--sources", action="store_true", help="Search the source texts instead of the cards.")
+    search.add_argument("-n", "--limit", type=int, default=SEARCH_LIMIT, help="Maximum number of hits.")
+    search.add_argument("--fts", action="store_true",
+                        help="Pass the query to SQLite FTS5 as it is, e.g. 'question:tax AND deck:economics'.")
+    search.add_argument("--index-packages", nargs="?", const=get_package_dir(), metavar="DIR",
+                        help="First index the changed .apkg files of DIR (default: deck_packages).")
+    search.set_defaults(func=run_search)
+
+    queue = subparsers.add_parser("queue", help="Persistent document job queue, reviewed in the GUI.")
+    queue_actions = queue.add_subparsers(dest="action", required=True)
+
+    queue_add = queue_actions.add_parser("add", help="Queue .txt/.md documents.")
+    queue_add.add_argument("paths", nargs="+", help="Files or directories with .txt/.md documents.")
+    queue_add.add_argument("-p", "--priority", type=int, default=PRIORITIES["Normal"],
+                           help="Jobs with a higher priority run first (default: 0).")
+    queue_add.add_argument("-m", "--model", help="Chat model, defaults to the MODEL from config.json.")
+    queue_add.add_argument("--chunk-tokens", type=int, default=settings.chunk_tokens,
+                           help="Token budget of one chunk (default: CHUNK_TOKENS from config.json).")
+
+    queue_actions.add_parser("list", help="Show the jobs and their state.")
+
+    for action, help_text in (("cancel", "Cancel queued or running jobs."),
+                              ("retry", "Queue failed or cancelled jobs again."),
+                              ("remove", "Delete jobs and their cards.")):
+        queue_action = queue_actions.add_parser(action, help=help_text)
+        queue_action.add_argument("ids", type=int, nargs="+", help="Job ids, as shown by queue list.")
+
+    queue_priority = queue_actions.add_parser("priority", help="Change the priority of jobs.")
+    queue_priority.add_argument("priority", type=int, help="New priority; higher runs first.")
+    queue_priority.add_argument("ids", type=int, nargs="+", help="Job ids, as shown by queue list.")
+
+    queue_run = queue_actions.add_parser("run", help="Generate the queued jobs until none is left.")
+    queue_run.add_argument("-w", "--workers", type=int, default=settings.queue_workers,
+                           help="Number of documents generated at the same time (default: QUEUE_WORKERS).")
+    queue_run.add_argument("--backend", choices=BACKENDS, help="Chat backend, defaults to the BACKEND from config.json.")
+    queue_run.add_argument("--api-base", help="Base URL of the http backend, e.g. http://localhost:8000/v1.")
+    queue_run.add_argument("--no-cache", action="store_true", help="Do not use the response cache.")
+    queue_run.add_argument("--regenerate", dest="skip_covered", action="store_false",
+                           help="Generate every chunk, also the ones that already produced cards.")
+    queue.set_defaults(func=run_queue)
+
+    serve_fake = subparsers.add_parser("serve-fake", help="Serve a fake OpenAI-compatible chat model for load tests.")
+    serve_fake.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    serve_fake.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    serve_fake.add_argument("--latency", type=float, default=FAKE_LATENCY,
+                            help="Seconds before the first token of every response.")
+    serve_fake.add_argument("--token-latency", type=float, default=FAKE_TOKEN_LATENCY,
+                            help="Seconds per streamed token.")
+    serve_fake.add_argument("--error-rate", type=float, default=FAKE_ERROR_RATE,
+                            help="Share of requests answered with a 429 or 503 error.")
+    serve_fake.add_argument("--seed", type=int, default=0, help="Seed of the simulated errors.")
+    serve_fake.add_argument("--rpm", type=int, default=0,
+                            help="Simulated requests-per-minute limit, answered with 429 and Retry-After.")
+    serve_fake.set_defaults(func=run_serve_fake)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
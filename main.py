@@ -1,22 +1,9 @@
-import os
-
 import tkinter as tk
 import customtkinter as ctk
-import openai
 
-from ui_components import Scene1, Scene2
-from utils.api_utils import load_api_data
+from ui_components import Scene1, Scene2, QueueScene, LibraryScene, SearchScene
 from utils.file_utils import get_icon
-
-OPENAI_APIKEY = ""
-GPT_MODEL = ""
-
-if os.path.exists(os.path.join(os.getcwd(), "config.json")):
-    api_data = load_api_data()
-    OPENAI_APIKEY = api_data["API_KEY"]
-    GPT_MODEL = api_data["MODEL"]
-
-openai.api_key = OPENAI_APIKEY
+from utils.queue_utils import get_job_queue
 
 # System settings
 ctk.set_appearance_mode("System")
@@ -32,6 +19,9 @@ class App(ctk.CTk):
         self.title("Anki cards creator")
 
         self.api_keys_scene = None
+        self.queue_scene = None
+        self.library_scene = None
+        self.search_scene = None
         self.scenes_params = dict(row=0, column=1, sticky=tk.NSEW)
 
         self.left_frame = ctk.CTkFrame(self, corner_radius=0)
@@ -59,6 +49,36 @@ class App(ctk.CTk):
 
         self.createing_flashcards.pack(padx=10, pady=10)
 
+        self.document_queue = ctk.CTkButton(self.left_frame,
+                                            text="Document queue",
+                                            width=150,
+                                            height=35,
+                                            fg_color="gray20",
+                                            hover_color="gray25",
+                                            command=self.change_to_queue_scene)
+
+        self.document_queue.pack(padx=10, pady=10)
+
+        self.deck_library = ctk.CTkButton(self.left_frame,
+                                          text="Deck library",
+                                          width=150,
+                                          height=35,
+                                          fg_color="gray20",
+                                          hover_color="gray25",
+                                          command=self.change_to_library_scene)
+
+        self.deck_library.pack(padx=10, pady=10)
+
+        self.search_cards = ctk.CTkButton(self.left_frame,
+                                          text="Search cards",
+                                          width=150,
+                                          height=35,
+                                          fg_color="gray20",
+                                          hover_color="gray25",
+                                          command=self.change_to_search_scene)
+
+        self.search_cards.pack(padx=10, pady=10)
+
         self.quit_btn = ctk.CTkButton(self.left_frame,
                                       text="Quit",
                                       width=150,
@@ -74,19 +94,56 @@ class App(ctk.CTk):
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=1)
 
+        # Resume the documents left in the queue by the last session once the window is up.
+        self.after_idle(lambda: get_job_queue().start())
+
+    def show_scene(self, scene):
+        """Hide the displayed scene and show the given one; scenes keep their state while hidden."""
+
+        for other in (self.flash_card_scene, self.api_keys_scene, self.queue_scene, self.library_scene,
+                      self.search_scene):
+            if other is not None and other is not scene:
+                other.grid_remove()
+        scene.grid(**self.scenes_params)
+
     def change_to_api_scene(self):
-        """Switch the displayed scene to the API key management scene."""
+        """Switch the displayed scene to the API key management scene, building it on first use."""
+
+        if self.api_keys_scene is None:
+            self.api_keys_scene = Scene2(self, fg_color="#f7f7f8", corner_radius=0)
+        else:
+            self.api_keys_scene.reset()
+        self.show_scene(self.api_keys_scene)
+
+    def change_to_queue_scene(self):
+        """Switch the displayed scene to the document queue scene, building it on first use."""
+
+        if self.queue_scene is None:
+            self.queue_scene = QueueScene(self, fg_color="#f7f7f8", corner_radius=0)
+        self.show_scene(self.queue_scene)
 
-        self.flash_card_scene.forget()
-        self.api_keys_scene = Scene2(self, fg_color="#f7f7f8", corner_radius=0)
-        self.api_keys_scene.grid(**self.scenes_params)
+    def change_to_library_scene(self):
+        """Switch the displayed scene to the deck library, building it on first use and listing new packages."""
+
+        if self.library_scene is None:
+            self.library_scene = LibraryScene(self, fg_color="#f7f7f8", corner_radius=0)
+        else:
+            self.library_scene.refresh()
+        self.show_scene(self.library_scene)
+
+    def change_to_search_scene(self):
+        """Switch the displayed scene to the card search, building it on first use and showing new cards."""
+
+        if self.search_scene is None:
+            self.search_scene = SearchScene(self, fg_color="#f7f7f8", corner_radius=0)
+        else:
+            self.search_scene.search()
+        self.show_scene(self.search_scene)
 
     def change_to_flashcard_scene(self):
         """Switch the displayed scene to the flashcard creation scene."""
 
-        self.api_keys_scene.forget()
-        self.flash_card_scene = Scene1(self, fg_color="#f7f7f8", corner_radius=0)
-        self.flash_card_scene.grid(**self.scenes_params)
+        self.show_scene(self.flash_card_scene)
 
 
 def main():
@@ -0,0 +1,32 @@
+import importlib
+
+import pytest
+
+# Application-wide singletons, reset so that every test opens its own data files.
+SINGLETONS = {
+    "utils.anki_connection_utils": ("_default_client",),
+    "utils.cache_utils": ("_default_cache",),
+    "utils.coverage_utils": ("_default_index",),
+    "utils.dedup_utils": ("_default_index",),
+    "utils.library_utils": ("_default_library",),
+    "utils.llm_utils": ("_default_backend", "_default_backend_version"),
+    "utils.metrics_utils": ("_default_store",),
+    "utils.queue_utils": ("_default_store", "_default_queue"),
+    "utils.rate_limit_utils": ("_default_limiter",),
+    "utils.search_utils": ("_default_index",),
+    "utils.settings_utils": ("_default_settings",),
+}
+
+
+@pytest.fixture
+def project_dir(tmp_path, monkeypatch):
+    """Move the data files of the application (config, caches, indexes, packages) into a temporary directory."""
+
+    from utils import file_utils
+
+    monkeypatch.setattr(file_utils, "PROJECT_DIR", str(tmp_path))
+    for module_name, names in SINGLETONS.items():
+        module = importlib.import_module(module_name)
+        for name in names:
+            monkeypatch.setattr(module, name, None)
+    return tmp_path
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from benchmarks.anki_stub import AnkiConnectStub
+from utils.anki_connection_utils import AnkiConnectClient, AnkiConnectError, get_client
+from utils.package_utils import create_model
+
+
+@pytest.fixture
+def stub():
+    stub = AnkiConnectStub()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def client(stub):
+    return AnkiConnectClient(stub.url, timeout=5, retries=0)
+
+
+def test_multi_sends_the_actions_in_one_request(stub, client):
+    responses = client.multi([{'action': 'version'}, {'action': 'createDeck', 'params': {'deck': 'Deck'}},
+                              {'action': 'sync'}])
+
+    assert stub.requests == 1
+    assert responses == [{'result': 6, 'error': None}, {'result': 1, 'error': None},
+                         {'result': None, 'error': 'unsupported action: sync'}]
+
+
+def test_errors_become_anki_connect_errors(stub, client, tmp_path):
+    with pytest.raises(AnkiConnectError, match="unsupported action: sync"):
+        client.invoke('sync')
+    with pytest.raises(AnkiConnectError, match="does not exist"):
+        client.import_package(str(tmp_path / "missing.apkg"))
+
+    closed = AnkiConnectStub()
+    closed.stop()
+    with pytest.raises(AnkiConnectError, match="'version' failed"):
+        AnkiConnectClient(closed.url, timeout=5, retries=0).invoke('version')
+
+
+def test_add_notes_sends_only_the_notes_anki_accepts(stub, client):
+    progress = []
+    cards = [("Q1", "A1"), ("", "A2"), ("Q3", "A3"), ("", "A4"), ("", "A5"), ("Q6", "A6")]
+
+    note_ids = client.add_notes("Deck", "Basic", cards, batch_size=2,
+                                on_progress=lambda sent, total: progress.append((sent, total)))
+
+    assert note_ids == [1, None, 2, None, None, 3]
+    assert stub.notes == 3
+    # One request checks the three batches, one adds the notes of the two batches with accepted notes.
+    assert stub.requests == 2
+    assert progress == [(6, 6)]
+
+
+def test_add_notes_without_accepted_notes_sends_no_add_request(stub, client):
+    assert client.add_notes("Deck", "Basic", [("", "A1"), ("", "A2")]) == [None, None]
+    assert stub.requests == 1
+    assert stub.notes == 0
+
+
+def test_ensure_deck_and_model_creates_a_missing_note_type(stub, client):
+    client.ensure_deck_and_model("Deck", create_model())
+
+    assert stub.requests == 2
+
+
+def test_shared_client_uses_the_configured_timeout(project_dir):
+    with open(project_dir / "config.json", "w") as config:
+        json.dump({"ANKI_CONNECT_TIMEOUT": 3}, config)
+
+    assert get_client() is get_client()
+    assert get_client().timeout == 3
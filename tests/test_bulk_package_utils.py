@@ -0,0 +1,75 @@
+import sqlite3
+import zipfile
+
+import pytest
+
+from utils import bulk_package_utils
+from utils.bulk_package_utils import field_checksum, write_notes_bulk
+from utils.package_utils import create_model, write_notes
+
+NOTES = [(None, f"Question {index} <b>bold</b> &amp; <i>text</i>", f"Answer {index}") for index in range(50)]
+NOTES.append(("fixed-guid", "Question with a GUID", "Answer"))
+
+
+def _collection(package_path, tmp_path) -> sqlite3.Connection:
+    with zipfile.ZipFile(package_path) as package:
+        package.extract("collection.anki2", tmp_path)
+    return sqlite3.connect(str(tmp_path / "collection.anki2"))
+
+
+def _rows(package_path, tmp_path):
+    """
+    The notes and cards of a package, without the IDs and modification times that differ between writes,
+    and the sort field checksums of the notes, which genanki leaves at 0.
+    """
+
+    conn = _collection(package_path, tmp_path / package_path.stem)
+    try:
+        notes = conn.execute("SELECT guid, mid, usn, tags, flds, sfld, flags, data FROM notes ORDER BY id").fetchall()
+        cards = conn.execute("SELECT n.guid, c.did, c.ord, c.type, c.queue, c.ivl, c.factor, c.reps, c.lapses, "
+                             "c.left, c.odue, c.odid, c.flags, c.data FROM cards c JOIN notes n ON n.id = c.nid "
+                             "ORDER BY c.id").fetchall()
+        checksums = conn.execute("SELECT sfld, csum FROM notes ORDER BY id").fetchall()
+        return notes, cards, checksums
+    finally:
+        conn.close()
+
+
+def test_field_checksum_ignores_html():
+    assert field_checksum("<b>Paris</b> &amp; <!-- note -->Rome") == field_checksum("Paris & Rome")
+    assert field_checksum("Paris") != field_checksum("Rome")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bulk_package_matches_genanki(tmp_path, monkeypatch, workers):
+    # Small batches so that several of them are prepared, by the process pool with two workers.
+    monkeypatch.setattr(bulk_package_utils, "BATCH_NOTES", 7)
+    monkeypatch.setattr(bulk_package_utils, "PARALLEL_MIN_NOTES", 10)
+    model = create_model()
+    genanki_path = tmp_path / "genanki.apkg"
+    bulk_path = tmp_path / "bulk.apkg"
+
+    write_notes(NOTES, "Deck", str(genanki_path), model, None, bulk=False)
+    write_notes_bulk(NOTES, "Deck", str(bulk_path), model, workers=workers)
+
+    genanki_notes, genanki_cards, _ = _rows(genanki_path, tmp_path)
+    bulk_notes, bulk_cards, bulk_checksums = _rows(bulk_path, tmp_path)
+    assert bulk_notes == genanki_notes
+    assert bulk_cards == genanki_cards
+    assert all(checksum == field_checksum(sort_field) for sort_field, checksum in bulk_checksums)
+
+
+def test_progress_and_aborted_write(tmp_path):
+    progress = []
+    path = tmp_path / "deck.apkg"
+
+    write_notes_bulk(NOTES, "Deck", str(path), create_model(), on_progress=lambda done, total: progress.append(done),
+                     workers=1)
+    assert progress[0] == 0 and progress[-1] == len(NOTES)
+
+    def abort(done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        write_notes_bulk(NOTES, "Deck", str(tmp_path / "aborted.apkg"), create_model(), on_progress=abort, workers=1)
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["deck.apkg"]
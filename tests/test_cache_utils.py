@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from utils.cache_utils import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache.sqlite"))
+
+
+def test_key_depends_on_every_part_of_the_request():
+    key = ResponseCache.make_key("gpt-3.5-turbo", "prompt", "text", "openai")
+
+    assert key == ResponseCache.make_key("gpt-3.5-turbo", "prompt", "text", "openai")
+    assert key != ResponseCache.make_key("gpt-4", "prompt", "text", "openai")
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", "other prompt", "text", "openai")
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", "prompt", "other text", "openai")
+    assert key != ResponseCache.make_key("gpt-3.5-turbo", "prompt", "text", "fake")
+
+
+def test_key_parts_cannot_run_into_each_other():
+    assert ResponseCache.make_key("a", "bc", "d", "openai") != ResponseCache.make_key("ab", "c", "d", "openai")
+
+
+def test_get_returns_what_was_set(cache):
+    key = cache.make_key("model", "prompt", "text", "openai")
+
+    assert cache.get(key) is None
+    cache.set(key, "Front: Q\nBack: A")
+
+    assert cache.get(key) == "Front: Q\nBack: A"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), enabled=False)
+
+    cache.set("key", "value")
+
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_age=0.01)
+    cache.set("key", "value")
+    time.sleep(0.02)
+
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("first", "1")
+    time.sleep(0.01)
+    cache.set("second", "2")
+    time.sleep(0.01)
+    cache.get("first")
+    time.sleep(0.01)
+    cache.set("third", "3")
+
+    assert cache.get("second") is None
+    assert cache.get("first") == "1"
+    assert cache.get("third") == "3"
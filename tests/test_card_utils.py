@@ -0,0 +1,60 @@
+from utils.card_utils import CardStore, PENDING, SAVED, DELETED
+
+FLASH_CARDS = {0: {"question": "Q0", "answer": "A0"}, 1: {"question": "Q1", "answer": "A1"},
+               2: {"question": "Q2", "answer": "A2", "duplicate": "old.apkg"}}
+
+
+def test_store_keeps_the_order_of_the_flashcards():
+    store = CardStore(FLASH_CARDS)
+
+    assert len(store) == 3
+    assert [card.to_dict() for card in store] == [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(3)]
+    assert [card.duplicate for card in store] == [None, None, "old.apkg"]
+    assert store.pending == 3
+
+
+def test_counters_follow_status_changes():
+    store = CardStore(FLASH_CARDS)
+
+    store.set_status(0, SAVED)
+    store.set_status(1, DELETED)
+    store.set_status(1, SAVED)
+
+    assert store.counts == {PENDING: 1, SAVED: 2, DELETED: 0}
+    assert [card.status for card in store] == [SAVED, SAVED, PENDING]
+
+
+def test_range_actions_only_change_pending_cards():
+    store = CardStore()
+    for index in range(10):
+        store.add_card(f"Q{index}", f"A{index}")
+    store.set_status(2, DELETED)
+
+    assert store.set_status_range(0, 5, SAVED) == 4
+    assert store.set_status_range(-3, 100, DELETED) == 5
+
+    assert store[2].status == DELETED
+    assert store.counts == {PENDING: 0, SAVED: 4, DELETED: 6}
+
+
+def test_saved_cards_in_order_and_within_bounds():
+    store = CardStore(FLASH_CARDS)
+    store.set_status(2, SAVED)
+    store.set_status(0, SAVED)
+    store.update_text(0, "Edited", "Text")
+
+    assert store.saved() == [("Edited", "Text"), ("Q2", "A2")]
+    assert store.saved(1) == [("Q2", "A2")]
+    assert store.saved(0, 2) == [("Edited", "Text")]
+    assert store.saved(0, 100) == store.saved()
+
+
+def test_duplicate_flags_are_set_and_cleared():
+    store = CardStore(FLASH_CARDS)
+
+    store.set_duplicate(0, "deck.apkg")
+    store.set_duplicate(2, None)
+
+    assert store[0].duplicate == "deck.apkg"
+    assert store[2].duplicate is None
+    assert store.duplicates == {0: "deck.apkg"}
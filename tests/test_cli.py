@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+import cli
+from utils.package_utils import read_package_notes
+
+
+def _document(topic: str, paragraphs: int) -> str:
+    return "\n\n".join(f"{topic} fact number {index} is worth a card. It is explained in this paragraph."
+                       for index in range(paragraphs))
+
+
+@pytest.fixture
+def workspace(project_dir, monkeypatch):
+    with open(project_dir / "config.json", "w") as config:
+        json.dump({"BACKEND": "fake", "FAKE_LATENCY": 0}, config)
+
+    docs = project_dir / "docs"
+    docs.mkdir()
+    (docs / "alpha.txt").write_text(_document("Alpha", 4), encoding="utf-8")
+    (docs / "beta.md").write_text(_document("Beta", 3), encoding="utf-8")
+
+    requests = []
+    failing = set()
+    request = cli.cached_request
+
+    def counted_request(chunk, *args, **kwargs):
+        requests.append(chunk)
+        if any(text in chunk for text in failing):
+            raise RuntimeError("boom")
+        return request(chunk, *args, **kwargs)
+
+    monkeypatch.setattr(cli, "cached_request", counted_request)
+    return {"docs": str(docs), "output": str(project_dir / "out"), "requests": requests, "failing": failing}
+
+
+def _generate(workspace, *options) -> int:
+    return cli.main(["generate", workspace["docs"], "-o", workspace["output"], "--no-cache", "--regenerate",
+                     "--chunk-tokens", "20", *options])
+
+
+def test_generate_writes_one_package_per_document_and_resumes(workspace):
+    assert _generate(workspace) == 0
+    assert len(workspace["requests"]) == 7
+    assert sorted(name for name in os.listdir(workspace["output"]) if name.endswith(".apkg")) == [
+        "alpha.apkg", "beta.apkg"]
+    assert len(list(read_package_notes(os.path.join(workspace["output"], "alpha.apkg")))) == 8
+
+    # Nothing changed: both documents are skipped.
+    assert _generate(workspace) == 0
+    assert len(workspace["requests"]) == 7
+
+    # Only the changed document is converted again.
+    with open(os.path.join(workspace["docs"], "beta.md"), "a", encoding="utf-8") as source:
+        source.write("\n\nBeta has one more fact. It needs a card too.")
+    assert _generate(workspace) == 0
+    assert len(workspace["requests"]) == 11
+
+
+def test_a_failed_chunk_removes_the_streamed_files_of_its_document(workspace):
+    workspace["failing"].add("Alpha fact number 2")
+
+    assert _generate(workspace, "--format", "tsv") == 1
+    assert sorted(os.listdir(workspace["output"])) == [".batch_state.json", "beta.tsv"]
+
+    workspace["failing"].clear()
+    del workspace["requests"][:]
+    assert _generate(workspace, "--format", "tsv") == 0
+    assert len(workspace["requests"]) == 4
+    with open(os.path.join(workspace["output"], "alpha.tsv"), encoding="utf-8") as tsv:
+        answers = [line.split("\t")[1] for line in tsv if not line.startswith("#")]
+    assert len(answers) == 8
+    assert [answer.split()[3] for answer in answers[::2]] == ["0", "1", "2", "3"]
+
+
+def test_merge_writes_the_cards_of_every_document_into_one_deck(workspace):
+    assert _generate(workspace, "--merge", "Everything") == 0
+
+    packages = sorted(name for name in os.listdir(workspace["output"]) if name.endswith(".apkg"))
+    assert packages == ["Everything.apkg"]
+    notes = list(read_package_notes(os.path.join(workspace["output"], "Everything.apkg")))
+    assert len(notes) == 14
+    assert notes[0][1].startswith("Alpha") and notes[-2][1].startswith("Beta")
@@ -0,0 +1,76 @@
+import pytest
+
+from utils.coverage_utils import CoverageIndex, PendingCoverage, chunk_hash
+
+CHUNK = ("Photosynthesis converts light energy into chemical energy. It takes place in the chloroplasts of plant "
+         "cells, where chlorophyll absorbs light. Water is split to release oxygen, and carbon dioxide is fixed "
+         "into sugars by the Calvin cycle in the stroma.")
+REWRITTEN = ("The French Revolution began in 1789. The storming of the Bastille marked its start, and the monarchy "
+             "was abolished three years later before the rise of Napoleon.")
+CARDS = [("Where does photosynthesis take place?", "In the chloroplasts"),
+         ("What does the Calvin cycle fix?", "Carbon dioxide")]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return CoverageIndex(str(tmp_path / "coverage.sqlite"))
+
+
+def test_chunk_hash_ignores_whitespace_but_not_the_backend():
+    assert chunk_hash(CHUNK, "openai") == chunk_hash(CHUNK.replace(" ", "\n  "), "openai")
+    assert chunk_hash(CHUNK, "openai") != chunk_hash(CHUNK, "fake")
+
+
+def test_unchanged_and_lightly_edited_chunks_are_covered(index):
+    index.record(CHUNK, "biology.txt", "openai", CARDS)
+    edited = CHUNK.replace("plant cells", "green plant cells")
+
+    covered = index.find_many([CHUNK, edited, REWRITTEN], "openai")
+
+    assert sorted(covered) == [0, 1]
+    assert covered[0].similarity == 1.0
+    assert index.threshold <= covered[1].similarity < 1.0
+    assert covered[1].document == "biology.txt"
+    assert covered[1].cards == CARDS
+
+
+def test_chunks_of_another_backend_do_not_count(index):
+    index.record(CHUNK, "biology.txt", "fake", CARDS)
+
+    assert index.find_many([CHUNK], "openai") == {}
+    assert list(index.find_many([CHUNK], "fake")) == [0]
+
+
+def test_chunks_without_cards_are_not_recorded(index):
+    assert not index.record(CHUNK, "biology.txt", "openai", [])
+    assert index.find_many([CHUNK], "openai") == {}
+
+
+def test_recorded_chunks_are_found_by_an_index_already_in_memory(index, tmp_path):
+    assert index.find_many([CHUNK], "openai") == {}
+    index.record(CHUNK, "biology.txt", "openai", CARDS)
+
+    assert list(index.find_many([CHUNK.replace("plant cells", "green plant cells")], "openai")) == [0]
+    assert list(CoverageIndex(str(tmp_path / "coverage.sqlite")).find_many([CHUNK], "openai")) == [0]
+
+
+def test_pending_coverage_is_recorded_only_when_delivered(index):
+    pending = PendingCoverage(index, "biology.txt", "openai")
+    pending.add(CHUNK, CARDS)
+
+    assert pending.find_many([CHUNK]) == {}
+    assert pending.record() == 1
+    assert pending.find_many([CHUNK])[0].cards == CARDS
+
+
+def test_pending_coverage_keeps_only_the_delivered_cards(index):
+    pending = PendingCoverage(index, "biology.txt", "openai")
+    pending.add(CHUNK, CARDS)
+    pending.add(REWRITTEN, [("When did the French Revolution begin?", "1789")])
+
+    # The first card was edited on its back side, the second one and the other chunk were discarded.
+    assert pending.record([("Where does photosynthesis take place?", "Chloroplasts")]) == 1
+
+    covered = index.find_many([CHUNK, REWRITTEN], "openai")
+    assert list(covered) == [0]
+    assert covered[0].cards == CARDS[:1]
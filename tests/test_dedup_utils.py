@@ -0,0 +1,75 @@
+import pytest
+
+from utils.dedup_utils import (NUM_BINS, BANDS, DuplicateIndex, band_keys, minhash_signature, normalize_text,
+                               similarity)
+
+QUESTION = "What are the main stages of cellular respiration in eukaryotic cells?"
+ANSWER = ("Glycolysis in the cytoplasm, the citric acid cycle in the mitochondrial matrix, and oxidative "
+          "phosphorylation on the inner mitochondrial membrane, which produces most of the ATP of the cell.")
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DuplicateIndex(str(tmp_path / "dedup.sqlite"))
+
+
+def test_normalize_text_ignores_case_tags_and_punctuation():
+    assert normalize_text("<b>Hello</b>,   World!") == "hello world"
+
+
+def test_signature_is_deterministic_and_dense():
+    signature = minhash_signature(normalize_text(ANSWER))
+
+    assert len(signature) == NUM_BINS
+    assert signature == minhash_signature(normalize_text(ANSWER))
+    assert 0xFFFFFFFF not in signature
+    assert minhash_signature("") is None
+    # A single word has one shingle, so every bin is filled by densification.
+    assert 0xFFFFFFFF not in minhash_signature("word")
+
+
+def test_similarity_tracks_shared_shingles():
+    original = minhash_signature(normalize_text(ANSWER))
+    edited = minhash_signature(normalize_text(ANSWER.replace("most", "nearly all")))
+    unrelated = minhash_signature(normalize_text("The French Revolution began in 1789 with the storming of the "
+                                                 "Bastille and ended with the rise of Napoleon Bonaparte."))
+
+    assert similarity(original, original) == 1.0
+    assert similarity(original, edited) > 0.7
+    assert similarity(original, unrelated) < 0.2
+
+
+def test_band_keys_of_equal_rows_in_different_bands_differ():
+    keys = band_keys(minhash_signature("word"))
+
+    assert len(keys) == BANDS
+    assert [key >> 32 for key in keys] == list(range(BANDS))
+
+
+def test_exact_duplicate_ignores_formatting(index):
+    index.add(QUESTION, ANSWER, "biology.apkg")
+
+    duplicate = index.find_duplicate(f"<i>{QUESTION.upper()}</i>", ANSWER + "!")
+
+    assert duplicate == {"question": QUESTION, "answer": ANSWER, "source": "biology.apkg", "similarity": 1.0}
+
+
+def test_near_duplicate_is_found_and_unrelated_card_is_not(index):
+    index.add_many([(QUESTION, ANSWER), ("Who wrote Hamlet?", "William Shakespeare")], "biology.apkg")
+
+    duplicate = index.find_duplicate(QUESTION, ANSWER.replace("most", "nearly all"))
+
+    assert duplicate["question"] == QUESTION
+    assert index.threshold <= duplicate["similarity"] < 1.0
+    assert index.find_duplicate("What is the boiling point of water?", "100 degrees Celsius at sea level") is None
+
+
+def test_remove_source_forgets_its_cards(index):
+    index.add(QUESTION, ANSWER, "old.apkg")
+    index.add("Who wrote Hamlet?", "William Shakespeare", "other.apkg")
+
+    index.remove_source("old.apkg")
+
+    assert len(index) == 1
+    assert index.find_duplicate(QUESTION, ANSWER) is None
+    assert index.find_duplicate("Who wrote Hamlet?", "William Shakespeare")["source"] == "other.apkg"
@@ -0,0 +1,192 @@
+import os
+
+import pytest
+
+from benchmarks.anki_stub import AnkiConnectStub
+from utils import anki_connection_utils
+from utils.anki_connection_utils import AnkiConnectClient, AnkiConnectError
+from utils.dedup_utils import get_duplicate_index
+from utils.export_utils import export_deck, package_deck, send_deck
+from utils.package_utils import create_model
+from utils.search_utils import get_search_index
+from utils.task_utils import CANCELLED, DONE, FAILED, TaskRunner
+
+CARDS = [(f"Question {index}", f"Answer {index}") for index in range(3)]
+
+
+class _Coverage:
+    """Stands in for PendingCoverage, optionally calling a function when the cards are recorded."""
+
+    def __init__(self, on_record=None):
+        self.recorded = []
+        self.on_record = on_record
+
+    def record(self, cards):
+        self.recorded.append(list(cards))
+        if self.on_record is not None:
+            self.on_record()
+
+
+@pytest.fixture
+def stub(project_dir, monkeypatch):
+    stub = AnkiConnectStub()
+    monkeypatch.setattr(anki_connection_utils, "_default_client", AnkiConnectClient(stub.url, retries=0))
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    return str(output_dir)
+
+
+@pytest.fixture
+def runner():
+    runner = TaskRunner()
+    yield runner
+    runner.shutdown()
+
+
+def _run(runner, fn, *args, cancel_first=False):
+    """Run fn on the runner, wait for it and deliver its events; return the task and its result."""
+
+    def run(task, *run_args):
+        if cancel_first:
+            task.cancel()
+        return fn(task, *run_args)
+
+    results = []
+    task = runner.submit(run, *args, on_done=lambda _, result: results.append(result))
+    task.future.result()
+    runner.process_events()
+    return task, results[0] if results else None
+
+
+def _recorded(cards) -> bool:
+    """True if the cards are in the search index and in the duplicate index."""
+
+    return (get_search_index().counts()[0] == len(cards)
+            and all(get_duplicate_index().find_duplicate(*card) for card in cards))
+
+
+def test_package_deck_records_and_imports_the_package(stub, runner, output_dir):
+    coverage = _Coverage()
+
+    task, package_path = _run(runner, package_deck, CARDS, "Deck", output_dir, create_model(), True, coverage)
+
+    assert task.state == DONE
+    assert package_path == os.path.join(output_dir, "Deck.apkg")
+    assert _recorded(CARDS)
+    assert coverage.recorded == [CARDS]
+    assert stub.requests == 1
+
+
+def test_package_deck_cancelled_while_packaging_leaves_nothing_behind(stub, runner, output_dir):
+    coverage = _Coverage()
+
+    task, _ = _run(runner, package_deck, CARDS, "Deck", output_dir, create_model(), True, coverage,
+                   cancel_first=True)
+
+    assert task.state == CANCELLED
+    assert not [name for name in os.listdir(output_dir) if name.endswith(".apkg")]
+    assert get_search_index().counts() == (0, 0)
+    assert coverage.recorded == []
+    assert stub.requests == 0
+
+
+def test_package_deck_cancelled_before_the_import_keeps_the_written_package(stub, runner, output_dir):
+    tasks = []
+    coverage = _Coverage(on_record=lambda: tasks[0].cancel())
+    tasks.append(runner.submit(package_deck, CARDS, "Deck", output_dir, create_model(), True, coverage))
+    tasks[0].future.result()
+    runner.process_events()
+
+    assert tasks[0].state == CANCELLED
+    assert os.path.exists(os.path.join(output_dir, "Deck.apkg"))
+    assert _recorded(CARDS)
+    assert stub.requests == 0
+
+
+def test_package_deck_reports_a_failed_import_of_the_saved_package(project_dir, runner, output_dir, monkeypatch):
+    closed = AnkiConnectStub()
+    closed.stop()
+    monkeypatch.setattr(anki_connection_utils, "_default_client", AnkiConnectClient(closed.url, retries=0))
+
+    task, _ = _run(runner, package_deck, CARDS, "Deck", output_dir, create_model())
+
+    assert task.state == FAILED
+    assert isinstance(task.error, AnkiConnectError)
+    assert str(task.error).startswith(f"Saved {os.path.join(output_dir, 'Deck.apkg')}")
+    assert _recorded(CARDS)
+
+
+def test_send_deck_records_the_cards_once_anki_added_them(stub, runner):
+    coverage = _Coverage()
+
+    task, added = _run(runner, send_deck, CARDS + [("", "No question")], "Deck", create_model(), coverage)
+
+    assert task.state == DONE
+    assert added == 3
+    assert stub.notes == 3
+    assert get_duplicate_index().find_duplicate(*CARDS[0])
+    assert coverage.recorded == [CARDS + [("", "No question")]]
+
+
+def test_send_deck_cancelled_while_sending_records_nothing(stub, runner):
+    coverage = _Coverage()
+    tasks = []
+    handle = stub.handle
+
+    def cancelling_handle(action, params):
+        if action == "addNotes":
+            tasks[0].cancel()
+        return handle(action, params)
+
+    stub.handle = cancelling_handle
+    tasks.append(runner.submit(send_deck, CARDS, "Deck", create_model(), coverage))
+    tasks[0].future.result()
+    runner.process_events()
+
+    assert tasks[0].state == CANCELLED
+    assert get_search_index().counts() == (0, 0)
+    assert get_duplicate_index().find_duplicate(*CARDS[0]) is None
+    assert coverage.recorded == []
+
+
+def test_send_deck_to_an_unreachable_anki_records_nothing(project_dir, runner, monkeypatch):
+    closed = AnkiConnectStub()
+    closed.stop()
+    monkeypatch.setattr(anki_connection_utils, "_default_client", AnkiConnectClient(closed.url, retries=0))
+    coverage = _Coverage()
+
+    task, _ = _run(runner, send_deck, CARDS, "Deck", create_model(), coverage)
+
+    assert task.state == FAILED
+    assert get_search_index().counts() == (0, 0)
+    assert coverage.recorded == []
+
+
+def test_export_deck_records_the_exported_shards(project_dir, runner, output_dir):
+    coverage = _Coverage()
+
+    task, paths = _run(runner, export_deck, CARDS, "Deck", "apkg", output_dir, create_model(), 2, coverage)
+
+    assert task.state == DONE
+    assert [os.path.basename(path) for path in paths] == ["Deck.shard1.apkg", "Deck.shard2.apkg"]
+    assert _recorded(CARDS)
+    assert coverage.recorded == [CARDS]
+
+
+def test_export_deck_cancelled_while_writing_removes_its_files(project_dir, runner, output_dir):
+    cards = [(f"Question {index}", f"Answer {index}") for index in range(600)]
+    coverage = _Coverage()
+
+    task, _ = _run(runner, export_deck, cards, "Deck", "tsv", output_dir, create_model(), 2, coverage,
+                   cancel_first=True)
+
+    assert task.state == CANCELLED
+    assert os.listdir(output_dir) == []
+    assert get_search_index().counts() == (0, 0)
+    assert coverage.recorded == []
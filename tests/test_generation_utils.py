@@ -0,0 +1,105 @@
+import time
+
+from utils.cache_utils import ResponseCache
+from utils.generation_utils import estimate_tokens, split_into_chunks, generate_flashcards_streaming, cached_request
+from utils.llm_utils import LLMBackend, FakeBackend, HTTPBackend
+from utils.metrics_utils import estimate_cost
+
+
+def _words(text: str) -> list:
+    return text.split()
+
+
+def test_short_text_is_one_chunk():
+    assert split_into_chunks("First paragraph.\n\nSecond paragraph.", 100) == ["First paragraph.\n\nSecond paragraph."]
+
+
+def test_blank_text_has_no_chunks():
+    assert split_into_chunks("  \n\n \n") == []
+
+
+def test_paragraphs_are_packed_within_the_budget():
+    paragraphs = [f"Paragraph {index} " + "word " * 20 for index in range(30)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = split_into_chunks(text, 100)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    # No paragraph is split when each one fits, and the source order is kept.
+    assert "\n\n".join(chunks) == "\n\n".join(paragraph.strip() for paragraph in paragraphs)
+
+
+def test_oversized_paragraph_is_split_on_sentences():
+    sentences = [f"Sentence number {index} is here." for index in range(40)]
+    paragraph = " ".join(sentences)
+
+    chunks = split_into_chunks(paragraph, 50)
+
+    assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert _words(" ".join(chunks)) == _words(paragraph)
+
+
+def test_oversized_sentence_is_split_on_words():
+    sentence = " ".join(f"word{index}" for index in range(500))
+
+    chunks = split_into_chunks(sentence, 20)
+
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert _words(" ".join(chunks)) == _words(sentence)
+
+
+class _ReversedBackend(LLMBackend):
+    """Answers later chunks first, one card per chunk."""
+
+    name = "test"
+
+    def stream(self, messages, model):
+        part = int(messages[-1]["content"].split()[1])
+        time.sleep((10 - part) * 0.01)
+        yield f"Front: Part {part}?\n"
+        yield f"Back: Answer {part}\n"
+
+
+def test_streamed_cards_arrive_in_source_order():
+    text = "\n\n".join(f"Part {part} " + "filler " * 10 for part in range(10))
+    received = []
+
+    cards = generate_flashcards_streaming(text, received.append, max_tokens=20, max_workers=10,
+                                          backend=_ReversedBackend())
+
+    assert [card["question"] for card in received] == [f"Part {part}?" for part in range(10)]
+    assert [cards[index] for index in range(len(cards))] == received
+
+
+class _CountingBackend(FakeBackend):
+    def __init__(self, name: str):
+        super().__init__(latency=0, token_latency=0, error_rate=0)
+        self.name = name
+        self.requests = 0
+
+    def complete(self, messages, model):
+        self.requests += 1
+        return f"Front: Q\nBack: answered by {self.name}"
+
+
+def test_cached_responses_are_not_shared_between_backends(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    fake, openai = _CountingBackend("fake"), _CountingBackend("openai")
+
+    assert cached_request("chunk", "model", "prompt", cache, backend=fake) == "Front: Q\nBack: answered by fake"
+    assert cached_request("chunk", "model", "prompt", cache, backend=openai) == "Front: Q\nBack: answered by openai"
+    assert cached_request("chunk", "model", "prompt", cache, backend=fake) == "Front: Q\nBack: answered by fake"
+    assert (fake.requests, openai.requests) == (1, 1)
+
+
+def test_http_backends_are_told_apart_by_their_address():
+    assert HTTPBackend("http://localhost:8000/v1").identity != HTTPBackend("http://localhost:9000/v1").identity
+
+
+def test_only_openai_requests_are_priced():
+    assert estimate_cost("gpt-3.5-turbo", 1000, 1000, "openai") > 0
+    assert estimate_cost("gpt-3.5-turbo", 1000, 1000, "fake") == 0.0
+    assert estimate_cost("gpt-3.5-turbo", 1000, 1000, "http") is None
+    assert estimate_cost("unknown-model", 1000, 1000, "openai") is None
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+from utils.bulk_package_utils import field_checksum
+from utils.library_utils import DeckLibrary
+from utils.package_utils import read_package_notes, write_package
+
+CARDS = [(f"Question {index}", f"Answer {index}") for index in range(120)]
+CARDS.append(("100% sure_thing?", "Literal wildcards"))
+
+
+@pytest.fixture
+def library(tmp_path):
+    package_dir = tmp_path / "packages"
+    write_package(CARDS, "Biology", str(package_dir))
+    write_package([("Who wrote Hamlet?", "Shakespeare")], "Literature", str(package_dir))
+    return DeckLibrary(str(package_dir), str(tmp_path / "cache"))
+
+
+def test_packages_are_listed_with_their_decks_and_counts(library):
+    packages = library.packages()
+
+    assert [(info.title, info.notes) for info in packages] == [("Biology", len(CARDS)), ("Literature", 1)]
+    assert [info.title for info in library.packages("LITER")] == ["Literature"]
+
+
+def test_catalog_follows_new_changed_and_removed_files(library):
+    library.packages()
+    write_package(CARDS[:3], "Biology", library.package_dir)
+    os.remove(os.path.join(library.package_dir, "Literature.apkg"))
+    with open(os.path.join(library.package_dir, "broken.apkg"), "wb") as file:
+        file.write(b"not a zip file")
+
+    assert [(info.title, info.notes) for info in library.packages()] == [("Biology", 3)]
+
+
+def test_notes_are_read_page_by_page(library):
+    package = library.open(os.path.join(library.package_dir, "Biology.apkg"))
+    try:
+        pages = [package.notes(offset, 50) for offset in range(0, 150, 50)]
+    finally:
+        package.close()
+
+    assert [len(page) for page in pages] == [50, 50, len(CARDS) - 100]
+    assert [(note.question, note.answer) for page in pages for note in page] == CARDS
+
+
+def test_search_matches_text_and_escapes_wildcards(library):
+    package = library.open(os.path.join(library.package_dir, "Biology.apkg"))
+    try:
+        assert package.count("question 11") == 11
+        assert [note.question for note in package.notes(2, 3, "question 11")] == [
+            "Question 111", "Question 112", "Question 113"]
+        assert package.count("0% s") == 1
+        assert package.count("n_A") == 0
+        assert [note.question for note in package.notes(search="sure_")] == ["100% sure_thing?"]
+    finally:
+        package.close()
+
+
+def _note_rows(path, tmp_path):
+    with zipfile.ZipFile(path) as package:
+        package.extract("collection.anki2", tmp_path / "extracted")
+    conn = sqlite3.connect(str(tmp_path / "extracted" / "collection.anki2"))
+    try:
+        return {row[0]: row[1:] for row in conn.execute("SELECT id, guid, sfld, csum FROM notes")}
+    finally:
+        conn.close()
+
+
+def test_update_notes_rewrites_fields_and_checksum(library, tmp_path):
+    path = os.path.join(library.package_dir, "Biology.apkg")
+    package = library.open(path)
+    try:
+        first, second = package.notes(0, 2)
+        before = _note_rows(path, tmp_path)
+
+        assert package.update_notes({first.note_id: ("New Q", "New A"), 12345: ("Missing", "Note")}) == 1
+        assert [(note.question, note.answer) for note in package.notes(0, 2)] == [("New Q", "New A"),
+                                                                                ("Question 1", "Answer 1")]
+    finally:
+        package.close()
+
+    after = _note_rows(path, tmp_path)
+    assert after[first.note_id] == (before[first.note_id][0], "New Q", field_checksum("New Q"))
+    assert after[second.note_id] == before[second.note_id]
+    assert list(read_package_notes(path))[0] == ("New Q", "New A")
+    assert [info.notes for info in library.packages("biology")] == [len(CARDS)]
@@ -0,0 +1,66 @@
+import os
+
+from utils.package_utils import (DeckManifest, append_package, deck_id_for, deck_part_paths, manifest_path,
+                                 note_guid, read_package_guids, read_package_notes, write_package)
+
+CARDS = [(f"Question {index}", f"Answer {index}") for index in range(5)]
+
+
+def test_stable_ids():
+    assert deck_id_for("Biology") == deck_id_for("Biology")
+    assert deck_id_for("Biology") != deck_id_for("Chemistry")
+    assert note_guid("Q", "A") == note_guid("Q", "A") != note_guid("Q", "B")
+
+
+def test_append_writes_the_package_then_parts_with_new_notes_only(project_dir, tmp_path):
+    package_dir = str(tmp_path / "packages")
+
+    first = append_package(CARDS[:3], "Deck", package_dir)
+    second = append_package(CARDS, "Deck", package_dir)
+    third = append_package(CARDS[4:] + CARDS[:2], "Deck", package_dir)
+    fourth = append_package([("New", "Card")] + CARDS, "Deck", package_dir)
+
+    assert first == os.path.join(package_dir, "Deck.apkg")
+    assert second == os.path.join(package_dir, "Deck.part1.apkg")
+    assert third is None
+    assert fourth == os.path.join(package_dir, "Deck.part2.apkg")
+    assert deck_part_paths(package_dir, "Deck") == [second, fourth]
+    assert list(read_package_notes(second)) == CARDS[3:]
+    assert list(read_package_notes(fourth)) == [("New", "Card")]
+    assert sorted(os.listdir(package_dir)) == ["Deck.apkg", "Deck.part1.apkg", "Deck.part2.apkg"]
+
+
+def test_write_package_replaces_the_parts(project_dir, tmp_path):
+    package_dir = str(tmp_path / "packages")
+    append_package(CARDS[:2], "Deck", package_dir)
+    append_package(CARDS, "Deck", package_dir)
+
+    write_package(CARDS[:1], "Deck", package_dir)
+
+    assert sorted(os.listdir(package_dir)) == ["Deck.apkg"]
+    assert append_package(CARDS[:2], "Deck", package_dir) == os.path.join(package_dir, "Deck.part1.apkg")
+
+
+def test_manifest_lives_in_the_cache_and_follows_packages_changed_elsewhere(tmp_path):
+    package_dir = str(tmp_path / "packages")
+    cache_dir = str(tmp_path / "cache")
+    package_path = write_package(CARDS[:2], "Deck", package_dir)
+
+    manifest = DeckManifest(package_dir, cache_dir)
+    try:
+        manifest.sync("Deck")
+        guids = [note_guid(*card) for card in CARDS]
+        assert manifest.known_guids("Deck", guids) == set(guids[:2])
+        assert manifest.known_guids("Other", guids) == set()
+
+        # Rewritten by something else than append_package.
+        os.remove(package_path)
+        write_package(CARDS[2:], "Deck", package_dir)
+        manifest.sync("Deck")
+        assert manifest.known_guids("Deck", guids) == set(guids[2:])
+        assert set(read_package_guids(package_path)) == set(guids[2:])
+    finally:
+        manifest.close()
+
+    assert os.path.exists(manifest_path(package_dir, cache_dir))
+    assert os.listdir(package_dir) == ["Deck.apkg"]
@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+from utils.card_utils import CardStore
+from utils.llm_utils import FakeBackend
+from utils.queue_utils import REVIEW, JobQueue, JobStore
+from utils.task_utils import QUEUED, RUNNING, CANCELLED
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_jobs_are_claimed_by_priority_then_age(store):
+    low = store.add("text", "low", priority=-1)
+    first = store.add("text", "first")
+    urgent = store.add("text", "urgent", priority=2)
+    second = store.add("text", "second")
+
+    claimed = [store.claim_next("queue").job_id for _ in range(4)]
+
+    assert claimed == [urgent, first, second, low]
+    assert store.claim_next("queue") is None
+
+
+def test_a_job_is_claimed_once_across_stores(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    first, second = JobStore(path), JobStore(path)
+    job_id = first.add("text", "job")
+
+    job = first.claim_next("first")
+
+    assert (job.job_id, job.state, job.owner) == (job_id, RUNNING, "first")
+    assert job.lease_until > time.time()
+    assert second.claim_next("second") is None
+
+
+def test_recover_leaves_leased_jobs_of_other_queues_alone(store):
+    job_id = store.add("text", "job")
+    store.claim_next("other")
+
+    assert store.recover("mine") == 0
+    assert store.get(job_id).state == RUNNING
+
+
+def test_recover_queues_jobs_with_an_expired_lease(store):
+    job_id = store.add("text", "job")
+    store.claim_next("crashed", lease_s=-1)
+
+    assert store.recover("mine") == 1
+    assert store.get(job_id).state == QUEUED
+
+
+def test_recover_queues_the_own_jobs_of_a_stopped_queue(store):
+    job_id = store.add("text", "job")
+    store.claim_next("mine")
+
+    assert store.recover("mine") == 1
+    assert store.get(job_id).state == QUEUED
+
+
+def test_renew_extends_only_the_leases_of_the_owner(store):
+    mine, other = store.add("text", "mine"), store.add("text", "other")
+    store.claim_next("mine", lease_s=-1)
+    store.claim_next("other", lease_s=-1)
+
+    assert store.renew("mine") == 1
+
+    assert store.recover("") == 1
+    assert store.get(mine).state == RUNNING
+    assert store.get(other).state == QUEUED
+
+
+def test_chunk_responses_survive_recovery(store):
+    job_id = store.add("text", "job")
+    store.claim_next("crashed", lease_s=-1)
+    store.save_chunk(job_id, 0, "Front: Q\nBack: A")
+    store.recover()
+
+    assert store.get(job_id).chunks_done == 1
+    assert store.chunk_responses(job_id) == {0: "Front: Q\nBack: A"}
+
+
+def test_cancel_and_retry(store):
+    job_id = store.add("text", "job")
+
+    assert store.cancel(job_id)
+    assert store.get(job_id).state == CANCELLED
+    assert store.claim_next("queue") is None
+    assert store.retry(job_id)
+    assert store.claim_next("queue").job_id == job_id
+    assert not store.retry(job_id)
+
+
+class _CancellingBackend(FakeBackend):
+    """Cancels the job while its last chunk is being generated."""
+
+    def __init__(self, store: JobStore, job_id: int, chunks: int):
+        super().__init__(latency=0, token_latency=0, error_rate=0)
+        self.store = store
+        self.job_id = job_id
+        self.remaining = chunks
+
+    def complete(self, messages, model):
+        self.remaining -= 1
+        if not self.remaining:
+            self.store.cancel(self.job_id)
+        return super().complete(messages, model)
+
+
+def _run_queue(store: JobStore, backend) -> None:
+    queue = JobQueue(store, workers=1, backend=backend)
+    queue.start(exit_when_idle=True)
+    queue.join(10)
+
+
+def test_a_job_cancelled_during_its_last_chunk_stays_cancelled(project_dir, store):
+    text = "First paragraph. It has two sentences.\n\nSecond paragraph. It has two sentences."
+    job_id = store.add(text, "job", chunk_tokens=10)
+
+    _run_queue(store, _CancellingBackend(store, job_id, 2))
+
+    job = store.get(job_id)
+    assert (job.state, job.cards) == (CANCELLED, 0)
+    assert len(store.cards(job_id)) == 0
+
+
+def test_a_job_taken_over_by_another_queue_is_not_finished(store):
+    job_id = store.add("text", "job")
+    store.claim_next("crashed", lease_s=-1)
+    store.recover("other")
+    store.claim_next("other")
+
+    assert not store.finish(job_id, CardStore({0: {"question": "Q", "answer": "A"}}), "crashed")
+    assert not store.fail(job_id, "error", "crashed")
+    assert store.get(job_id).state == RUNNING
+    assert store.finish(job_id, CardStore({0: {"question": "Q", "answer": "A"}}), "other")
+    assert (store.get(job_id).state, len(store.cards(job_id))) == (REVIEW, 1)
+
+
+def test_a_queue_generates_and_finishes_a_job(project_dir, store):
+    job_id = store.add("First sentence here. Second sentence here.", "job")
+
+    _run_queue(store, FakeBackend(latency=0, token_latency=0, error_rate=0))
+
+    job = store.get(job_id)
+    assert job.state == REVIEW
+    assert job.cards == len(store.cards(job_id)) == 2
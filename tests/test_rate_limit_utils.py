@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from utils.llm_utils import LLMBackend, LLMRateLimitError, parse_duration, parse_rate_limits
+from utils.rate_limit_utils import RateLimiter, RateLimitedBackend
+
+
+def test_durations_of_rate_limit_headers():
+    assert parse_duration("20") == 20.0
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("250ms") == 0.25
+    assert parse_duration("1h2m") == 3720.0
+    assert parse_duration("soon") is None
+
+
+def test_rate_limit_headers_are_parsed():
+    limits = parse_rate_limits({"x-ratelimit-limit-requests": "3500", "X-RateLimit-Remaining-Tokens": "89000",
+                                "x-ratelimit-reset-requests": "17ms", "Retry-After": "2", "Content-Type": "json"})
+
+    assert limits == {"limit_requests": 3500.0, "remaining_tokens": 89000.0, "reset_requests": 0.017,
+                      "retry_after": 2.0}
+
+
+def test_requests_beyond_the_bucket_wait_for_a_refill():
+    limiter = RateLimiter(requests_per_minute=600)
+
+    for _ in range(600):
+        assert limiter.acquire(0) == 0.0
+        limiter.on_success()
+    waited = limiter.acquire(0)
+
+    assert 0.05 < waited < 0.5
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_concurrency_window_blocks_until_a_request_finishes():
+    limiter = RateLimiter(max_concurrency=1)
+    limiter.acquire(0)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(0), acquired.set()))
+    thread.start()
+
+    assert not acquired.wait(0.1)
+    limiter.on_success()
+    assert acquired.wait(1.0)
+    thread.join()
+
+
+def test_a_burst_of_rate_limit_errors_halves_the_window_once():
+    limiter = RateLimiter(max_concurrency=8)
+    for _ in range(3):
+        limiter.acquire(0)
+    for _ in range(3):
+        limiter.on_rate_limited(retry_after=0.2)
+
+    stats = limiter.stats()
+    assert stats["concurrency"] == 4.0
+    assert stats["decreases"] == 1
+    assert stats["rate_limited"] == 3
+    assert 0 < stats["paused_s"] <= 0.2
+    # Every request waits out the pause.
+    assert limiter.acquire(0) > 0.1
+
+
+def test_successes_grow_the_window_up_to_the_maximum():
+    limiter = RateLimiter(max_concurrency=4)
+    limiter.concurrency = 2.0
+
+    for _ in range(50):
+        limiter.acquire(0)
+        limiter.on_success()
+
+    assert limiter.concurrency == 4
+
+
+def test_announced_limits_lower_the_configured_ones():
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=0)
+
+    limiter.observe({"limit_requests": 500, "limit_tokens": 20000, "remaining_tokens": 100})
+
+    stats = limiter.stats()
+    assert stats["requests_per_minute"] == 500
+    assert stats["tokens_per_minute"] == 20000
+    # Only the remaining tokens are available, so a larger request has to wait for a refill.
+    assert limiter._tokens.wait_time(1000) > 0
+
+
+class _RefusingBackend(LLMBackend):
+    name = "test"
+
+    def complete(self, messages, model):
+        raise LLMRateLimitError("slow down", retry_after=0.05)
+
+
+def test_rate_limited_backend_reports_refused_requests():
+    limiter = RateLimiter(max_concurrency=2)
+    backend = RateLimitedBackend(_RefusingBackend(), limiter)
+
+    with pytest.raises(LLMRateLimitError):
+        backend.complete([{"role": "user", "content": "text"}], "gpt-3.5-turbo")
+
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["rate_limited"], stats["concurrency"]) == (0, 1, 1.0)
+    assert backend.identity == "test"
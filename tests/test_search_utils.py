@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from utils.package_utils import write_package
+from utils.search_utils import CARDS, SOURCES, SearchIndex, match_query
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search_index.sqlite"))
+    yield index
+    index.close()
+
+
+def test_match_query_quotes_words_and_prefixes_the_last_one():
+    assert match_query("") == ""
+    assert match_query("supply demand") == '"supply" "demand"*'
+    assert match_query("supply of") == '"supply" "of"'
+    assert match_query('say "hi" OR') == '"say" """hi""" "OR"'
+
+
+def test_add_cards_updates_a_card_by_guid(index):
+    index.add_cards([("What is inflation?", "Rising prices.")], "Economics", "notes.txt", "gpt", "gui")
+    index.add_cards([("What is inflation?", "Rising prices.")], "Macro", origin="package")
+
+    hits = index.search("inflation")
+    assert index.counts() == (1, 0)
+    assert [(hit.title, hit.source, hit.model, hit.origin) for hit in hits] == [
+        ("Macro", "notes.txt", "gpt", "gui")]
+
+    index.add_cards([("What is inflation?", "Rising prices.")], "Macro", origin="queue")
+    assert index.search("inflation")[0].origin == "queue"
+
+
+def test_search_matches_prefixes_and_operators_literally(index):
+    index.add_cards([("What is inflation?", "Rising prices."), ("Who sets rates?", "The central bank AND others.")],
+                    "Economics")
+    index.add_source("notes.txt", "Inflation erodes savings.")
+
+    assert [hit.question for hit in index.search("infl")] == ["What is inflation?"]
+    assert index.search("in") == []
+    assert [hit.question for hit in index.search("bank AND")] == ["Who sets rates?"]
+    assert index.search('"AND" OR (') == []
+    assert [hit.title for hit in index.search("savings", SOURCES)] == ["notes.txt"]
+    assert "[inflation]" in index.search("inflation", CARDS)[0].snippet
+
+
+def test_invalid_raw_query_raises_value_error(index):
+    index.add_cards([("What is inflation?", "Rising prices.")], "Economics")
+
+    assert [hit.title for hit in index.search("question:inflation AND deck:economics", raw=True)] == ["Economics"]
+    with pytest.raises(ValueError):
+        index.search("inflation AND", raw=True)
+    with pytest.raises(ValueError):
+        index.search("nosuchcolumn:inflation", raw=True)
+
+
+def test_index_package_dir_skips_unchanged_packages(index, tmp_path):
+    package_dir = str(tmp_path / "packages")
+    package_path = write_package([("Q1", "A1"), ("Q2", "A2")], "Deck", package_dir)
+    write_package([("Q3", "A3")], "Deck.part1", package_dir)
+
+    assert index.index_package_dir(package_dir) == 3
+    assert index.index_package_dir(package_dir) == 0
+    assert {hit.title for hit in index.search("Q3")} == {"Deck"}
+
+    stat = os.stat(package_path)
+    os.utime(package_path, (stat.st_atime, stat.st_mtime + 10))
+    assert index.index_package_dir(package_dir) == 2
+    assert index.counts() == (3, 0)
+    assert index.index_package_dir(str(tmp_path / "missing")) == 0
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+from utils.settings_utils import CHUNK_MAX_TOKENS, HTTP_TIMEOUT, MAX_RETRIES, MAX_WORKERS, MB, Settings
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"MODEL": "gpt-4", "MAX_WORKERS": 8}), encoding="utf-8")
+    return str(path)
+
+
+def _rewrite(path: str, data: dict, mtime_ns: int) -> None:
+    with open(path, "w", encoding="utf-8") as config:
+        json.dump(data, config)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_file_is_read_again_only_when_it_changes(config_path):
+    settings = Settings(config_path)
+    changes = []
+    settings.subscribe(changes.append)
+    assert settings.max_workers == 8
+    mtime_ns = os.stat(config_path).st_mtime_ns
+    version = settings.version
+
+    # Same size and modification time: the cached values are kept.
+    _rewrite(config_path, {"MODEL": "gpt-5", "MAX_WORKERS": 9}, mtime_ns)
+    assert settings.max_workers == 8
+    assert settings.version == version
+    assert changes == []
+
+    _rewrite(config_path, {"MODEL": "gpt-5", "MAX_WORKERS": 9}, mtime_ns + 1_000_000_000)
+    assert settings.max_workers == 9
+    assert settings.version == version + 1
+    assert changes == [settings]
+
+
+def test_update_replaces_the_file_and_keeps_other_settings(config_path, tmp_path):
+    settings = Settings(config_path)
+    changes = []
+    settings.subscribe(changes.append)
+
+    settings.update({"MAX_WORKERS": 2, "CUSTOM": "kept"})
+
+    with open(config_path, encoding="utf-8") as config:
+        assert json.load(config) == {"MODEL": "gpt-4", "MAX_WORKERS": 2, "CUSTOM": "kept"}
+    assert Settings(config_path).max_workers == 2
+    assert changes == [settings]
+    assert os.listdir(tmp_path) == ["config.json"]
+
+    with pytest.raises(TypeError):
+        settings.update({"MAX_WORKERS": object()})
+    with open(config_path, encoding="utf-8") as config:
+        assert json.load(config)["MAX_WORKERS"] == 2
+    assert os.listdir(tmp_path) == ["config.json"]
+    assert settings.max_workers == 2
+
+
+def test_values_are_converted_to_the_schema_type(tmp_path):
+    settings = Settings(str(tmp_path / "config.json"))
+    assert settings.max_workers == MAX_WORKERS
+    assert settings.api_key == ""
+
+    settings.update({"MAX_WORKERS": "6", "CHUNK_TOKENS": "many", "MAX_RETRIES": -1, "REQUEST_TIMEOUT": "",
+                     "CACHE_MAX_MB": "1.5", "CUSTOM": [1, 2]})
+
+    assert settings.max_workers == 6
+    assert settings.chunk_tokens == CHUNK_MAX_TOKENS
+    assert settings.max_retries == MAX_RETRIES
+    assert settings.request_timeout == HTTP_TIMEOUT
+    assert settings.cache_max_bytes == int(1.5 * MB)
+    assert settings.get("CUSTOM") == [1, 2]
+
+
+def test_unreadable_file_keeps_the_previous_settings(config_path):
+    settings = Settings(config_path)
+    assert settings.model == "gpt-4"
+
+    with open(config_path, "w", encoding="utf-8") as config:
+        config.write("{not json")
+    os.utime(config_path, ns=(0, 0))
+
+    assert settings.model == "gpt-4"
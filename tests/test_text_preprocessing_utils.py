@@ -0,0 +1,87 @@
+from utils.text_preprocessing_utils import CardStreamParser, ParseReport, iter_cards, preprocess_response
+
+TEXT_RESPONSE = "Front: What is the capital of France?\nBack: Paris\n\nFront: 2 + 2?\nBack: 4\n"
+JSON_RESPONSE = '[{"front": "What is the capital of France?", "back": "Paris"}, {"front": "2 + 2?", "back": "4"}]'
+CARDS = [{"question": "What is the capital of France?", "answer": "Paris"}, {"question": "2 + 2?", "answer": "4"}]
+
+
+def _feed_in_pieces(text: str, size: int) -> list:
+    parser = CardStreamParser()
+    cards = []
+    for start in range(0, len(text), size):
+        cards.extend(parser.feed(text[start:start + size]))
+    return cards + parser.close()
+
+
+def test_text_response_fed_in_pieces_matches_the_whole_response():
+    for size in (1, 3, 7, len(TEXT_RESPONSE)):
+        assert _feed_in_pieces(TEXT_RESPONSE, size) == CARDS
+    assert list(iter_cards(TEXT_RESPONSE)) == CARDS
+
+
+def test_json_response_fed_in_pieces_matches_the_whole_response():
+    for size in (1, 3, 7, len(JSON_RESPONSE)):
+        assert _feed_in_pieces(JSON_RESPONSE, size) == CARDS
+    assert list(iter_cards(JSON_RESPONSE)) == CARDS
+
+
+def test_a_card_is_emitted_as_soon_as_it_is_complete():
+    parser = CardStreamParser()
+
+    assert parser.feed("Front: Q1\nBack: A1\n") == []
+    assert parser.feed("\n") == [{"question": "Q1", "answer": "A1"}]
+    assert parser.feed("Front: Q2\nBack: A2") == []
+    assert parser.close() == [{"question": "Q2", "answer": "A2"}]
+
+
+def test_json_array_items_are_emitted_when_they_close():
+    parser = CardStreamParser()
+
+    assert parser.feed('[{"front": "Q1", "back": "A1"}, {"front": "Q2", ') == [{"question": "Q1", "answer": "A1"}]
+    assert parser.feed('"back": "A2"}]') == [{"question": "Q2", "answer": "A2"}]
+    assert parser.close() == []
+
+
+def test_numbered_bold_and_bulleted_labels_are_recognized():
+    response = ("### Card 1\n1. **Question:** What is H2O?\n**Answer:** Water\n---\n"
+                "- Q: What is NaCl?\n- A: Salt\n")
+
+    assert list(iter_cards(response)) == [{"question": "What is H2O?", "answer": "Water"},
+                                          {"question": "What is NaCl?", "answer": "Salt"}]
+
+
+def test_fields_continue_on_the_following_lines():
+    response = "Front: Name the\nprimary colors\nBack: Red\nGreen\nBlue\n"
+
+    assert list(iter_cards(response)) == [{"question": "Name the\nprimary colors", "answer": "Red\nGreen\nBlue"}]
+
+
+def test_broken_text_cards_are_skipped_and_reported():
+    report = ParseReport()
+    response = "Intro line\nBack: orphan\nFront: no back\n\nFront: Q\nBack: A\n"
+
+    assert list(iter_cards(response, report)) == [{"question": "Q", "answer": "A"}]
+    assert report.cards == 1
+    assert report.skipped_lines == 1
+    assert len(report.issues) == 2
+    assert not report.ok
+
+
+def test_fenced_json_object_with_a_card_list():
+    response = '```json\n{"cards": [{"Question": "Q", "Answer": ["A1", "A2"]}, ["Q2", "A2"]]}\n```'
+
+    assert list(iter_cards(response)) == [{"question": "Q", "answer": "A1\nA2"}, {"question": "Q2", "answer": "A2"}]
+
+
+def test_malformed_json_items_only_lose_themselves():
+    report = ParseReport()
+    response = '[{"front": "Q1", "back": "A1"}, {"front": "Q2" "back": "A2"}, {"front": "Q3"}, {"front": "Q4", "ba'
+
+    assert list(iter_cards(response, report)) == [{"question": "Q1", "answer": "A1"}]
+    assert report.mode == "json"
+    assert len(report.issues) == 3
+
+
+def test_preprocess_response_numbers_the_cards():
+    assert preprocess_response(TEXT_RESPONSE) == dict(enumerate(CARDS))
+    assert preprocess_response("Unable to generate flashcards") == {}
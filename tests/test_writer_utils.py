@@ -0,0 +1,63 @@
+import csv
+import json
+
+import pytest
+
+from utils.package_utils import note_guid, read_package_notes
+from utils.writer_utils import create_writer
+
+CARDS = [("What is H2O?", "Water"), ("Tab\tand\nnewline?", 'A "quoted" answer')]
+
+
+def test_tsv_export_with_anki_headers(tmp_path):
+    with create_writer("tsv", str(tmp_path), "Chemistry") as writer:
+        writer.write_many(CARDS)
+
+    assert writer.paths == [str(tmp_path / "Chemistry.tsv")]
+    with open(writer.paths[0], encoding="utf-8", newline="") as file:
+        lines = file.read().split("\n", 6)
+    assert lines[:6] == ["#separator:tab", "#html:true", "#notetype:Basic", "#deck:Chemistry",
+                         "#columns:Question\tAnswer\tGUID", "#guid column:3"]
+    rows = list(csv.reader(lines[6].splitlines(keepends=True), delimiter="\t"))
+    assert rows == [[question, answer, note_guid(question, answer)] for question, answer in CARDS]
+
+
+def test_jsonl_export(tmp_path):
+    writer = create_writer("jsonl", str(tmp_path), "Chemistry")
+    for card in CARDS:
+        writer.write(*card)
+    writer.close()
+
+    with open(writer.paths[0], encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert records == [{"deck": "Chemistry", "guid": note_guid(question, answer), "question": question,
+                        "answer": answer} for question, answer in CARDS]
+
+
+def test_files_appear_only_when_closed_and_aborted_writers_leave_nothing(tmp_path):
+    writer = create_writer("tsv", str(tmp_path), "Deck")
+    writer.write(*CARDS[0])
+    assert not (tmp_path / "Deck.tsv").exists()
+
+    writer.abort()
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(ValueError):
+        writer.write(*CARDS[0])
+
+
+def test_apkg_shards_and_stale_shards(tmp_path):
+    cards = [(f"Question {index}", f"Answer {index}") for index in range(5)]
+    with create_writer("apkg", str(tmp_path), "Deck", shard_size=1) as writer:
+        writer.write_many(cards)
+    assert len(writer.paths) == 5
+
+    with create_writer("apkg", str(tmp_path), "Deck", shard_size=2) as writer:
+        writer.write_many(cards)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f"Deck.shard{number}.apkg" for number in (1, 2, 3)]
+    assert [note for path in writer.paths for note in read_package_notes(path)] == cards
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        create_writer("csv", str(tmp_path), "Deck")
@@ -1,18 +1,31 @@
 import os
-import threading
-import random
-import json
+import time
+import datetime
+from concurrent.futures import CancelledError
 
 import tkinter as tk
+from tkinter import filedialog
 import customtkinter as ctk
 
-import openai
-from genanki import Model, Note, Deck, Package
-
-from utils.text_preprocessing_utils import preprocess_response, create_textbox_text
-from utils.anki_connection_utils import save_package_to_app
-from utils.api_utils import load_api_data
+from utils.text_preprocessing_utils import create_textbox_text, parse_textbox_text, ParseReport
+from utils.card_utils import CardStore, PENDING, SAVED, DELETED
+from utils.dedup_utils import get_duplicate_index
+from utils.coverage_utils import PendingCoverage, get_coverage_index
+from utils.settings_utils import get_settings
+from utils.llm_utils import BACKENDS, get_backend
+from utils.cache_utils import get_response_cache
+from utils.generation_utils import (generate_flashcards_streaming, describe_error, SYSTEM_PROMPT, UNABLE_MSG,
+                                    COVERED_MSG)
+from utils.metrics_utils import RunMetrics, get_metrics_store, format_totals
 from utils.file_utils import get_package_dir, get_icon
+from utils.export_utils import package_deck, send_deck, export_deck, EXPORT_WORKERS
+from utils.package_utils import create_model, generate_random_id
+from utils.writer_utils import EXPORT_FORMATS, SHARD_NOTES
+from utils.rate_limit_utils import get_rate_limiter, format_limiter
+from utils.library_utils import get_deck_library
+from utils.search_utils import get_search_index, CARDS, SOURCES
+from utils.queue_utils import get_job_store, get_job_queue, PRIORITIES, REVIEW
+from utils.task_utils import TaskRunner, POLL_INTERVAL_MS, QUEUED, RUNNING, DONE, FAILED, CANCELLED
 
 
 class CustomCTkTextbox(ctk.CTkTextbox):
@@ -24,19 +37,25 @@ class CustomCTkTextbox(ctk.CTkTextbox):
         super().__init__(master, **kwargs)
         self.custom_state = "normal"
 
+        self.normal_font = self.cget("font")
+        self.italic_font = ctk.CTkFont(family="Helvetica", size=12, slant="italic")
+
     def set_state(self, state):
         """Set the custom state of the text box."""
 
-        self.custom_state = state
+        if state == self.custom_state:
+            return
 
-        italic_font = ctk.CTkFont(family="Helvetica", size=12, slant="italic")
+        self.custom_state = state
 
         if state == "disabled":
             self.configure(text_color="gray",
-                           font=italic_font,
+                           font=self.italic_font,
                            state=state)
         else:
-            self.configure(text_color="black")
+            self.configure(text_color="black",
+                           font=self.normal_font,
+                           state=state)
 
     def get_state(self):
         """Get the current custom state of the text box."""
@@ -45,10 +64,15 @@ class CustomCTkTextbox(ctk.CTkTextbox):
 
 
 class PopUpWindow(ctk.CTkToplevel):
-    """Pop-up window to show successful save messages."""
+    """Pop-up window to show save results."""
 
-    def __init__(self, *args, **kwargs):
-        """Initialize the pop-up window."""
+    def __init__(self, *args, message="Successfully saved!", text_color="green", **kwargs):
+        """
+        Initialize the pop-up window.
+
+        :param message: Text shown in the window.
+        :param text_color: Color of the text.
+        """
 
         super().__init__(*args, **kwargs)
 
@@ -56,7 +80,7 @@ class PopUpWindow(ctk.CTkToplevel):
         y = int(self.winfo_screenheight() // 2)
 
         self.geometry(f"200x150+{x}+{y}")
-        self.process_state_label = ctk.CTkLabel(self, text="Successfully saved!", text_color="green")
+        self.process_state_label = ctk.CTkLabel(self, text=message, text_color=text_color, wraplength=180)
         self.process_state_label.pack(padx=10, pady=10)
 
         self.save_btn = ctk.CTkButton(self,
@@ -68,93 +92,350 @@ class PopUpWindow(ctk.CTkToplevel):
         self.save_btn.pack(padx=10, pady=10)
 
 
+class CardRow(ctk.CTkFrame):
+    """Reusable row widget showing one card of a VirtualCardList."""
+
+    def __init__(self, master, card_list, **kwargs):
+        """
+        Initialize the row widgets.
+
+        :param master: Parent widget of the row.
+        :param card_list: VirtualCardList owning the row.
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.card_list = card_list
+        self.index = None
+        self.status = None
+
+        self.number_label = ctk.CTkLabel(self, text="", width=30, text_color="gray")
+        self.number_label.pack(side=tk.LEFT)
+
+        self.tbox = CustomCTkTextbox(self, width=600, height=150,
+                                     border_spacing=8, wrap="word")
+        self.tbox.pack(padx=10, pady=5, side=tk.LEFT, expand=True, fill=tk.X)
+
+        self.delete_btn = ctk.CTkButton(self,
+                                        text="",
+                                        image=get_icon("delete.png"),
+                                        width=8,
+                                        command=lambda: self.card_list.process_card(self.index, method="delete"))
+
+        self.save_btn = ctk.CTkButton(self,
+                                      text="",
+                                      image=get_icon("save.png"),
+                                      width=8,
+                                      command=lambda: self.card_list.process_card(self.index, method="save"))
+
+        self.process_label = ctk.CTkLabel(self, text="")
+
+    def show_card(self, index, card):
+        """Display the given card, skipping the redraw if the row already shows it."""
+
+        if self.index == index and self.status == card.status:
+            return
+
+        self.store_edits()
+        self.index = index
+        self.status = card.status
+        if card.duplicate:
+            self.number_label.configure(text=f"{index + 1}\ndup", text_color="orange")
+        else:
+            self.number_label.configure(text=str(index + 1), text_color="gray")
+
+        self.tbox.set_state("normal")
+        self.tbox.delete("1.0", tk.END)
+        self.tbox.insert("1.0", create_textbox_text(card.question, card.answer))
+
+        if card.status == PENDING:
+            self.process_label.pack_forget()
+            self.delete_btn.pack(padx=10, pady=10, side=tk.RIGHT)
+            self.save_btn.pack(padx=10, pady=10, side=tk.RIGHT)
+        else:
+            self.tbox.set_state("disabled")
+            self.delete_btn.pack_forget()
+            self.save_btn.pack_forget()
+            self.set_label_image(self.process_label, card.status == SAVED)
+            self.process_label.pack(padx=10, pady=10, side=tk.RIGHT)
+
+    def store_edits(self):
+        """Write the text edited in a pending row back to the card store."""
+
+        if self.index is None or self.status != PENDING:
+            return
+
+        question, answer = parse_textbox_text(self.tbox.get("1.0", tk.END))
+        self.card_list.cards.update_text(self.index, question, answer)
+
+    def clear(self):
+        """Detach the row from its card before it is hidden."""
+
+        self.store_edits()
+        self.index = None
+        self.status = None
+
+    def set_label_image(self, label, success):
+        """Set the appropriate image for the label depending on the success status."""
+
+        label.configure(image=get_icon("success.png" if success else "fail.png"))
+
+
+class VirtualCardList(ctk.CTkFrame):
+    """Scrollable card list that only creates row widgets for the visible part of the list."""
+
+    ROW_HEIGHT = 170
+    BUFFER_ROWS = 2
+    SCROLL_STEP = 60
+
+    def __init__(self, master, cards, on_process, **kwargs):
+        """
+        Initialize the list.
+
+        :param master: Parent widget of the list.
+        :param cards: CardStore holding the cards to display.
+        :param on_process: Callback called with the card index and method ("save" or "delete").
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.cards = cards
+        self.on_process = on_process
+        self.offset = 0
+        self.rows = []
+
+        self.viewport = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.viewport.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.viewport.bind("<Configure>", lambda event: self.refresh())
+        self.bind_mouse_wheel(self.viewport)
+
+    def bind_mouse_wheel(self, widget):
+        """Scroll the list when the mouse wheel is used over the given widget."""
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self.on_mouse_wheel)
+
+    def viewport_height(self):
+        """Get the height of the visible area in unscaled pixels."""
+
+        return self._reverse_widget_scaling(self.viewport.winfo_height())
+
+    def scroll_to(self, offset):
+        """Scroll so that the given pixel offset of the list is at the top of the viewport."""
+
+        max_offset = max(0, len(self.cards) * self.ROW_HEIGHT - self.viewport_height())
+        self.offset = min(max(0, int(offset)), max_offset)
+        self.refresh()
+
+    def on_scrollbar(self, action, value, unit=None):
+        """Handle the commands sent by the scrollbar."""
+
+        if action == "moveto":
+            self.scroll_to(float(value) * len(self.cards) * self.ROW_HEIGHT)
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(value) * self.viewport_height())
+        else:
+            self.scroll_to(self.offset + int(value) * self.SCROLL_STEP)
+
+    def on_mouse_wheel(self, event):
+        """Handle mouse wheel events on Windows, macOS and X11."""
+
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.scroll_to(self.offset + direction * self.SCROLL_STEP)
+        return "break"
+
+    def process_card(self, index, method="save"):
+        """Store the row edits and forward the click to the owner of the list."""
+
+        for row in self.rows:
+            if row.index == index:
+                row.store_edits()
+        self.on_process(index, method)
+        self.refresh()
+
+    def refresh(self):
+        """Bind the pooled rows to the cards in view and move them into place."""
+
+        height = self.viewport_height()
+        needed = min(len(self.cards), int(height // self.ROW_HEIGHT) + 1 + self.BUFFER_ROWS)
+
+        while len(self.rows) < needed:
+            row = CardRow(self.viewport, self, height=self.ROW_HEIGHT, fg_color=self.cget("fg_color"))
+            row.pack_propagate(False)
+            self.bind_mouse_wheel(row)
+            self.bind_mouse_wheel(row.tbox)
+            self.rows.append(row)
+
+        first = self.offset // self.ROW_HEIGHT
+
+        for position, row in enumerate(self.rows):
+            index = first + position
+            if position < needed and index < len(self.cards):
+                row.show_card(index, self.cards[index])
+                row.place(x=0, y=index * self.ROW_HEIGHT - self.offset, relwidth=1)
+            elif row.index is not None:
+                row.clear()
+                row.place_forget()
+
+        total = len(self.cards) * self.ROW_HEIGHT
+        if total > height:
+            self.scrollbar.set(self.offset / total, (self.offset + height) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+
+class JobsWindow(ctk.CTkToplevel):
+    """Queued-job view listing the packaging and import jobs of every review window."""
+
+    REFRESH_MS = 200
+
+    def __init__(self, jobs, *args, **kwargs):
+        """
+        Initialize the jobs window.
+
+        :param jobs: Shared list of export tasks; rows are added for tasks appended to it later.
+        """
+
+        super().__init__(*args, **kwargs)
+        self.jobs = jobs
+        self.rows = []
+
+        self.title("Jobs")
+        self.geometry("560x360")
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.refresh()
+
+    def add_row(self, task):
+        """Add the row showing the given task."""
+
+        frame = ctk.CTkFrame(self.list_frame)
+        frame.pack(fill=tk.X, pady=4)
+
+        name_label = ctk.CTkLabel(frame, text=task.name, width=160, anchor="w")
+        name_label.grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+
+        state_label = ctk.CTkLabel(frame, text="", width=160, anchor="w", text_color="gray", wraplength=160)
+        state_label.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+
+        progress_bar = ctk.CTkProgressBar(frame, width=100)
+        progress_bar.grid(row=0, column=2, padx=5, pady=5)
+
+        cancel_btn = ctk.CTkButton(frame, text="Cancel", width=60, command=task.cancel)
+        cancel_btn.grid(row=0, column=3, padx=5, pady=5)
+
+        self.rows.append((task, state_label, progress_bar, cancel_btn))
+
+    def refresh(self):
+        """Show the current state of every job and schedule the next refresh."""
+
+        for task in self.jobs[len(self.rows):]:
+            self.add_row(task)
+
+        for task, state_label, progress_bar, cancel_btn in self.rows:
+            if task.state == FAILED:
+                text = f"failed: {task.error}"
+            elif task.finished or not task.stage:
+                text = task.state
+            elif task.total:
+                text = f"{task.stage} {task.done}/{task.total}"
+            else:
+                text = f"{task.stage}..."
+
+            state_label.configure(text=text)
+            progress_bar.set(1 if task.state == DONE else task.done / task.total if task.total else 0)
+            if task.finished:
+                cancel_btn.configure(state="disabled")
+
+        self.after(self.REFRESH_MS, self.refresh)
+
+
 class ToplevelWindow(ctk.CTkToplevel):
     """Top-level window to display and manage flashcards."""
 
     PACKAGE_DIR = get_package_dir()
 
-    SAVE_ICON = get_icon("save.png")
-    DELETE_ICON = get_icon("delete.png")
-    SUCCESS_ICON = get_icon("success.png")
-    FAIL_ICON = get_icon("fail.png")
+    # Packaging and import jobs outlive the review window that started them.
+    export_runner = TaskRunner(EXPORT_WORKERS)
+    export_jobs = []
+    jobs_window = None
+    _export_poll_id = None
 
-    def __init__(self, flash_cards, *args, **kwargs):
-        """Initialize the top-level window."""
+    def __init__(self, flash_cards, *args, complete=True, drop_duplicates=False, job_id=None, source="",
+                 coverage=None, **kwargs):
+        """
+        Initialize the top-level window.
+
+        :param flash_cards: Flashcards to display.
+        :param complete: False while more cards are still being streamed in through add_card.
+        :param drop_duplicates: Mark cards flagged as duplicates as deleted instead of asking for review.
+        :param job_id: Id of a queued document whose stored cards are reviewed; decisions are saved to the queue.
+        :param source: Name of the document the cards were generated from, stored with them in the search index.
+        :param coverage: PendingCoverage of the generated chunks, recorded once the deck is saved, sent or exported.
+        """
 
         super().__init__(*args, **kwargs)
-        self.MODEL_ID = self.generate_random_id()
-
-        self.model = Model(
-            self.MODEL_ID,
-            'Flash card model',
-            fields=[
-                {'name': 'Question'},
-                {'name': 'Answer'},
-            ],
-            templates=[
-                {
-                    'name': 'Card',
-                    'qfmt': '{{Question}}',
-                    'afmt': '{{FrontSide}}<hr id="answer">{{Answer}}',
-                },
-            ])
-
-        self.notes = []
-        self.DECK_ID = self.generate_random_id()
-        self.deck = Deck(self.DECK_ID, '')
-
-        self.flash_cards = flash_cards
+        self.model = create_model()
 
-        self.geometry("800x640")
+        self.job_id = job_id
+        job = get_job_store().get(job_id) if job_id is not None else None
+        self.source = job.title if job is not None else source
+        self.generation_model = job.model if job is not None else get_settings().model
+        self.cards = get_job_store().cards(job_id) if job_id is not None else CardStore()
+        self.coverage = get_job_store().coverage(job_id, get_coverage_index()) if job_id is not None else coverage
+        self.complete = complete
+        self.drop_duplicates = drop_duplicates
 
-        self.ctframes = []
-
-        self.scrollable_frame = ctk.CTkScrollableFrame(self, fg_color=self.cget("fg_color"))
-        self.scrollable_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.geometry("800x640")
 
-        self.deck_title = ctk.CTkEntry(self.scrollable_frame, width=300,
+        self.deck_title = ctk.CTkEntry(self, width=300,
                                        placeholder_text="Entry deck title...",
                                        placeholder_text_color="grey")
 
         self.deck_title.pack(padx=10, pady=10)
 
-        for card_id in range(len(flash_cards)):
-            row_frame = ctk.CTkFrame(self.scrollable_frame, fg_color=self.scrollable_frame.cget("fg_color"))
-            row_frame.pack(padx=10, pady=5)
+        self.button_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.button_frame.pack(padx=10, pady=10, side=tk.BOTTOM)
 
-            tbox = CustomCTkTextbox(row_frame, width=600, height=150,
-                                    border_spacing=8, wrap="word")
+        self.bulk_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.bulk_frame.pack(padx=10, side=tk.BOTTOM)
 
-            tbox.pack(side=tk.LEFT, expand=True, fill=tk.X)
-            tbox.insert(0.0, create_textbox_text(
-                flash_cards[card_id]["question"],
-                flash_cards[card_id]["answer"]
-            ))
+        self.card_list = VirtualCardList(self, self.cards, self.process_card, fg_color=self.cget("fg_color"))
+        self.card_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-            delete_btn = ctk.CTkButton(row_frame,
-                                       text="",
-                                       image=self.DELETE_ICON,
-                                       width=8,
-                                       command=lambda i=card_id: self.process_card(flash_cards[i],
-                                                                                   self.ctframes[i],
-                                                                                   method="delete"))
+        self.save_remaining_btn = ctk.CTkButton(self.bulk_frame,
+                                                text="Save all remaining",
+                                                width=130,
+                                                command=lambda: self.process_range(0, len(self.cards), "save"))
+        self.save_remaining_btn.grid(row=0, column=0, padx=5, pady=5)
 
-            delete_btn.pack(padx=10, pady=10, side=tk.RIGHT)
+        self.delete_remaining_btn = ctk.CTkButton(self.bulk_frame,
+                                                  text="Delete all remaining",
+                                                  width=130,
+                                                  command=lambda: self.process_range(0, len(self.cards), "delete"))
+        self.delete_remaining_btn.grid(row=0, column=1, padx=5, pady=5)
 
-            save_btn = ctk.CTkButton(row_frame,
-                                     text="",
-                                     image=self.SAVE_ICON,
-                                     width=8,
-                                     command=lambda i=card_id: self.process_card(flash_cards[i],
-                                                                                 self.ctframes[i],
-                                                                                 method="save"))
+        self.range_start = ctk.CTkEntry(self.bulk_frame, width=60, placeholder_text="From")
+        self.range_start.grid(row=0, column=2, padx=5, pady=5)
 
-            save_btn.pack(padx=10, pady=10, side=tk.RIGHT)
+        self.range_stop = ctk.CTkEntry(self.bulk_frame, width=60, placeholder_text="To")
+        self.range_stop.grid(row=0, column=3, padx=5, pady=5)
 
-            self.ctframes.append(row_frame)
+        self.save_range_btn = ctk.CTkButton(self.bulk_frame,
+                                            text="Save range",
+                                            width=100,
+                                            command=self.save_selected_range)
+        self.save_range_btn.grid(row=0, column=4, padx=5, pady=5)
 
-        self.button_frame = ctk.CTkFrame(self.scrollable_frame, fg_color=self.cget("fg_color"))
-        self.button_frame.pack(padx=10, pady=10)
+        self.counts_label = ctk.CTkLabel(self.bulk_frame, text="", text_color="gray")
+        self.counts_label.grid(row=1, column=0, columnspan=5)
+        self.update_counts()
 
         self.save_to_anki_btn = ctk.CTkButton(self.button_frame,
                                               text="Save to Anki",
@@ -163,98 +444,306 @@ class ToplevelWindow(ctk.CTkToplevel):
 
         self.save_to_anki_btn.pack(padx=10, pady=10, side=tk.LEFT)
 
+        self.send_to_anki_btn = ctk.CTkButton(self.button_frame,
+                                              text="Send to Anki",
+                                              state="disabled",
+                                              command=lambda: self.send_to_anki(self.deck_title.get()))
+
+        self.send_to_anki_btn.pack(padx=10, pady=10, side=tk.LEFT)
+
+        self.combo_format = ctk.CTkComboBox(self.button_frame, width=90, values=list(EXPORT_FORMATS), state="readonly")
+        self.combo_format.set("tsv")
+        self.combo_format.pack(padx=(10, 0), pady=10, side=tk.LEFT)
+
+        self.export_btn = ctk.CTkButton(self.button_frame,
+                                        text="Export",
+                                        width=80,
+                                        state="disabled",
+                                        command=lambda: self.export_cards(self.deck_title.get()))
+
+        self.export_btn.pack(padx=10, pady=10, side=tk.LEFT)
+
+        self.jobs_btn = ctk.CTkButton(self.button_frame,
+                                      text="Jobs",
+                                      width=80,
+                                      command=self.open_jobs)
+
+        self.jobs_btn.pack(padx=10, pady=10, side=tk.LEFT)
+
         self.back_to_main = ctk.CTkButton(self.button_frame,
                                           text="Back",
                                           command=self.get_to_mainwindow)
 
         self.back_to_main.pack(padx=10, pady=10, side=tk.RIGHT)
 
-    def set_label_image(self, label, success):
-        """Set the appropriate image for the label depending on the success status."""
+        for card_id in range(len(flash_cards)):
+            self.add_card(flash_cards[card_id])
 
-        label.configure(image=self.SUCCESS_ICON if success else self.FAIL_ICON)
+        if job is not None:
+            self.deck_title.insert(0, job.title)
+            self.update_save_button()
+            self.protocol("WM_DELETE_WINDOW", self.get_to_mainwindow)
 
-    def disable_widgets(self, frame, method: str = "save"):
-        """Disable the widgets and remove buttons in the frame after processing."""
+    def add_card(self, flash_card):
+        """Append the given flashcard to the end of the list."""
 
-        for child in frame.winfo_children():
-            if isinstance(child, CustomCTkTextbox):
-                child.set_state("disabled")
+        status = DELETED if self.drop_duplicates and flash_card.get("duplicate") else PENDING
+        self.cards.add(flash_card, status)
+        self.card_list.refresh()
+        self.update_counts()
 
-            if isinstance(child, ctk.CTkButton):
-                child.destroy()
+    def mark_complete(self):
+        """Mark the card stream as finished and update the save button."""
 
-        process_label = ctk.CTkLabel(frame, text="")
-        self.set_label_image(process_label, method == "save")
-        process_label.pack(padx=10, pady=10, side=tk.RIGHT)
+        self.complete = True
+        self.update_save_button()
 
-    def process_card(self, flash_card, current_frame, method="save"):
+    def process_card(self, index, method="save"):
         """Process the flashcard based on the selected method (save or delete)."""
 
+        self.cards.set_status(index, SAVED if method == "save" else DELETED)
+        if self.job_id is not None:
+            get_job_store().save_card(self.job_id, index, self.cards[index])
+        if method == "save":
+            self.index_cards(self.cards.saved(index, index + 1))
+        self.update_counts()
+        self.update_save_button()
+
+    def process_range(self, start, stop, method="save"):
+        """Save or delete every pending card in the range and redraw the list once."""
+
+        # The visible rows may hold edits of cards in the range that are not in the store yet.
+        for row in self.card_list.rows:
+            row.store_edits()
+        self.cards.set_status_range(start, stop, SAVED if method == "save" else DELETED)
         if method == "save":
-            note = Note(
-                model=self.model,
-                fields=[flash_card["question"], flash_card["answer"]],
-            )
+            self.index_cards(self.cards.saved(start, stop))
+        self.card_list.refresh()
+        self.save_review()
+        self.update_counts()
+        self.update_save_button()
 
-            self.notes.append(note)
+    def index_cards(self, cards):
+        """Add saved pairs of question and answer to the search index; saving the deck later updates their deck."""
 
-        self.disable_widgets(current_frame, method)
+        get_search_index().add_cards(cards, self.deck_title.get(), self.source, self.generation_model,
+                                     "gui" if self.job_id is None else "queue")
 
-        all_disabled = True
+    def save_selected_range(self):
+        """Save the pending cards between the card numbers entered in the range fields."""
 
-        for child in self.scrollable_frame.winfo_children():
-            if isinstance(child, ctk.CTkFrame) and any(
-                    [frame_child.custom_state != "disabled" for frame_child in child.winfo_children() if
-                     isinstance(frame_child, CustomCTkTextbox)]):
-                all_disabled = False
+        try:
+            start = int(self.range_start.get())
+            stop = int(self.range_stop.get())
+        except ValueError:
+            return
+
+        self.process_range(start - 1, stop, method="save")
+
+    def save_review(self):
+        """Store the edits and decisions of a queued document's cards so they survive closing the window."""
+
+        if self.job_id is None:
+            return
+
+        for row in self.card_list.rows:
+            row.store_edits()
+        get_job_store().save_cards(self.job_id, enumerate(self.cards))
+
+    def update_counts(self):
+        """Show the number of pending, saved and deleted cards."""
 
-        if all_disabled:
+        counts = self.cards.counts
+        self.counts_label.configure(
+            text=f"Pending: {counts[PENDING]}   Saved: {counts[SAVED]}   Deleted: {counts[DELETED]}")
+
+    def update_save_button(self):
+        """Enable the save button once every card of a finished stream is processed."""
+
+        if self.complete and self.cards.pending == 0:
             self.save_to_anki_btn.configure(state="normal")
+            self.send_to_anki_btn.configure(state="normal")
+            self.export_btn.configure(state="normal")
 
     def save_to_anki(self, deck_title):
-        """Save the generated flashcards to an Anki deck."""
+        """Package the saved flashcards the deck does not contain yet and import them, in the background."""
+
+        if len(deck_title) <= 0:
+            deck_title = f"Package{generate_random_id()}"
+
+        cards = self.cards.saved()
+        self.save_to_anki_btn.configure(state="disabled")
 
-        for note in self.notes:
-            self.deck.add_note(note)
+        self.submit_export(package_deck, cards, deck_title, self.PACKAGE_DIR, self.model, True, self.coverage,
+                           name=f"Save {deck_title}",
+                           on_done=self.on_saved,
+                           on_error=lambda task, error: self.on_export_error(self.save_to_anki_btn, error))
+
+    def send_to_anki(self, deck_title):
+        """Add the saved flashcards straight into the running Anki application, in the background."""
 
         if len(deck_title) <= 0:
-            deck_title = f"Package{self.generate_random_id()}"
+            deck_title = f"Package{generate_random_id()}"
 
-        filename = f"{deck_title}.apkg"
-        self.deck.name = deck_title
-        Package(self.deck).write_to_file(os.path.join(self.PACKAGE_DIR, filename))
+        cards = self.cards.saved()
+        self.send_to_anki_btn.configure(state="disabled")
 
-        self.save_to_anki_btn.configure(state="disabled")
+        self.submit_export(send_deck, cards, deck_title, self.model, self.coverage,
+                           name=f"Send {deck_title}",
+                           on_done=self.on_sent,
+                           on_error=lambda task, error: self.on_export_error(self.send_to_anki_btn, error))
+
+    def export_cards(self, deck_title):
+        """Stream the saved flashcards into files of the selected format in a chosen directory, in the background."""
+
+        output_dir = filedialog.askdirectory(parent=self, initialdir=self.PACKAGE_DIR, title="Export to")
+        if not output_dir:
+            return
+
+        export_format = self.combo_format.get()
+        cards = self.cards.saved()
+        self.export_btn.configure(state="disabled")
+
+        self.submit_export(export_deck, cards, deck_title, export_format, output_dir, self.model, SHARD_NOTES,
+                           self.coverage,
+                           name=f"Export {deck_title or 'deck'} as {export_format}",
+                           on_done=self.on_exported,
+                           on_error=lambda task, error: self.on_export_error(self.export_btn, error))
+
+    def submit_export(self, fn, *args, name, on_done, on_error):
+        """Queue a packaging or import job and make sure its events are processed."""
+
+        task = self.export_runner.submit(fn, *args, name=name, on_done=on_done, on_error=on_error)
+        self.export_jobs.append(task)
+
+        if ToplevelWindow._export_poll_id is None:
+            ToplevelWindow.poll_exports(self._root())
+
+    @classmethod
+    def poll_exports(cls, root):
+        """Process the export job events on the main thread while any job is running."""
+
+        try:
+            cls.export_runner.process_events()
+        finally:
+            # Rescheduled even if a callback raised, so the remaining events are still processed.
+            if cls.export_runner.active:
+                cls._export_poll_id = root.after(POLL_INTERVAL_MS, cls.poll_exports, root)
+            else:
+                cls._export_poll_id = None
+
+    def open_jobs(self):
+        """Show the queued-job view, creating it if needed."""
+
+        if ToplevelWindow.jobs_window is None or not ToplevelWindow.jobs_window.winfo_exists():
+            ToplevelWindow.jobs_window = JobsWindow(self.export_jobs, self._root())
+
+        ToplevelWindow.jobs_window.focus_force()
+
+    def on_saved(self, task, package_path):
+        """Report a finished save job."""
+
+        if not self.winfo_exists():
+            return
+
+        if self.job_id is not None:
+            get_job_store().set_state(self.job_id, DONE)
+
+        if package_path is None:
+            popup = PopUpWindow(self, message="The deck already has these cards")
+        else:
+            popup = PopUpWindow(self)
+
+        popup.focus_force()
+
+    def on_sent(self, task, added):
+        """Report a finished send job."""
 
-        save_package_to_app(os.path.join(self.PACKAGE_DIR, filename))
+        if not self.winfo_exists():
+            return
 
-        popup = PopUpWindow(self)
+        if self.job_id is not None:
+            get_job_store().set_state(self.job_id, DONE)
+
+        popup = PopUpWindow(self, message=f"Successfully sent {added} notes!")
+        popup.focus_force()
+
+    def on_exported(self, task, paths):
+        """Report a finished file export."""
+
+        if not self.winfo_exists():
+            return
+
+        self.export_btn.configure(state="normal")
+        popup = PopUpWindow(self, message=f"Exported {len(paths)} file{'s' if len(paths) != 1 else ''}!")
         popup.focus_force()
 
+    def on_export_error(self, button, error):
+        """Report a failed export job and allow to retry it; cancelled jobs are not reported."""
+
+        if not self.winfo_exists():
+            return
+
+        button.configure(state="normal")
+
+        if not isinstance(error, CancelledError):
+            popup = PopUpWindow(self, message=str(error), text_color="red")
+            popup.focus_force()
+
     def get_to_mainwindow(self):
         """Return to the main window."""
 
+        self.save_review()
         self.master.focus()
         self.destroy()
 
-    @staticmethod
-    def generate_random_id():
-        """Generate a random ID for decks and models."""
 
-        return random.randint(10 ** 9, 10 ** 10 - 1)
+class MetricsPanel(ctk.CTkFrame):
+    """Summary of the tokens, cost and latency of the last generation and of today's generations."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the panel with today's totals."""
+
+        super().__init__(*args, **kwargs)
+
+        self.last_label = ctk.CTkLabel(self, text="No generation yet", justify="left", anchor="w", text_color="gray")
+        self.last_label.grid(row=0, column=0, padx=10, pady=5, sticky=tk.W)
+
+        self.today_label = ctk.CTkLabel(self, text="", justify="left", anchor="w", text_color="gray")
+        self.today_label.grid(row=1, column=0, padx=10, pady=5, sticky=tk.W)
+
+        self.export_btn = ctk.CTkButton(self, text="Export metrics", width=120, command=self.export)
+        self.export_btn.grid(row=0, column=1, rowspan=2, padx=10, pady=5)
+
+        self.update_today()
+
+    def show_run(self, run):
+        """Show the measurements of a finished generation."""
+
+        status = "" if run.error is None else f" ({run.error.splitlines()[0]})"
+        self.last_label.configure(text=f"Last generation{status}:\n{run.summary()}\n"
+                                       f"{format_limiter(get_rate_limiter().stats())}")
+        self.update_today()
+
+    def update_today(self):
+        """Show the totals of every generation started today."""
+
+        midnight = time.mktime(datetime.date.today().timetuple())
+        self.today_label.configure(text=f"Today:\n{format_totals(get_metrics_store().totals(midnight))}")
+
+    def export(self):
+        """Export every recorded request to a JSON Lines file chosen by the user."""
+
+        path = filedialog.asksaveasfilename(defaultextension=".jsonl", filetypes=[("JSON Lines", "*.jsonl")])
+        if path:
+            with open(path, "w", encoding="utf-8") as output:
+                get_metrics_store().export_jsonl(output)
 
 
 class Scene1(ctk.CTkFrame):
     """Flashcard creation scene for the Anki cards creator application."""
 
-    content_msg = "You are an AI-powered assistant that creates AnkiWeb flashcards from the text. " \
-                  "Your task is to identify the most significant and relevant information from the " \
-                  "text and generate flashcards with the following format:" \
-                  "Front: [question to test knowledge retention]" \
-                  "Back: [answer to the question]" \
-                  "\nImportant requirement: If text is not appropriate, you should reply with " \
-                  "'Unable to generate flashcards'. Only with this sentence and nothing else"
+    content_msg = SYSTEM_PROMPT
 
     def __init__(self, *args, **kwargs):
         """
@@ -290,6 +779,30 @@ class Scene1(ctk.CTkFrame):
         clear_textbox = ctk.CTkButton(self.main_frame, text="Clear", command=lambda: self.text.delete(1.0, tk.END))
         clear_textbox.grid(row=0, column=1, padx=10, pady=10)
 
+        # Response cache bypass
+        self.use_cache = ctk.BooleanVar(value=True)
+        use_cache_box = ctk.CTkCheckBox(self.main_frame, text="Use cached responses", variable=self.use_cache)
+        use_cache_box.grid(row=0, column=2, padx=10, pady=10)
+
+        # Drop cards that duplicate already saved ones
+        self.drop_duplicates = ctk.BooleanVar(value=False)
+        drop_duplicates_box = ctk.CTkCheckBox(self.main_frame, text="Drop duplicates", variable=self.drop_duplicates)
+        drop_duplicates_box.grid(row=1, column=2, padx=10, pady=10)
+
+        # Only generate the parts of the text that did not produce cards before
+        self.skip_covered = ctk.BooleanVar(value=True)
+        skip_covered_box = ctk.CTkCheckBox(self.main_frame, text="Skip carded text", variable=self.skip_covered)
+        skip_covered_box.grid(row=1, column=3, padx=10, pady=10)
+
+        # Cancel running generations
+        self.cancel_btn = ctk.CTkButton(self.main_frame, text="Cancel", state="disabled",
+                                        command=self.cancel_generation)
+        self.cancel_btn.grid(row=0, column=3, padx=10, pady=10)
+
+        # Generate in the background document queue instead
+        add_to_queue = ctk.CTkButton(self.main_frame, text="Add to queue", command=self.add_to_queue)
+        add_to_queue.grid(row=1, column=0, padx=10, pady=10, sticky=tk.NSEW)
+
         self.main_frame.grid(row=2, column=1, padx=10, pady=10, sticky="NS")
 
         # Progressbar
@@ -302,65 +815,188 @@ class Scene1(ctk.CTkFrame):
         self.progress_bar.set(0)
         self.progress_bar.grid(row=3, column=1, padx=10, pady=10, sticky="NS")
 
-        self.toplevel_window = None
+        # Tokens, cost and latency of the generations
+        self.metrics_panel = MetricsPanel(self)
+        self.metrics_panel.grid(row=4, column=1, padx=10, pady=10, sticky="NS")
+
+        self.task_runner = TaskRunner()
+        self.task_windows = {}
+        self.skipped_chunks = {}
+        self.task_coverage = {}
+        self._poll_id = None
 
         self.grid_columnconfigure(1, weight=1)
         self.rowconfigure(1, weight=1)
 
-    def open_toplevel(self, flash_cards):
+    def open_toplevel(self, flash_cards, complete=True, source="", coverage=None):
         """Open a new top-level window to display flashcards."""
 
-        if self.toplevel_window is None or not self.toplevel_window.winfo_exists():
-            self.toplevel_window = ToplevelWindow(flash_cards)
-            self.toplevel_window.focus()
+        toplevel_window = ToplevelWindow(flash_cards, complete=complete, drop_duplicates=self.drop_duplicates.get(),
+                                         source=source, coverage=coverage)
+        toplevel_window.focus()
+        return toplevel_window
+
+    def chat_completion(self, task, text_info, use_cache=True, skip_covered=True):
+        """Submit user input to the GPT model and post every generated flashcard as a task event."""
+
+        duplicate_index = get_duplicate_index()
+        duplicate_index.index_package_dir(ToplevelWindow.PACKAGE_DIR)
+
+        def post_card(card):
+            duplicate = duplicate_index.find_duplicate(card["question"], card["answer"])
+            if duplicate is not None:
+                card = dict(card, duplicate=duplicate["source"])
+            task.post("card", card)
+
+        settings = get_settings()
+        model = settings.model
+        report = ParseReport()
+        backend = get_backend()
+        run = RunMetrics("gui", model, settings.chunk_tokens, settings.max_workers, backend.name)
+        # The chunks are recorded in the coverage index by the review window, once their cards are delivered.
+        coverage = PendingCoverage(get_coverage_index(), task.name, backend.identity)
+        task.post("coverage", coverage)
+        skipped = []
+        try:
+            flash_cards = generate_flashcards_streaming(text_info,
+                                                        post_card,
+                                                        model=model,
+                                                        system_prompt=self.content_msg,
+                                                        max_tokens=settings.chunk_tokens,
+                                                        max_workers=settings.max_workers,
+                                                        max_retries=settings.max_retries,
+                                                        cache=get_response_cache() if use_cache else None,
+                                                        cancel_event=task.cancel_event,
+                                                        report=report,
+                                                        run=run,
+                                                        backend=backend,
+                                                        coverage=coverage,
+                                                        skip_covered=skip_covered,
+                                                        skipped=skipped)
+        except BaseException as error:
+            run.finish(describe_error(error))
+            raise
         else:
-            self.toplevel_window.focus()
+            run.finish()
+        finally:
+            if run.requests:
+                get_metrics_store().record(run)
+                task.post("metrics", run)
+
+        if not report.ok:
+            print(f"Recovered from malformed responses: {report.summary()}")
+            for issue in report.issues:
+                print(f"  {issue}")
+        if skipped:
+            print(f"Skipped {len(skipped)} parts of the text that already have cards")
+            task.post("skipped", len(skipped))
+        get_search_index().add_source(task.name, text_info)
+
+        return flash_cards
+
+    def start_chat_completion(self):
+        """Start the chat completion process in the background and update the progress bar."""
+
+        user_input = self.text.get("1.0", ctk.END)
+        # The name of the task names the text in the coverage and search indexes.
+        self.task_runner.submit(self.chat_completion, user_input, self.use_cache.get(), self.skip_covered.get(),
+                                name=user_input.strip()[:80],
+                                on_event=self.on_task_event,
+                                on_done=self.on_completion_done,
+                                on_error=self.on_completion_error)
+
+        self.progress_bar.start()
+        self.cancel_btn.configure(state="normal")
+        if self._poll_id is None:
+            self.poll_tasks()
 
-    def chat_completion(self, text_info):
-        """Submit user input to the GPT model and get the generated flashcards."""
+    def poll_tasks(self):
+        """Process the background task events and keep polling while any task is running."""
 
         try:
-            gpt_response = openai.ChatCompletion.create(
-                model=load_api_data().get("MODEL", "gpt-3.5-turbo"),
-                messages=[
-                    {"role": "system",
-                     "content": self.content_msg},
-                    {"role": "user",
-                     "content": text_info}
-                ]
-            )
-
-            flash_cards_text = gpt_response.get("choices")[0]["message"]["content"]
-            return flash_cards_text
-        except Exception as error:
+            self.task_runner.process_events()
+        finally:
+            # Rescheduled even if a callback raised, so the progress bar does not spin forever.
+            if self.task_runner.active:
+                self._poll_id = self.after(POLL_INTERVAL_MS, self.poll_tasks)
+            else:
+                self._poll_id = None
+                self.progress_bar.stop()
+            self.cancel_btn.configure(state="disabled")
+
+    def on_task_event(self, task, event, payload):
+        """Add a streamed flashcard to the window of its generation, or show the metrics of a finished one."""
+
+        if event == "metrics":
+            self.metrics_panel.show_run(payload)
+            return
+        if event == "skipped":
+            self.skipped_chunks[task] = payload
+            return
+        if event == "coverage":
+            self.task_coverage[task] = payload
+            return
+
+        window = self.task_windows.get(task)
+
+        if window is None:
+            window = self.task_windows[task] = self.open_toplevel({}, complete=False, source=task.name,
+                                                                  coverage=self.task_coverage.pop(task, None))
+        elif not window.winfo_exists():
+            task.cancel()
+            return
+
+        window.add_card(payload)
+
+    def on_completion_done(self, task, flash_cards_dict):
+        """Finish the window of a generation, or report that nothing could be generated."""
+
+        window = self.task_windows.pop(task, None)
+        skipped = self.skipped_chunks.pop(task, 0)
+        self.task_coverage.pop(task, None)
+
+        if window is not None and window.winfo_exists():
+            window.mark_complete()
+        elif not flash_cards_dict:
+            self.show_message(COVERED_MSG if skipped else UNABLE_MSG)
+
+    def on_completion_error(self, task, error):
+        """Finish the window of a failed or cancelled generation and report the error."""
+
+        window = self.task_windows.pop(task, None)
+        self.skipped_chunks.pop(task, None)
+        self.task_coverage.pop(task, None)
+
+        if window is not None and window.winfo_exists():
+            window.mark_complete()
+
+        if not isinstance(error, CancelledError):
             print(error)
-            return "Some error ackward!\nTry to add or change API key"
+            self.show_message(describe_error(error))
 
-    def start_chat_completion(self):
-        """Start the chat completion process and update the progress bar."""
+    def cancel_generation(self):
+        """Cancel every running generation."""
 
-        user_input = self.text.get("1.0", ctk.END)
-        self.progress_bar.start()
-        response_thread = threading.Thread(target=self.run_chat_completion, args=(user_input,))
-        response_thread.start()
+        self.task_runner.cancel_all()
 
-        while response_thread.is_alive():
-            self.progress_bar.update()
+    def show_message(self, message):
+        """Replace the content of the text box with the given message."""
 
-        self.progress_bar.stop()
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, message)
 
-    def run_chat_completion(self, user_input):
-        """Run the chat completion process and display the results."""
+    def add_to_queue(self):
+        """Queue the text as a document of the job queue; its cards are reviewed from the document queue scene."""
 
-        response = self.chat_completion(user_input)
-        self.progress_bar.stop()
+        text = self.text.get("1.0", ctk.END).strip()
+        if not text:
+            return
 
-        if response.startswith("Some error"):
-            self.text.delete("1.0", tk.END)
-            self.text.insert(tk.END, response)
-        else:
-            flash_cards_dict = preprocess_response(response)
-            self.open_toplevel(flash_cards_dict)
+        settings = get_settings()
+        job_id = get_job_store().add(text, f"Text {datetime.datetime.now():%Y-%m-%d %H:%M}",
+                                     model=settings.model, chunk_tokens=settings.chunk_tokens)
+        get_job_queue().wake()
+        self.show_message(f"Added to the document queue as job {job_id}")
 
     def start_creation(self):
         """Initiate the process of creating flashcards."""
@@ -371,6 +1007,603 @@ class Scene1(ctk.CTkFrame):
             print(f"An error occurred: {e}")
 
 
+class JobRow(ctk.CTkFrame):
+    """Reusable row widget showing one job of the document queue."""
+
+    def __init__(self, master, scene, **kwargs):
+        """
+        Initialize the row widgets.
+
+        :param master: Parent widget of the row.
+        :param scene: QueueScene owning the row.
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.scene = scene
+        self.job = None
+
+        self.title_label = ctk.CTkLabel(self, text="", width=200, anchor="w")
+        self.title_label.grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+
+        self.state_label = ctk.CTkLabel(self, text="", width=200, anchor="w", text_color="gray", wraplength=200)
+        self.state_label.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+
+        self.priority_label = ctk.CTkLabel(self, text="", width=30, text_color="gray")
+        self.priority_label.grid(row=0, column=2, padx=5, pady=5)
+
+        self.up_btn = ctk.CTkButton(self, text="\u25b2", width=28, command=lambda: self.scene.move(self.job, 1))
+        self.up_btn.grid(row=0, column=3, pady=5)
+
+        self.down_btn = ctk.CTkButton(self, text="\u25bc", width=28, command=lambda: self.scene.move(self.job, -1))
+        self.down_btn.grid(row=0, column=4, pady=5)
+
+        self.action_btn = ctk.CTkButton(self, text="", width=70, command=lambda: self.scene.job_action(self.job))
+        self.action_btn.grid(row=0, column=5, padx=5, pady=5)
+
+        self.remove_btn = ctk.CTkButton(self, text="", image=get_icon("delete.png", (18, 18)), width=8,
+                                        command=lambda: self.scene.remove(self.job))
+        self.remove_btn.grid(row=0, column=6, padx=5, pady=5)
+
+    def show_job(self, job):
+        """Display the given job."""
+
+        self.job = job
+        self.title_label.configure(text=job.title)
+        self.state_label.configure(text=job.describe(), text_color="red" if job.state == FAILED else "gray")
+        self.priority_label.configure(text=str(job.priority))
+
+        if job.state in (QUEUED, RUNNING):
+            self.action_btn.configure(text="Cancel", state="normal")
+        elif job.state in (REVIEW, DONE):
+            self.action_btn.configure(text="Review", state="normal" if job.cards else "disabled")
+        else:
+            self.action_btn.configure(text="Retry", state="normal")
+
+
+class QueueScene(ctk.CTkFrame):
+    """Document queue scene: documents are generated in the background by priority and reviewed one by one."""
+
+    REFRESH_MS = 1000
+    MAX_ROWS = 100
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the document queue scene.
+
+        :param master: Parent widget for the QueueScene class.
+        :param kw: Additional keyword arguments for the scene configuration.
+        """
+
+        super().__init__(*args, **kwargs)
+
+        self.store = get_job_store()
+        self.queue = get_job_queue()
+        self.rows = []
+        self.review_windows = {}
+
+        title = ctk.CTkLabel(self, text="Document queue", text_color="black")
+        title.grid(row=0, column=1, padx=10, pady=10, sticky="NS")
+
+        self.controls = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.controls.grid(row=1, column=1, padx=10, pady=5, sticky="NS")
+
+        add_documents = ctk.CTkButton(self.controls, text="Add documents", command=self.add_documents)
+        add_documents.grid(row=0, column=0, padx=10, pady=5)
+
+        self.combo_priority = ctk.CTkComboBox(self.controls, values=list(PRIORITIES), state="readonly", width=120)
+        self.combo_priority.grid(row=0, column=1, padx=10, pady=5)
+        self.combo_priority.set("Normal")
+
+        self.summary_label = ctk.CTkLabel(self.controls, text="", text_color="gray")
+        self.summary_label.grid(row=1, column=0, columnspan=2, padx=10)
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.grid(row=2, column=1, padx=10, pady=10, sticky=tk.NSEW)
+
+        self.grid_columnconfigure(1, weight=1)
+        self.rowconfigure(2, weight=1)
+
+        self.refresh(reschedule=False)
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def add_documents(self):
+        """Queue the text files chosen by the user with the selected priority."""
+
+        paths = filedialog.askopenfilenames(filetypes=[("Text documents", "*.txt *.md"), ("All files", "*")])
+        if not paths:
+            return
+
+        settings = get_settings()
+        priority = PRIORITIES[self.combo_priority.get()]
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as document:
+                    text = document.read()
+            except OSError as error:
+                print(f"Could not read {path}: {error}")
+                continue
+            title = os.path.splitext(os.path.basename(path))[0]
+            self.store.add(text, title, priority, source=path, model=settings.model,
+                           chunk_tokens=settings.chunk_tokens)
+
+        self.queue.wake()
+        self.refresh(reschedule=False)
+
+    def job_action(self, job):
+        """Cancel a waiting or running job, review a generated one, or queue a failed or cancelled one again."""
+
+        if job.state in (QUEUED, RUNNING):
+            self.store.cancel(job.job_id)
+        elif job.state in (REVIEW, DONE):
+            self.open_review(job)
+        elif self.store.retry(job.job_id):
+            self.queue.wake()
+        self.refresh(reschedule=False)
+
+    def open_review(self, job):
+        """Show the review window of a job, creating it if needed."""
+
+        window = self.review_windows.get(job.job_id)
+        if window is None or not window.winfo_exists():
+            window = self.review_windows[job.job_id] = ToplevelWindow({}, job_id=job.job_id)
+        window.focus()
+
+    def move(self, job, step):
+        """Raise or lower the priority of a job."""
+
+        self.store.set_priority(job.job_id, job.priority + step)
+        self.refresh(reschedule=False)
+
+    def remove(self, job):
+        """Delete a job with its generated cards."""
+
+        window = self.review_windows.pop(job.job_id, None)
+        if window is not None and window.winfo_exists():
+            window.destroy()
+        self.store.remove(job.job_id)
+        self.refresh(reschedule=False)
+
+    def refresh(self, reschedule=True):
+        """Show the current state of the queue; the list is only read while the scene is visible."""
+
+        if self.winfo_ismapped() or not reschedule:
+            jobs = self.store.jobs(self.MAX_ROWS)
+
+            while len(self.rows) < len(jobs):
+                row = JobRow(self.list_frame, self)
+                row.pack(fill=tk.X, pady=4)
+                self.rows.append(row)
+
+            for row, job in zip(self.rows, jobs):
+                row.show_job(job)
+                if not row.winfo_manager():
+                    row.pack(fill=tk.X, pady=4)
+            for row in self.rows[len(jobs):]:
+                row.pack_forget()
+
+            counts = self.store.counts()
+            self.summary_label.configure(
+                text="   ".join(f"{state.capitalize()}: {counts.get(state, 0)}"
+                                for state in (QUEUED, RUNNING, REVIEW, DONE, FAILED, CANCELLED))
+                + f"\n{format_limiter(get_rate_limiter().stats())}")
+
+        if reschedule:
+            self.after(self.REFRESH_MS, self.refresh)
+
+
+class NoteEditRow(ctk.CTkFrame):
+    """Reusable row widget editing the question and answer of one note of a package."""
+
+    def __init__(self, master, **kwargs):
+        """
+        Initialize the row widgets.
+
+        :param master: Parent widget of the row.
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.note = None
+
+        self.number_label = ctk.CTkLabel(self, text="", width=50, text_color="gray")
+        self.number_label.grid(row=0, column=0, rowspan=2, padx=5, pady=5)
+
+        self.question_box = ctk.CTkTextbox(self, width=560, height=50, wrap="word")
+        self.question_box.grid(row=0, column=1, padx=5, pady=(5, 0), sticky=tk.EW)
+
+        self.answer_box = ctk.CTkTextbox(self, width=560, height=50, wrap="word")
+        self.answer_box.grid(row=1, column=1, padx=5, pady=5, sticky=tk.EW)
+
+        self.grid_columnconfigure(1, weight=1)
+
+    def show_note(self, number, note):
+        """Display the given note."""
+
+        self.note = note
+        self.number_label.configure(text=str(number))
+        for box, text in ((self.question_box, note.question), (self.answer_box, note.answer)):
+            box.delete("1.0", tk.END)
+            box.insert("1.0", text)
+
+    def edit(self):
+        """
+        Get the edited text of the note.
+
+        :return: The new question and answer, or None if the note was not changed.
+        """
+
+        question = self.question_box.get("1.0", "end-1c")
+        answer = self.answer_box.get("1.0", "end-1c")
+        if self.note is None or (question, answer) == (self.note.question, self.note.answer):
+            return None
+        return question, answer
+
+
+class DeckBrowserWindow(ctk.CTkToplevel):
+    """Window paging through the notes of one package, with search and re-editing."""
+
+    PAGE_SIZE = 20
+
+    def __init__(self, package, *args, **kwargs):
+        """
+        Initialize the browser.
+
+        :param package: DeckPackage to browse; it is closed with the window.
+        """
+
+        super().__init__(*args, **kwargs)
+
+        self.package = package
+        self.offset = 0
+        self.total = 0
+        self.rows = []
+
+        self.geometry("800x640")
+        self.title(os.path.basename(package.path))
+
+        self.search_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.search_frame.pack(padx=10, pady=10)
+
+        self.search_entry = ctk.CTkEntry(self.search_frame, width=300, placeholder_text="Search notes...",
+                                         placeholder_text_color="grey")
+        self.search_entry.grid(row=0, column=0, padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search())
+
+        search_btn = ctk.CTkButton(self.search_frame, text="Search", width=80, command=self.search)
+        search_btn.grid(row=0, column=1, padx=5)
+
+        self.button_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.button_frame.pack(padx=10, pady=10, side=tk.BOTTOM)
+
+        self.prev_btn = ctk.CTkButton(self.button_frame, text="\u25c0", width=40,
+                                      command=lambda: self.show_page(self.offset - self.PAGE_SIZE))
+        self.prev_btn.grid(row=0, column=0, padx=5)
+
+        self.page_label = ctk.CTkLabel(self.button_frame, text="", width=160, text_color="gray")
+        self.page_label.grid(row=0, column=1, padx=5)
+
+        self.next_btn = ctk.CTkButton(self.button_frame, text="\u25b6", width=40,
+                                      command=lambda: self.show_page(self.offset + self.PAGE_SIZE))
+        self.next_btn.grid(row=0, column=2, padx=5)
+
+        self.save_btn = ctk.CTkButton(self.button_frame, text="Save changes", command=self.save_changes)
+        self.save_btn.grid(row=0, column=3, padx=(20, 5))
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.search()
+
+    def search(self):
+        """Show the first page of the notes containing the search text."""
+
+        self.total = self.package.count(self.search_entry.get())
+        self.show_page(0)
+
+    def show_page(self, offset):
+        """Show the page of notes starting at the given position; only that page is read from the package."""
+
+        self.offset = max(0, min(offset, (self.total - 1) // self.PAGE_SIZE * self.PAGE_SIZE))
+        notes = self.package.notes(self.offset, self.PAGE_SIZE, self.search_entry.get())
+
+        while len(self.rows) < len(notes):
+            self.rows.append(NoteEditRow(self.list_frame))
+
+        for number, (row, note) in enumerate(zip(self.rows, notes), start=self.offset + 1):
+            row.show_note(number, note)
+            if not row.winfo_manager():
+                row.pack(fill=tk.X, pady=4)
+        for row in self.rows[len(notes):]:
+            row.pack_forget()
+
+        self.page_label.configure(text=f"{self.offset + 1 if notes else 0}-{self.offset + len(notes)} "
+                                       f"of {self.total}")
+        self.prev_btn.configure(state="normal" if self.offset > 0 else "disabled")
+        self.next_btn.configure(state="normal" if self.offset + self.PAGE_SIZE < self.total else "disabled")
+
+    def save_changes(self):
+        """Write the edits of the shown page into the package."""
+
+        edits = {}
+        for row in self.rows:
+            edit = row.edit() if row.winfo_manager() else None
+            if edit is not None:
+                edits[row.note.note_id] = edit
+        if not edits:
+            return
+
+        try:
+            self.package.update_notes(edits)
+        except (OSError, ValueError) as error:
+            popup = PopUpWindow(self, message=str(error), text_color="red")
+        else:
+            popup = PopUpWindow(self, message=f"Saved {len(edits)} notes!")
+        popup.focus_force()
+        self.show_page(self.offset)
+
+    def close(self):
+        """Close the package and the window."""
+
+        self.package.close()
+        self.destroy()
+
+
+class PackageRow(ctk.CTkFrame):
+    """Reusable row widget showing one package of the deck library."""
+
+    def __init__(self, master, scene, **kwargs):
+        """
+        Initialize the row widgets.
+
+        :param master: Parent widget of the row.
+        :param scene: LibraryScene owning the row.
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.scene = scene
+        self.info = None
+
+        self.title_label = ctk.CTkLabel(self, text="", width=300, anchor="w")
+        self.title_label.grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+
+        self.notes_label = ctk.CTkLabel(self, text="", width=160, anchor="w", text_color="gray")
+        self.notes_label.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+
+        self.open_btn = ctk.CTkButton(self, text="Open", width=70, command=lambda: self.scene.open_package(self.info))
+        self.open_btn.grid(row=0, column=2, padx=5, pady=5)
+
+    def show_package(self, info):
+        """Display the given package summary."""
+
+        self.info = info
+        self.title_label.configure(text=info.title)
+        self.notes_label.configure(text=f"{info.notes} notes, {info.size / 1024:.0f} KB")
+
+
+class LibraryScene(ctk.CTkFrame):
+    """Deck library scene: the packages of the deck directory with their note counts."""
+
+    MAX_ROWS = 100
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the deck library scene.
+
+        :param master: Parent widget for the LibraryScene class.
+        :param kw: Additional keyword arguments for the scene configuration.
+        """
+
+        super().__init__(*args, **kwargs)
+
+        self.library = get_deck_library()
+        self.rows = []
+        self.browsers = {}
+
+        title = ctk.CTkLabel(self, text="Deck library", text_color="black")
+        title.grid(row=0, column=1, padx=10, pady=10, sticky="NS")
+
+        self.controls = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.controls.grid(row=1, column=1, padx=10, pady=5, sticky="NS")
+
+        self.search_entry = ctk.CTkEntry(self.controls, width=300, placeholder_text="Search decks...",
+                                         placeholder_text_color="grey")
+        self.search_entry.grid(row=0, column=0, padx=10, pady=5)
+        self.search_entry.bind("<Return>", lambda event: self.refresh())
+
+        refresh_btn = ctk.CTkButton(self.controls, text="Refresh", width=80, command=self.refresh)
+        refresh_btn.grid(row=0, column=1, padx=10, pady=5)
+
+        self.summary_label = ctk.CTkLabel(self.controls, text="", text_color="gray")
+        self.summary_label.grid(row=1, column=0, columnspan=2, padx=10)
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.grid(row=2, column=1, padx=10, pady=10, sticky=tk.NSEW)
+
+        self.grid_columnconfigure(1, weight=1)
+        self.rowconfigure(2, weight=1)
+
+        self.refresh()
+
+    def refresh(self):
+        """List the packages matching the search text; only changed packages are read again."""
+
+        packages = self.library.packages(self.search_entry.get())
+        shown = packages[:self.MAX_ROWS]
+
+        while len(self.rows) < len(shown):
+            self.rows.append(PackageRow(self.list_frame, self))
+
+        for row, info in zip(self.rows, shown):
+            row.show_package(info)
+            if not row.winfo_manager():
+                row.pack(fill=tk.X, pady=4)
+        for row in self.rows[len(shown):]:
+            row.pack_forget()
+
+        more = f" (first {len(shown)} shown)" if len(packages) > len(shown) else ""
+        self.summary_label.configure(
+            text=f"{len(packages)} packages, {sum(info.notes for info in packages)} notes{more}")
+
+    def open_package(self, info):
+        """Show the browser of a package, creating it if needed."""
+
+        window = self.browsers.get(info.path)
+        if window is None or not window.winfo_exists():
+            try:
+                package = self.library.open(info.path)
+            except (OSError, ValueError) as error:
+                self.summary_label.configure(text=str(error))
+                return
+            window = self.browsers[info.path] = DeckBrowserWindow(package)
+        window.focus()
+
+
+class SearchHitRow(ctk.CTkFrame):
+    """Reusable row widget showing one search hit."""
+
+    def __init__(self, master, **kwargs):
+        """
+        Initialize the row widgets.
+
+        :param master: Parent widget of the row.
+        """
+
+        super().__init__(master, **kwargs)
+
+        self.title_label = ctk.CTkLabel(self, text="", anchor="w", text_color="gray")
+        self.title_label.pack(fill=tk.X, padx=10, pady=(5, 0))
+
+        self.text_label = ctk.CTkLabel(self, text="", anchor="w", justify="left", wraplength=620)
+        self.text_label.pack(fill=tk.X, padx=10, pady=(0, 5))
+
+    def show_hit(self, hit):
+        """Display the given search hit."""
+
+        if hit.kind == SOURCES:
+            self.title_label.configure(text=hit.title)
+            self.text_label.configure(text=hit.snippet)
+            return
+
+        details = f"{hit.title or 'no deck'}"
+        if hit.source:
+            details += f"  |  {hit.source}"
+        if hit.model:
+            details += f"  |  {hit.model}"
+        self.title_label.configure(text=details)
+        self.text_label.configure(text=f"{hit.question}\n{hit.answer}")
+
+
+class SearchScene(ctk.CTkFrame):
+    """Search scene: full-text search of the saved cards and of the texts they were generated from."""
+
+    MAX_ROWS = 50
+    TYPING_DELAY_MS = 250
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the search scene.
+
+        :param master: Parent widget for the SearchScene class.
+        :param kw: Additional keyword arguments for the scene configuration.
+        """
+
+        super().__init__(*args, **kwargs)
+
+        self.search_index = get_search_index()
+        self.task_runner = TaskRunner(1)
+        self.rows = []
+        self._search_id = None
+
+        title = ctk.CTkLabel(self, text="Search cards", text_color="black")
+        title.grid(row=0, column=1, padx=10, pady=10, sticky="NS")
+
+        self.controls = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        self.controls.grid(row=1, column=1, padx=10, pady=5, sticky="NS")
+
+        self.search_entry = ctk.CTkEntry(self.controls, width=300, placeholder_text="Search...",
+                                         placeholder_text_color="grey")
+        self.search_entry.grid(row=0, column=0, padx=10, pady=5)
+        self.search_entry.bind("<KeyRelease>", lambda event: self.schedule_search())
+
+        self.combo_kind = ctk.CTkComboBox(self.controls, width=100, values=[CARDS, SOURCES], state="readonly",
+                                          command=lambda kind: self.search())
+        self.combo_kind.set(CARDS)
+        self.combo_kind.grid(row=0, column=1, padx=10, pady=5)
+
+        self.index_btn = ctk.CTkButton(self.controls, text="Index decks", width=100, command=self.index_packages)
+        self.index_btn.grid(row=0, column=2, padx=10, pady=5)
+
+        self.summary_label = ctk.CTkLabel(self.controls, text="", text_color="gray")
+        self.summary_label.grid(row=1, column=0, columnspan=3, padx=10)
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.grid(row=2, column=1, padx=10, pady=10, sticky=tk.NSEW)
+
+        self.grid_columnconfigure(1, weight=1)
+        self.rowconfigure(2, weight=1)
+
+        self.search()
+
+    def schedule_search(self):
+        """Search once the user has stopped typing for a moment."""
+
+        if self._search_id is not None:
+            self.after_cancel(self._search_id)
+        self._search_id = self.after(self.TYPING_DELAY_MS, self.search)
+
+    def search(self):
+        """Show the best hits for the search text."""
+
+        self._search_id = None
+        started = time.perf_counter()
+        hits = self.search_index.search(self.search_entry.get(), self.combo_kind.get(), self.MAX_ROWS)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        while len(self.rows) < len(hits):
+            self.rows.append(SearchHitRow(self.list_frame))
+
+        for row, hit in zip(self.rows, hits):
+            row.show_hit(hit)
+            if not row.winfo_manager():
+                row.pack(fill=tk.X, pady=4)
+        for row in self.rows[len(hits):]:
+            row.pack_forget()
+
+        cards, sources = self.search_index.counts()
+        found = f"{len(hits)} hits in {elapsed_ms:.1f} ms, " if self.search_entry.get().strip() else ""
+        self.summary_label.configure(text=f"{found}{cards} cards and {sources} source texts indexed")
+
+    def index_packages(self):
+        """Index the changed packages of the deck directory in the background."""
+
+        self.index_btn.configure(state="disabled")
+        self.summary_label.configure(text="Indexing decks...")
+        self.task_runner.submit(lambda task: self.search_index.index_package_dir(get_package_dir()),
+                                on_done=self.on_indexed,
+                                on_error=self.on_indexed)
+        self.poll_tasks()
+
+    def poll_tasks(self):
+        """Process the indexing task events while it is running."""
+
+        try:
+            self.task_runner.process_events()
+        finally:
+            if self.task_runner.active:
+                self.after(POLL_INTERVAL_MS, self.poll_tasks)
+
+    def on_indexed(self, task, result):
+        """Show the hits again once the packages are indexed, or report why they are not."""
+
+        self.index_btn.configure(state="normal")
+        self.search()
+        if isinstance(result, BaseException):
+            self.summary_label.configure(text=str(result))
+
+
 class Scene2(ctk.CTkFrame):
     """API key management scene for the Anki cards creator application."""
 
@@ -387,41 +1620,61 @@ class Scene2(ctk.CTkFrame):
         self.text_label = ctk.CTkLabel(self, text="Insert you API key", text_color="black")
         self.text_label.grid(row=0, column=1, padx=10, pady=20, sticky=tk.NSEW)
 
-        self.api_data = load_api_data()
+        settings = get_settings()
 
         self.entry_api = ctk.CTkEntry(self, placeholder_text="Add API-key here...", width=600)
         self.entry_api.grid(row=1, column=1, padx=10, pady=20)
-        self.entry_api.insert(tk.END, self.api_data.get("API_KEY", ""))
-
+        self.entry_api.insert(tk.END, settings.api_key)
+
+        self.combo_backend = ctk.CTkComboBox(self,
+                                             values=list(BACKENDS),
+                                             state="readonly",
+                                             width=200
+                                             )
+        self.combo_backend.grid(row=2, column=1, padx=10, pady=10)
+        self.combo_backend.set(settings.backend)
+
+        self.entry_api_base = ctk.CTkEntry(self, placeholder_text="API base URL for the http backend, "
+                                                                  "e.g. http://localhost:8000/v1", width=600)
+        self.entry_api_base.grid(row=3, column=1, padx=10, pady=10)
+        self.entry_api_base.insert(tk.END, settings.api_base)
+
+        # Not read-only: a local server can serve a model under any name.
         self.combo_model = ctk.CTkComboBox(self,
                                            values=["gpt-3.5-turbo", "gpt-3.5-turbo-0301", "gpt-4", "gpt-4-0314"],
-                                           state="readonly",
                                            width=200
                                            )
-        self.combo_model.grid(row=2, column=1, padx=10, pady=20)
-        self.combo_model.set(self.api_data.get("MODEL", "gpt-3.5-turbo"))
+        self.combo_model.grid(row=4, column=1, padx=10, pady=20)
+        self.combo_model.set(settings.model)
 
         self.save_apikey = ctk.CTkButton(self, width=150, text="Save API-key", command=self.save_api_key)
-        self.save_apikey.grid(row=3, column=1, padx=10, pady=20, )
+        self.save_apikey.grid(row=5, column=1, padx=10, pady=20, )
+        self.save_apikey_color = self.save_apikey.cget("fg_color")
+
+        self.label_frame = None
 
         self.columnconfigure(1, weight=1)
 
-    def save_api_key(self):
-        """Save the API key to the specified file."""
+    def reset(self):
+        """Enable saving again and hide the confirmation when the scene is shown again."""
 
-        api_key = self.entry_api.get()
+        self.save_apikey.configure(state="normal", fg_color=self.save_apikey_color, command=self.save_api_key)
+        if self.label_frame is not None:
+            self.label_frame.destroy()
+            self.label_frame = None
+
+    def save_api_key(self):
+        """Save the API key, backend and model to the specified file; the backend picks them up on the next request."""
 
-        with open("config.json", "w") as js_file:
-            json.dump(
-                {"API_KEY": api_key,
-                 "MODEL": str(self.combo_model.get())},
-                js_file)
+        get_settings().update({"API_KEY": self.entry_api.get(),
+                               "BACKEND": str(self.combo_backend.get()),
+                               "API_BASE": self.entry_api_base.get().strip(),
+                               "MODEL": str(self.combo_model.get())})
 
-        openai.api_key = api_key
         self.save_apikey.configure(state="disable", fg_color="grey", command=None)
 
-        label_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
-        label_frame.grid(row=4, column=1, padx=10, )
+        self.label_frame = label_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))
+        label_frame.grid(row=6, column=1, padx=10, )
 
         success_image_label = ctk.CTkLabel(label_frame,
                                            text="",
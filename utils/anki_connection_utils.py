@@ -1,6 +1,211 @@
-import json
-import requests
-from typing import Union, Dict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from utils.settings_utils import ANKI_CONNECT_TIMEOUT, get_settings
+
+ANKI_CONNECT_URL = "http://localhost:8765"
+ANKI_CONNECT_VERSION = 6
+ANKI_CONNECT_IMPORT_TIMEOUT = 300
+ANKI_CONNECT_RETRIES = 2
+NOTES_BATCH_SIZE = 500
+ACTIONS_PER_REQUEST = 10
+
+
+class AnkiConnectError(Exception):
+    """Raised when AnkiConnect cannot be reached or reports an error."""
+
+
+class AnkiConnectClient:
+    """AnkiConnect client reusing keep-alive connections and batching actions through "multi"."""
+
+    def __init__(self, url: str = ANKI_CONNECT_URL,
+                 timeout: float = ANKI_CONNECT_TIMEOUT,
+                 retries: int = ANKI_CONNECT_RETRIES,
+                 pool_size: int = 4):
+        """
+        Initialize the client.
+
+        :param url: Address of the AnkiConnect server.
+        :param timeout: Connect and read timeout of one request in seconds.
+        :param retries: Number of reconnection attempts when the server cannot be reached.
+        :param pool_size: Maximum number of kept-alive connections.
+        """
+
+        self.url = url
+        self.timeout = timeout
+
+        # requests is imported here rather than at module level to keep the GUI start fast.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        # Only connection failures are retried: a request that reached Anki may already have added notes.
+        retry = Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, action: str, **params: Any) -> Dict[str, Any]:
+        """
+        Send one action and return the raw AnkiConnect response.
+
+        :param action: The name of the AnkiConnect action to be executed.
+        :param params: Keyword arguments for the action's parameters.
+        :return: A dictionary with "result" and "error" keys.
+        """
+
+        return self._post(action, params, self.timeout)
+
+    def _post(self, action: str, params: Dict[str, Any], timeout) -> Dict[str, Any]:
+        import requests
+
+        try:
+            response = self.session.post(self.url,
+                                         json={'action': action, 'params': params, 'version': ANKI_CONNECT_VERSION},
+                                         timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as error:
+            raise AnkiConnectError(f"AnkiConnect request '{action}' failed: {error}") from error
+
+    def invoke(self, action: str, **params: Any) -> Any:
+        """
+        Send one action and return its result.
+
+        :param action: The name of the AnkiConnect action to be executed.
+        :param params: Keyword arguments for the action's parameters.
+        :return: The result of the action.
+        """
+
+        response = self.request(action, **params)
+        if response.get('error') is not None:
+            raise AnkiConnectError(response['error'])
+        return response.get('result')
+
+    def multi(self, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send several actions in one request.
+
+        :param actions: Dictionaries with "action" and optional "params" keys.
+        :return: A response dictionary with "result" and "error" keys for every action, in order.
+        """
+
+        return self.invoke('multi', actions=[
+            {'action': action['action'], 'params': action.get('params', {}), 'version': ANKI_CONNECT_VERSION}
+            for action in actions
+        ])
+
+    def import_package(self, package_path: str, timeout: float = ANKI_CONNECT_IMPORT_TIMEOUT) -> None:
+        """
+        Import an Anki package into the collection.
+
+        Anki answers only when the import is finished, so large decks get a longer read timeout;
+        an unreachable server still fails after the usual connect timeout.
+
+        :param package_path: The path of the Anki package to be imported.
+        :param timeout: Read timeout in seconds.
+        """
+
+        response = self._post('importPackage', {'path': package_path}, (self.timeout, timeout))
+        if response.get('error') is not None:
+            raise AnkiConnectError(response['error'])
+
+    def ensure_deck_and_model(self, deck_name: str, model) -> None:
+        """
+        Create the deck and the note type of a genanki model if they do not exist yet.
+
+        :param deck_name: Name of the deck.
+        :param model: genanki Model describing the note type.
+        """
+
+        create_deck, model_names = self.multi([
+            {'action': 'createDeck', 'params': {'deck': deck_name}},
+            {'action': 'modelNames'},
+        ])
+
+        for response in (create_deck, model_names):
+            if response.get('error') is not None:
+                raise AnkiConnectError(response['error'])
+
+        if model.name not in model_names['result']:
+            self.invoke('createModel',
+                        modelName=model.name,
+                        inOrderFields=[field['name'] for field in model.fields],
+                        cardTemplates=[{'Name': template['name'],
+                                        'Front': template['qfmt'],
+                                        'Back': template['afmt']} for template in model.templates])
+
+    def add_notes(self, deck_name: str, model_name: str, cards: Iterable[Tuple[str, str]],
+                  batch_size: int = NOTES_BATCH_SIZE,
+                  on_progress: Optional[Callable[[int, int], None]] = None) -> List[Optional[int]]:
+        """
+        Add question/answer notes in batches of addNotes actions sent through "multi".
+
+        Every batch is checked with canAddNotes first and only the notes Anki accepts are sent: newer
+        AnkiConnect versions fail a whole addNotes action when one note is rejected, without the ids of
+        the notes it did add, while older ones answer null for the rejected notes.
+
+        :param deck_name: Name of the target deck.
+        :param model_name: Name of a note type with two fields.
+        :param cards: Pairs of question and answer.
+        :param batch_size: Number of notes per addNotes action.
+        :param on_progress: Callback called with (notes sent, total notes) after every request.
+        :return: The id of every new note, or None for notes Anki rejected (e.g. duplicates or an empty question).
+        """
+
+        notes = [{'deckName': deck_name,
+                  'modelName': model_name,
+                  'fields': dict(zip(('Question', 'Answer'), card)),
+                  'options': {'allowDuplicate': False},
+                  'tags': []} for card in cards]
+
+        batches = [notes[start:start + batch_size] for start in range(0, len(notes), batch_size)]
+
+        note_ids = []
+        for start in range(0, len(batches), ACTIONS_PER_REQUEST):
+            requested = batches[start:start + ACTIONS_PER_REQUEST]
+            checks = self.multi([{'action': 'canAddNotes', 'params': {'notes': batch}} for batch in requested])
+            for response in checks:
+                if response.get('error') is not None:
+                    raise AnkiConnectError(response['error'])
+
+            accepted = [[note for note, allowed in zip(batch, check['result']) if allowed]
+                        for batch, check in zip(requested, checks)]
+            actions = [{'action': 'addNotes', 'params': {'notes': batch}} for batch in accepted if batch]
+            responses = iter(self.multi(actions) if actions else [])
+
+            for check, batch in zip(checks, accepted):
+                if not batch:
+                    note_ids.extend(None for _ in check['result'])
+                    continue
+                response = next(responses)
+                if response.get('error') is not None and response.get('result') is None:
+                    # Only a note that became a duplicate since canAddNotes, e.g. added by hand, gets here.
+                    raise AnkiConnectError(response['error'])
+                added = iter(response['result'])
+                note_ids.extend(next(added) if allowed else None for allowed in check['result'])
+            if on_progress is not None:
+                on_progress(len(note_ids), len(notes))
+
+        return note_ids
+
+
+_default_client = None
+
+
+def get_client() -> AnkiConnectClient:
+    """
+    Get the shared AnkiConnect client, creating it on first use.
+
+    :return: The shared AnkiConnectClient instance.
+    """
+
+    global _default_client
+
+    if _default_client is None:
+        _default_client = AnkiConnectClient(timeout=get_settings().anki_connect_timeout)
+    return _default_client
 
 
 def invoke(action: str, **params: Union[str, int]) -> Dict[str, Union[None, str]]:
@@ -13,24 +218,41 @@ def invoke(action: str, **params: Union[str, int]) -> Dict[str, Union[None, str]
     """
 
     try:
-        request_json = json.dumps({'action': action, 'params': params, 'version': 6})
-        response = requests.post('http://localhost:8765', data=request_json)
-        return response.json()
-    except ConnectionError as error:
-        return {"error": str(error)}
+        return get_client().request(action, **params)
+    except AnkiConnectError as error:
+        return {"result": None, "error": str(error)}
 
 
-def save_package_to_app(package_path: str) -> None:
+def save_package_to_app(package_path: str) -> bool:
     """
     Save the Anki package to the application using AnkiConnect.
 
     :param package_path: The path of the Anki package to be imported.
+    :return: True if the deck was imported.
     """
 
-    result = invoke('importPackage', path=package_path)
+    try:
+        get_client().import_package(package_path)
+    except AnkiConnectError as error:
+        print('Error importing deck:', error)
+        return False
+
+    print('Deck imported successfully')
+    return True
+
 
-    if result['error'] is None:
-        print('Deck imported successfully')
-    else:
-        print('Error importing deck:', result['error'])
+def push_cards_to_app(cards: Iterable[Tuple[str, str]], deck_name: str, model,
+                      on_progress: Optional[Callable[[int, int], None]] = None) -> List[Optional[int]]:
+    """
+    Add flashcards straight into a running Anki, without writing a package.
+
+    :param cards: Pairs of question and answer.
+    :param deck_name: Name of the target deck, created if missing.
+    :param model: genanki Model of the notes, created in Anki if missing.
+    :param on_progress: Callback called with (notes sent, total notes) after every request.
+    :return: The id of every new note, or None for notes Anki rejected.
+    """
 
+    client = get_client()
+    client.ensure_deck_and_model(deck_name, model)
+    return client.add_notes(deck_name, model.name, cards, on_progress=on_progress)
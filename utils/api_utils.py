@@ -1,15 +1,12 @@
-import os
-import json
-
-
 def load_api_data():
     """
     Load API data from the config.json file if it exists.
 
+    The file is cached by utils.settings_utils.Settings, so calling this does not re-read it every time.
+
     :return: A dictionary containing the API data, or an empty dictionary if the file does not exist.
     """
 
-    if os.path.exists(os.path.join(os.getcwd(), "config.json")):
-        with open("config.json", "r") as js_api:
-            return json.load(js_api)
-    return {}
+    from utils.settings_utils import get_settings
+
+    return get_settings().values()
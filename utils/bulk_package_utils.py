@@ -0,0 +1,212 @@
+import os
+import re
+import html
+import time
+import sqlite3
+import hashlib
+import zipfile
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from utils.package_utils import deck_id_for
+
+if TYPE_CHECKING:
+    from genanki import Model
+
+BATCH_NOTES = 5000
+PARALLEL_MIN_NOTES = 20000
+MAX_PACKAGE_WORKERS = 8
+
+# Anki strips these before it checksums the sort field of a note.
+_HIDDEN_RE = re.compile(r"(?is)<!--.*?-->|<style.*?>.*?</style>|<script.*?>.*?</script>")
+_TAG_RE = re.compile(r"(?s)<.*?>")
+
+NoteRows = List[tuple]
+CardRows = List[tuple]
+
+
+def field_checksum(text: str) -> int:
+    """
+    Compute the checksum Anki stores for the sort field of a note, used to find duplicates on import.
+
+    :param text: Sort field of the note.
+    :return: The first 32 bits of the SHA-1 of the field without its HTML.
+    """
+
+    stripped = html.unescape(_TAG_RE.sub("", _HIDDEN_RE.sub("", text))).replace("\xa0", " ")
+    return int(hashlib.sha1(stripped.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def prepare_rows(notes: Sequence[Tuple[Optional[str], str, str]], first_id: int, timestamp: float, model_id: int,
+                 deck_id: int, sort_field_index: int = 0) -> Tuple[NoteRows, CardRows]:
+    """
+    Build the collection rows of a batch of notes; runs in a worker process of the packaging pool.
+
+    IDs are assigned like genanki does, from a counter shared by the notes and their cards, and GUIDs are
+    derived like note_guid does.
+
+    :param notes: Triples of GUID, question and answer; a GUID of None is derived from the fields.
+    :param first_id: ID of the first note of the batch.
+    :param timestamp: Modification time of the notes and cards.
+    :param model_id: ID of the note type.
+    :param deck_id: ID of the deck the cards go into.
+    :param sort_field_index: Index of the field Anki sorts and checksums the notes by.
+    :return: The rows of the notes and cards tables.
+    """
+
+    from genanki import guid_for
+
+    modified = int(timestamp)
+    note_rows = []
+    card_rows = []
+    for offset, (guid, question, answer) in enumerate(notes):
+        note_id = first_id + 2 * offset
+        sort_field = (question, answer)[sort_field_index]
+        note_rows.append((note_id, guid or guid_for(question, answer), model_id, modified, -1, "  ",
+                          f"{question}\x1f{answer}", sort_field, field_checksum(sort_field), 0, ""))
+        card_rows.append((note_id + 1, note_id, deck_id, 0, modified, -1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, ""))
+
+    return note_rows, card_rows
+
+
+def default_workers() -> int:
+    """
+    Get the number of packaging processes to use: PACKAGE_WORKERS from config.json, or one per available CPU.
+
+    :return: The number of worker processes, at least 1.
+    """
+
+    from utils.settings_utils import get_settings
+
+    workers = get_settings().package_workers
+    if workers > 0:
+        return workers
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, min(cpus, MAX_PACKAGE_WORKERS))
+
+
+def _prepared_batches(notes: Sequence[Tuple[Optional[str], str, str]], first_id: int, timestamp: float,
+                      model_id: int, deck_id: int, sort_field_index: int,
+                      workers: int) -> Iterator[Tuple[int, NoteRows, CardRows]]:
+    """Yield the number of notes and the rows of every batch, in order, prepared by the pool if it pays off."""
+
+    args = [(notes[start:start + BATCH_NOTES], first_id + 2 * start, timestamp, model_id, deck_id, sort_field_index)
+            for start in range(0, len(notes), BATCH_NOTES)]
+
+    if workers <= 1 or len(notes) < PARALLEL_MIN_NOTES:
+        for batch_args in args:
+            yield (len(batch_args[0]), *prepare_rows(*batch_args))
+        return
+
+    futures = [get_package_pool(workers).submit(prepare_rows, *batch_args) for batch_args in args]
+    try:
+        for batch_args, future in zip(args, futures):
+            yield (len(batch_args[0]), *future.result())
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def write_notes_bulk(notes: Sequence[Tuple[Optional[str], str, str]], deck_title: str, package_path: str,
+                     model: "Model", deck_id: Optional[int] = None,
+                     on_progress: Optional[Callable[[int, int], None]] = None,
+                     workers: Optional[int] = None) -> None:
+    """
+    Write notes into a new package file, with the collection genanki would write, much faster.
+
+    The rows of the notes and cards, with their GUIDs and sort field checksums, are prepared in batches by
+    a pool of processes for large decks, and inserted with executemany in a single transaction. Every note
+    gets one card of the first template of the note type.
+
+    :param notes: Triples of GUID, question and answer; a GUID of None is derived from the fields.
+    :param deck_title: Name of the deck.
+    :param package_path: Path of the package file.
+    :param model: Note type of the cards.
+    :param deck_id: ID of the deck, derived from the title if omitted.
+    :param on_progress: Callback called with (notes added, total notes) after every batch;
+        an exception raised by it aborts the write before the file is created.
+    :param workers: Number of worker processes, default_workers() if omitted; 1 prepares the rows in this process.
+    """
+
+    from genanki import Deck
+    from genanki.apkg_col import APKG_COL
+    from genanki.apkg_schema import APKG_SCHEMA
+
+    if deck_id is None:
+        deck_id = deck_id_for(deck_title)
+    if workers is None:
+        workers = default_workers()
+
+    timestamp = time.time()
+    db_file, db_path = tempfile.mkstemp(suffix=".anki2")
+    os.close(db_file)
+    tmp_path = f"{package_path}.tmp"
+
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            # The collection is a scratch file that is zipped or thrown away, so it needs no journal.
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.executescript(APKG_SCHEMA)
+            conn.executescript(APKG_COL)
+
+            deck = Deck(deck_id, deck_title)
+            deck.add_model(model)
+            deck.write_to_db(conn.cursor(), timestamp, None)
+
+            done = 0
+            if on_progress is not None:
+                on_progress(0, len(notes))
+            for count, note_rows, card_rows in _prepared_batches(notes, int(timestamp * 1000), timestamp,
+                                                                 model.model_id, deck_id, model.sort_field_index,
+                                                                 workers):
+                conn.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", note_rows)
+                conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 card_rows)
+                done += count
+                if on_progress is not None:
+                    on_progress(done, len(notes))
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.makedirs(os.path.dirname(package_path) or ".", exist_ok=True)
+        with zipfile.ZipFile(tmp_path, "w") as package:
+            package.write(db_path, "collection.anki2")
+            package.writestr("media", "{}")
+        os.replace(tmp_path, package_path)
+    finally:
+        os.remove(db_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_package_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the application-wide packaging process pool, starting it on first use or when the size changes.
+
+    The processes are spawned rather than forked: forking a process that runs Tk and worker threads is unsafe.
+
+    :param workers: Number of worker processes.
+    :return: The shared ProcessPoolExecutor.
+    """
+
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
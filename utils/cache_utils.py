@@ -0,0 +1,174 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from utils.file_utils import get_cache_path
+from utils.settings_utils import CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, get_settings
+
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE INDEX IF NOT EXISTS responses_created ON responses (created);
+"""
+
+
+class ResponseCache:
+    """Persistent content-addressed cache of model responses backed by SQLite."""
+
+    def __init__(self, path: str,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 max_age: float = CACHE_MAX_AGE,
+                 enabled: bool = True):
+        """
+        Open (or create) the cache database.
+
+        :param path: Path of the SQLite database file.
+        :param max_entries: Maximum number of cached responses.
+        :param max_bytes: Maximum total size of cached responses in bytes.
+        :param max_age: Maximum age of a cached response in seconds.
+        :param enabled: When False every lookup misses and nothing is stored.
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, text: str, backend: str) -> str:
+        """
+        Build the cache key for a request.
+
+        :param model: Name of the chat model.
+        :param system_prompt: System message sent with the request.
+        :param text: User text sent with the request.
+        :param backend: Identity of the backend that answers the request, so that completions of the fake
+            backend or of a local server are never served in place of those of another service.
+        :return: A hex SHA-256 digest of the request content.
+        """
+
+        payload = json.dumps([backend, model, system_prompt, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response and mark it as recently used.
+
+        :param key: Cache key returned by make_key.
+        :return: The cached response, or None on a miss.
+        """
+
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store a response and evict entries beyond the configured limits.
+
+        :param key: Cache key returned by make_key.
+        :param value: Response text to store.
+        """
+
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, value, len(value.encode("utf-8")), now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Remove expired entries, then least recently used ones until the size limits hold."""
+
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+
+        entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access")
+        stale = []
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            entries -= 1
+            total_bytes -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters.
+
+        :return: A dictionary with hits, misses, number of entries and total size in bytes.
+        """
+
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total_bytes}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the application-wide response cache, opening it on first use.
+
+    :return: The shared ResponseCache instance.
+    """
+
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            settings = get_settings()
+            _default_cache = ResponseCache(get_cache_path(), max_entries=settings.cache_max_entries,
+                                           max_bytes=settings.cache_max_bytes)
+        return _default_cache
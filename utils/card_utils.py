@@ -0,0 +1,187 @@
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PENDING = "pending"
+SAVED = "saved"
+DELETED = "deleted"
+
+# Statuses are stored as one byte per card, at the position of the status in this tuple.
+STATUSES = (PENDING, SAVED, DELETED)
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+class Card:
+    """A snapshot of one card of a CardStore; changes go through the store."""
+
+    __slots__ = ("question", "answer", "status", "duplicate")
+
+    def __init__(self, question: str, answer: str, status: str = PENDING, duplicate: Optional[str] = None):
+        """
+        Initialize the card.
+
+        :param question: Text of the front side.
+        :param answer: Text of the back side.
+        :param status: Review status (PENDING, SAVED or DELETED).
+        :param duplicate: Source of an existing card this one duplicates, if any.
+        """
+
+        self.question = question
+        self.answer = answer
+        self.status = status
+        self.duplicate = duplicate
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        Convert the card to the dictionary format returned by preprocess_response.
+
+        :return: A dictionary with "question" and "answer" keys.
+        """
+
+        return {"question": self.question, "answer": self.answer}
+
+
+class CardStore:
+    """
+    Ordered collection of cards under review, independent of any widgets.
+
+    The cards are stored column by column: two lists of strings, one status byte per card and the sources of
+    the few duplicates by index, which are interned since many cards share them. Cards are only materialized
+    as Card snapshots when they are read one at a time, so a store of 100k cards holds little more than
+    its text.
+    """
+
+    __slots__ = ("questions", "answers", "statuses", "duplicates", "counts")
+
+    def __init__(self, flash_cards: Optional[Dict[int, Dict[str, str]]] = None):
+        """
+        Initialize the store.
+
+        :param flash_cards: Flashcards in the format returned by preprocess_response.
+        """
+
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.statuses = bytearray()
+        self.duplicates: Dict[int, str] = {}
+        self.counts = {PENDING: 0, SAVED: 0, DELETED: 0}
+
+        for card_id in range(len(flash_cards or {})):
+            self.add(flash_cards[card_id])
+
+    def __len__(self) -> int:
+        return len(self.statuses)
+
+    def __getitem__(self, index: int) -> Card:
+        return Card(self.questions[index], self.answers[index], STATUSES[self.statuses[index]],
+                    self.duplicates.get(index))
+
+    def __iter__(self) -> Iterator[Card]:
+        for index in range(len(self.statuses)):
+            yield self[index]
+
+    def add_card(self, question: str, answer: str, status: str = PENDING, duplicate: Optional[str] = None) -> int:
+        """
+        Append a card.
+
+        :param question: Text of the front side.
+        :param answer: Text of the back side.
+        :param status: Initial review status of the card.
+        :param duplicate: Source of an existing card this one duplicates, if any.
+        :return: Index of the new card.
+        """
+
+        index = len(self.statuses)
+        self.questions.append(question)
+        self.answers.append(answer)
+        self.statuses.append(_STATUS_CODES[status])
+        if duplicate:
+            self.duplicates[index] = sys.intern(duplicate)
+        self.counts[status] += 1
+        return index
+
+    def add(self, flash_card: Dict[str, str], status: str = PENDING) -> int:
+        """
+        Append a flashcard.
+
+        :param flash_card: Dictionary with "question" and "answer" keys and an optional "duplicate" key.
+        :param status: Initial review status of the card.
+        :return: Index of the new card.
+        """
+
+        return self.add_card(flash_card["question"], flash_card["answer"], status, flash_card.get("duplicate"))
+
+    def set_duplicate(self, index: int, duplicate: Optional[str]) -> None:
+        """
+        Flag a card as a duplicate of an existing one, or clear the flag.
+
+        :param index: Index of the card.
+        :param duplicate: Source of the existing card, None to clear the flag.
+        """
+
+        if duplicate:
+            self.duplicates[index] = sys.intern(duplicate)
+        else:
+            self.duplicates.pop(index, None)
+
+    def update_text(self, index: int, question: str, answer: str) -> None:
+        """
+        Replace the text of a card, e.g. after it was edited in the review window.
+
+        :param index: Index of the card.
+        :param question: New text of the front side.
+        :param answer: New text of the back side.
+        """
+
+        self.questions[index] = question
+        self.answers[index] = answer
+
+    def set_status(self, index: int, status: str) -> None:
+        """
+        Change the review status of a card.
+
+        :param index: Index of the card.
+        :param status: New status (PENDING, SAVED or DELETED).
+        """
+
+        self.counts[STATUSES[self.statuses[index]]] -= 1
+        self.counts[status] += 1
+        self.statuses[index] = _STATUS_CODES[status]
+
+    def set_status_range(self, start: int, stop: int, status: str) -> int:
+        """
+        Change the status of every pending card in a range.
+
+        :param start: Index of the first card of the range.
+        :param stop: Index after the last card of the range.
+        :param status: New status (SAVED or DELETED).
+        :return: Number of cards whose status changed.
+        """
+
+        start = max(0, start)
+        segment = self.statuses[start:stop]
+        changed = segment.count(_STATUS_CODES[PENDING])
+        self.statuses[start:stop] = segment.replace(bytes([_STATUS_CODES[PENDING]]), bytes([_STATUS_CODES[status]]))
+
+        self.counts[PENDING] -= changed
+        self.counts[status] += changed
+        return changed
+
+    @property
+    def pending(self) -> int:
+        """Number of cards still waiting for a decision."""
+
+        return self.counts[PENDING]
+
+    def saved(self, start: int = 0, stop: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Get the cards approved for saving, in the form the exporters and packagers take.
+
+        :param start: Index of the first card to consider.
+        :param stop: Index after the last card to consider, the end of the store if omitted.
+        :return: Pairs of question and answer of the saved cards in their original order.
+        """
+
+        code = _STATUS_CODES[SAVED]
+        stop = len(self.statuses) if stop is None else min(stop, len(self.statuses))
+        return [(self.questions[index], self.answers[index]) for index in range(max(0, start), stop)
+                if self.statuses[index] == code]
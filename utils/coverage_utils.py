@@ -0,0 +1,328 @@
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from utils.file_utils import get_coverage_path
+from utils.settings_utils import SIMILARITY_THRESHOLD, get_settings
+
+# NumPy is imported by the functions that embed text, so the GUI starts without loading it.
+if TYPE_CHECKING:
+    import numpy
+
+EMBEDDING_DIM = 512
+
+_WORD_RE = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_hash TEXT PRIMARY KEY,
+    document TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    cards TEXT NOT NULL,
+    created REAL NOT NULL,
+    backend TEXT NOT NULL DEFAULT ''
+);
+"""
+
+# Columns added after the first release, with their definition for databases created before.
+_ADDED_COLUMNS = {"backend": "TEXT NOT NULL DEFAULT ''"}
+
+
+def chunk_hash(chunk: str, backend: str) -> str:
+    """
+    Hash the content of a chunk as generated by one backend; changes of whitespace only do not change the hash.
+
+    :param chunk: Source text chunk.
+    :param backend: Identity of the backend that generated the cards of the chunk.
+    :return: A hex SHA-256 digest.
+    """
+
+    return hashlib.sha256(f"{backend}\0{' '.join(chunk.split())}".encode("utf-8")).hexdigest()
+
+
+def embed(text: str) -> "numpy.ndarray":
+    """
+    Embed a text as hashed word unigrams and bigrams with sublinear term frequencies.
+
+    The embedding is computed locally; texts that share most of their wording have a cosine similarity
+    close to 1, while a rewritten paragraph falls well below it.
+
+    :param text: Text to embed.
+    :return: A unit-length float32 vector of EMBEDDING_DIM values, all zero for a text without words.
+    """
+
+    import numpy as np
+
+    words = _WORD_RE.findall(text.lower())
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    if not features:
+        return np.zeros(EMBEDDING_DIM, dtype=np.float32)
+
+    buckets = np.fromiter((zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM for feature in features),
+                          dtype=np.int64, count=len(features))
+    vector = np.log1p(np.bincount(buckets, minlength=EMBEDDING_DIM)).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class Coverage:
+    """An indexed chunk that matches a new chunk, with the cards it produced."""
+
+    def __init__(self, chunk_hash: str, document: str, similarity: float, cards: List[Tuple[str, str]]):
+        """
+        Initialize the match.
+
+        :param chunk_hash: Hash of the indexed chunk.
+        :param document: Name of the document the indexed chunk came from.
+        :param similarity: Cosine similarity of the embeddings, 1.0 for an unchanged chunk.
+        :param cards: Pairs of question and answer generated from the indexed chunk.
+        """
+
+        self.chunk_hash = chunk_hash
+        self.document = document
+        self.similarity = similarity
+        self.cards = cards
+
+
+class CoverageIndex:
+    """
+    Source chunks that already produced cards, so re-runs of revised documents only generate what changed.
+
+    Each chunk is stored with its content hash, its embedding, the cards generated from it and the backend
+    that generated them. A new chunk is covered if its hash is known, or if an indexed chunk is at least
+    `threshold` similar to it; only chunks generated by the same backend count, so cards of the fake backend
+    or of a local model never stand in for those of another service.
+    """
+
+    def __init__(self, path: str, threshold: float = SIMILARITY_THRESHOLD):
+        """
+        Open (or create) the index database.
+
+        :param path: Path of the SQLite database file.
+        :param threshold: Minimum cosine similarity of a substantially unchanged chunk.
+        """
+
+        self.path = path
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} {definition}")
+        self._conn.commit()
+
+        # Hashes and embedding matrices of the indexed chunks, by backend.
+        self._hashes: Optional[Dict[str, List[str]]] = None
+        self._digests = set()
+        self._matrices: Dict[str, "numpy.ndarray"] = {}
+        self._blocks: Dict[str, list] = {}
+
+    def _load(self) -> None:
+        """Read every embedding into memory on first use; called with the lock held."""
+
+        import numpy as np
+
+        if self._hashes is not None:
+            return
+
+        self._hashes = {}
+        embeddings = {}
+        for digest, embedding, backend in self._conn.execute("SELECT chunk_hash, embedding, backend FROM chunks"):
+            self._hashes.setdefault(backend, []).append(digest)
+            self._digests.add(digest)
+            embeddings.setdefault(backend, []).append(np.frombuffer(embedding, dtype=np.float32))
+
+        self._matrices = {backend: np.vstack(rows) for backend, rows in embeddings.items()}
+
+    def _embeddings(self, backend: str) -> "numpy.ndarray":
+        """Get the embeddings of one backend, with the recorded ones appended; called with the lock held."""
+
+        import numpy as np
+
+        matrix = self._matrices.get(backend, np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+        if self._blocks.get(backend):
+            matrix = self._matrices[backend] = np.vstack([matrix, *self._blocks.pop(backend)])
+        return matrix
+
+    def find_many(self, chunks: List[str], backend: str) -> Dict[int, Coverage]:
+        """
+        Find the chunks that are already covered by the index.
+
+        :param chunks: Source text chunks.
+        :param backend: Identity of the backend that would generate the chunks; see LLMBackend.identity.
+        :return: The match of every covered chunk, by the position of the chunk in the list.
+        """
+
+        import numpy as np
+
+        if not chunks:
+            return {}
+
+        with self._lock:
+            self._load()
+            matches = {}
+            for index, chunk in enumerate(chunks):
+                digest = chunk_hash(chunk, backend)
+                if digest in self._digests:
+                    matches[index] = (digest, 1.0)
+
+            remaining = [index for index in range(len(chunks)) if index not in matches]
+            matrix = self._embeddings(backend)
+            if remaining and len(matrix):
+                similarities = matrix @ np.vstack([embed(chunks[index]) for index in remaining]).T
+                best = similarities.argmax(axis=0)
+                for column, index in enumerate(remaining):
+                    similarity = float(similarities[best[column], column])
+                    if similarity >= self.threshold:
+                        matches[index] = (self._hashes[backend][best[column]], similarity)
+
+            covered = {}
+            for index, (digest, similarity) in matches.items():
+                document, cards = self._conn.execute("SELECT document, cards FROM chunks WHERE chunk_hash = ?",
+                                                     (digest,)).fetchone()
+                covered[index] = Coverage(digest, document, similarity, [tuple(card) for card in json.loads(cards)])
+
+        return covered
+
+    def record(self, chunk: str, document: str, backend: str, cards: Iterable[Tuple[str, str]]) -> bool:
+        """
+        Index a chunk together with the cards generated from it, replacing an earlier entry of the same text.
+
+        A chunk without cards is not recorded, so that it is generated again next time.
+
+        :param chunk: Source text chunk.
+        :param document: Name of the document the chunk came from.
+        :param backend: Identity of the backend that generated the cards.
+        :param cards: Pairs of question and answer.
+        :return: True if the chunk was recorded.
+        """
+
+        cards = [[question, answer] for question, answer in cards]
+        if not cards:
+            return False
+
+        digest = chunk_hash(chunk, backend)
+        embedding = embed(chunk)
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO chunks (chunk_hash, document, embedding, cards, created, "
+                               "backend) VALUES (?, ?, ?, ?, ?, ?)",
+                               (digest, document, embedding.tobytes(), json.dumps(cards, ensure_ascii=False),
+                                time.time(), backend))
+            self._conn.commit()
+
+            if self._hashes is not None and digest not in self._digests:
+                self._digests.add(digest)
+                self._hashes.setdefault(backend, []).append(digest)
+                self._blocks.setdefault(backend, []).append(embedding[None, :])
+
+        return True
+
+    def close(self) -> None:
+        """Close the index database."""
+
+        with self._lock:
+            self._conn.close()
+
+
+class PendingCoverage:
+    """
+    The chunks generated for one deck, recorded in a coverage index only once the deck is delivered.
+
+    Generations that are discarded, cancelled or fail to be packaged leave no trace in the index, so their
+    text is generated again the next time.
+    """
+
+    def __init__(self, index: CoverageIndex, document: str, backend: str):
+        """
+        Initialize an empty set of generated chunks.
+
+        :param index: Index the chunks are looked up in and recorded into.
+        :param document: Name of the document the chunks come from.
+        :param backend: Identity of the backend generating the chunks; see LLMBackend.identity.
+        """
+
+        self.index = index
+        self.document = document
+        self.backend = backend
+
+        self._lock = threading.Lock()
+        self._chunks: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+    def find_many(self, chunks: List[str]) -> Dict[int, Coverage]:
+        """
+        Find the chunks already covered by cards of the same backend.
+
+        :param chunks: Source text chunks.
+        :return: The match of every covered chunk, by the position of the chunk in the list.
+        """
+
+        return self.index.find_many(chunks, self.backend)
+
+    def add(self, chunk: str, cards: Iterable[Tuple[str, str]]) -> None:
+        """
+        Remember a fully generated chunk; safe to call from several threads.
+
+        :param chunk: Source text chunk.
+        :param cards: Pairs of question and answer generated from it; a chunk without cards is ignored.
+        """
+
+        cards = list(cards)
+        if cards:
+            with self._lock:
+                self._chunks.append((chunk, cards))
+
+    def record(self, delivered: Optional[Iterable[Tuple[str, str]]] = None) -> int:
+        """
+        Record the generated chunks in the index, with the cards that were delivered.
+
+        :param delivered: Pairs of question and answer of the delivered deck, None if every generated card was
+            delivered. A card counts as delivered if its question or its answer is in the deck, so cards edited
+            on one side still count; chunks none of whose cards were delivered are not recorded.
+        :return: Number of recorded chunks.
+        """
+
+        with self._lock:
+            chunks = list(self._chunks)
+
+        texts = None
+        if delivered is not None:
+            texts = set()
+            for question, answer in delivered:
+                texts.update((question, answer))
+
+        recorded = 0
+        for chunk, cards in chunks:
+            kept = cards if texts is None else [card for card in cards if card[0] in texts or card[1] in texts]
+            recorded += self.index.record(chunk, self.document, self.backend, kept)
+        return recorded
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_coverage_index() -> CoverageIndex:
+    """
+    Get the application-wide source coverage index, opening it on first use.
+
+    The similarity threshold is COVERAGE_SIMILARITY from config.json.
+
+    :return: The shared CoverageIndex instance.
+    """
+
+    global _default_index
+
+    threshold = get_settings().coverage_similarity
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = CoverageIndex(get_coverage_path())
+        _default_index.threshold = threshold
+        return _default_index
@@ -0,0 +1,329 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.file_utils import get_dedup_index_path
+from utils.package_utils import read_package_notes
+
+NUM_BINS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_BINS // BANDS
+SHINGLE_SIZE = 2
+DUPLICATE_THRESHOLD = 0.8
+ANKI_NOTES_BATCH_SIZE = 1000
+
+_EMPTY_BIN = 0xFFFFFFFF
+_TAG_RE = re.compile(r"<[^>]+>")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    norm_hash TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_norm_hash ON notes (norm_hash);
+CREATE TABLE IF NOT EXISTS bands (
+    key INTEGER NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (key, note_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize card text so that formatting differences do not matter.
+
+    :param text: Question or answer text, possibly containing HTML.
+    :return: Lower-case text without tags, punctuation and repeated whitespace.
+    """
+
+    text = _TAG_RE.sub(" ", text.lower())
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def minhash_signature(normalized: str) -> Optional[array]:
+    """
+    Compute a one-permutation MinHash signature of the word shingles of a text.
+
+    Every shingle is hashed once: the low bits pick one of NUM_BINS bins and the remaining bits compete
+    for that bin's minimum. Empty bins borrow the value of the next non-empty bin (rotation densification),
+    so two signatures agree in a position with a probability close to the Jaccard similarity of the texts.
+
+    :param normalized: Text returned by normalize_text.
+    :return: An array of NUM_BINS unsigned integers, or None for an empty text.
+    """
+
+    if not normalized:
+        return None
+
+    words = normalized.encode("utf-8").split()
+    crc32 = zlib.crc32
+    signature = [_EMPTY_BIN] * NUM_BINS
+
+    for i in range(max(1, len(words) - SHINGLE_SIZE + 1)):
+        value = crc32(b" ".join(words[i:i + SHINGLE_SIZE]))
+        bin_index = value % NUM_BINS
+        value //= NUM_BINS
+        if value < signature[bin_index]:
+            signature[bin_index] = value
+
+    if _EMPTY_BIN in signature:
+        # Sweep twice from right to left so that every empty bin sees the nearest filled bin to its right,
+        # wrapping around the end of the signature.
+        dense = list(signature)
+        nearest = None
+        distance = 0
+        for i in range(2 * NUM_BINS - 1, -1, -1):
+            value = signature[i % NUM_BINS]
+            if value != _EMPTY_BIN:
+                nearest = value
+                distance = 0
+                continue
+            distance += 1
+            if i < NUM_BINS and nearest is not None:
+                dense[i] = (nearest + distance * 0x9E3779B1) & 0x3FFFFFF
+        signature = dense
+
+    return array("I", signature)
+
+
+def band_keys(signature: array) -> List[int]:
+    """
+    Split a signature into LSH bands and hash each band into a key.
+
+    The band number is kept in the high bits so equal rows in different bands never share a key.
+
+    :param signature: Signature returned by minhash_signature.
+    :return: One key per band.
+    """
+
+    data = signature.tobytes()
+    width = ROWS_PER_BAND * signature.itemsize
+    return [band << 32 | zlib.crc32(data[band * width:(band + 1) * width]) for band in range(BANDS)]
+
+
+def similarity(first: array, second: array) -> float:
+    """
+    Estimate the Jaccard similarity of two texts from their signatures.
+
+    :param first: Signature of the first text.
+    :param second: Signature of the second text.
+    :return: The fraction of equal signature positions.
+    """
+
+    return sum(a == b for a, b in zip(first, second)) / NUM_BINS
+
+
+class DuplicateIndex:
+    """Persistent index of known cards answering "was this card generated before?" in sub-linear time."""
+
+    def __init__(self, path: str, threshold: float = DUPLICATE_THRESHOLD):
+        """
+        Open (or create) the index database.
+
+        :param path: Path of the SQLite database file.
+        :param threshold: Minimum estimated similarity for a card to count as a near-duplicate.
+        """
+
+        self.path = path
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _card_text(question: str, answer: str) -> str:
+        return normalize_text(f"{question} {answer}")
+
+    def find_duplicate(self, question: str, answer: str) -> Optional[Dict[str, str]]:
+        """
+        Look up an exact or near-duplicate of a card.
+
+        :param question: Text of the front side.
+        :param answer: Text of the back side.
+        :return: The most similar known card with its "question", "answer", "source" and "similarity",
+            or None if there is no duplicate.
+        """
+
+        normalized = self._card_text(question, answer)
+        signature = minhash_signature(normalized)
+        if signature is None:
+            return None
+
+        norm_hash = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            row = self._conn.execute("SELECT question, answer, source FROM notes WHERE norm_hash = ? LIMIT 1",
+                                     (norm_hash,)).fetchone()
+            if row is not None:
+                return {"question": row[0], "answer": row[1], "source": row[2], "similarity": 1.0}
+
+            keys = band_keys(signature)
+            candidates = self._conn.execute(
+                f"SELECT DISTINCT n.question, n.answer, n.source, n.signature FROM bands b "
+                f"JOIN notes n ON n.id = b.note_id WHERE b.key IN ({','.join('?' * len(keys))})",
+                keys).fetchall()
+
+        best = None
+        for candidate_question, candidate_answer, source, blob in candidates:
+            score = similarity(signature, array("I", blob))
+            if score >= self.threshold and (best is None or score > best["similarity"]):
+                best = {"question": candidate_question, "answer": candidate_answer,
+                        "source": source, "similarity": score}
+
+        return best
+
+    def add_many(self, cards: Iterable[Tuple[str, str]], source: str = "") -> int:
+        """
+        Add cards to the index in one transaction.
+
+        :param cards: Pairs of question and answer.
+        :param source: Where the cards come from (package path, "anki", deck title...).
+        :return: Number of cards added.
+        """
+
+        rows = []
+        for question, answer in cards:
+            normalized = self._card_text(question, answer)
+            signature = minhash_signature(normalized)
+            if signature is not None:
+                rows.append((hashlib.sha1(normalized.encode("utf-8")).hexdigest(), signature, question, answer))
+
+        with self._lock:
+            first_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM notes").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO notes (id, norm_hash, signature, question, answer, source) VALUES (?, ?, ?, ?, ?, ?)",
+                [(first_id + offset, norm_hash, signature.tobytes(), question, answer, source)
+                 for offset, (norm_hash, signature, question, answer) in enumerate(rows)])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bands VALUES (?, ?)",
+                sorted((key, first_id + offset) for offset, row in enumerate(rows) for key in band_keys(row[1])))
+            self._conn.commit()
+
+        return len(rows)
+
+    def add(self, question: str, answer: str, source: str = "") -> None:
+        """
+        Add a single card to the index.
+
+        :param question: Text of the front side.
+        :param answer: Text of the back side.
+        :param source: Where the card comes from.
+        """
+
+        self.add_many([(question, answer)], source)
+
+    def remove_source(self, source: str) -> None:
+        """
+        Remove every card that was added with the given source.
+
+        :param source: Source passed to add_many.
+        """
+
+        with self._lock:
+            self._conn.execute("DELETE FROM bands WHERE note_id IN (SELECT id FROM notes WHERE source = ?)", (source,))
+            self._conn.execute("DELETE FROM notes WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def index_package(self, package_path: str) -> int:
+        """
+        Index the notes of an Anki package unless it was indexed since its last change.
+
+        :param package_path: The path of the .apkg file.
+        :return: Number of cards added.
+        """
+
+        stat = os.stat(package_path)
+        with self._lock:
+            row = self._conn.execute("SELECT mtime, size FROM sources WHERE path = ?", (package_path,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            return 0
+
+        self.remove_source(package_path)
+        added = self.add_many(read_package_notes(package_path), package_path)
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                               (package_path, stat.st_mtime, stat.st_size))
+            self._conn.commit()
+
+        return added
+
+    def index_package_dir(self, package_dir: str) -> int:
+        """
+        Index every changed Anki package in a directory.
+
+        :param package_dir: Directory with .apkg files.
+        :return: Number of cards added.
+        """
+
+        if not os.path.isdir(package_dir):
+            return 0
+
+        return sum(self.index_package(os.path.join(package_dir, filename))
+                   for filename in sorted(os.listdir(package_dir)) if filename.endswith(".apkg"))
+
+    def index_anki_notes(self, client, query: str = "deck:*") -> int:
+        """
+        Replace the indexed notes of the running Anki application with its current notes.
+
+        :param client: AnkiConnectClient used to fetch the notes.
+        :param query: Anki search query selecting the notes.
+        :return: Number of cards added.
+        """
+
+        note_ids = client.invoke('findNotes', query=query)
+        self.remove_source("anki")
+
+        added = 0
+        for start in range(0, len(note_ids), ANKI_NOTES_BATCH_SIZE):
+            notes = client.invoke('notesInfo', notes=note_ids[start:start + ANKI_NOTES_BATCH_SIZE])
+            cards = []
+            for note in notes:
+                fields = sorted(note['fields'].values(), key=lambda field: field['order'])
+                if fields:
+                    cards.append((fields[0]['value'], fields[1]['value'] if len(fields) > 1 else ""))
+            added += self.add_many(cards, "anki")
+
+        return added
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """
+    Get the application-wide duplicate index, opening it on first use.
+
+    :return: The shared DuplicateIndex instance.
+    """
+
+    global _default_index
+
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = DuplicateIndex(get_dedup_index_path())
+        return _default_index
@@ -0,0 +1,122 @@
+from typing import List, Optional, Tuple
+
+from utils.anki_connection_utils import get_client, push_cards_to_app, AnkiConnectError
+from utils.coverage_utils import PendingCoverage
+from utils.dedup_utils import get_duplicate_index
+from utils.package_utils import append_package
+from utils.search_utils import get_search_index
+from utils.task_utils import Task
+from utils.writer_utils import create_writer, SHARD_NOTES
+
+EXPORT_WORKERS = 2
+
+
+def package_deck(task: Task, cards: List[Tuple[str, str]], deck_title: str, package_dir: str, model,
+                 import_to_app: bool = True, coverage: Optional[PendingCoverage] = None) -> Optional[str]:
+    """
+    Package the new cards of a deck and import them into Anki; runs on a TaskRunner worker.
+
+    Progress is reported through task.progress and cancellation is checked between the stages,
+    so a cancelled job never leaves a half-written package behind.
+
+    :param task: Handle of the running task.
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the deck.
+    :param package_dir: Directory the package is written to.
+    :param model: genanki Model of the notes.
+    :param import_to_app: Import the written package into a running Anki through AnkiConnect.
+    :param coverage: Generated chunks of the cards, recorded in the coverage index once the deck is packaged.
+    :return: The path of the written package, or None if the deck already had every card.
+    """
+
+    def on_progress(done, total):
+        task.check_cancelled()
+        task.progress("packaging", done, total)
+
+    task.progress("packaging", 0, len(cards))
+    package_path = append_package(cards, deck_title, package_dir, model=model, on_progress=on_progress)
+
+    task.progress("indexing")
+    get_search_index().add_cards(cards, deck_title)
+    if coverage is not None:
+        coverage.record(cards)
+    if package_path is None:
+        return None
+    get_duplicate_index().index_package(package_path)
+
+    if import_to_app:
+        task.check_cancelled()
+        task.progress("importing")
+        try:
+            get_client().import_package(package_path)
+        except AnkiConnectError as error:
+            # The package is already recorded in the deck manifest, so a retry would not write it again.
+            raise AnkiConnectError(f"Saved {package_path}, but it could not be imported: {error}") from error
+
+    return package_path
+
+
+def send_deck(task: Task, cards: List[Tuple[str, str]], deck_title: str, model,
+              coverage: Optional[PendingCoverage] = None) -> int:
+    """
+    Add the cards of a deck straight into a running Anki; runs on a TaskRunner worker.
+
+    :param task: Handle of the running task.
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the target deck.
+    :param model: genanki Model of the notes.
+    :param coverage: Generated chunks of the cards, recorded in the coverage index once they are sent.
+    :return: Number of notes Anki added.
+    """
+
+    def on_progress(done, total):
+        task.progress("sending", done, total)
+        task.check_cancelled()
+
+    task.progress("sending", 0, len(cards))
+    note_ids = push_cards_to_app(cards, deck_title, model, on_progress=on_progress)
+
+    task.progress("indexing")
+    get_duplicate_index().add_many(cards, f"anki:{deck_title}")
+    get_search_index().add_cards(cards, deck_title)
+    if coverage is not None:
+        coverage.record(cards)
+
+    return sum(1 for note_id in note_ids if note_id)
+
+
+def export_deck(task: Task, cards: List[Tuple[str, str]], deck_title: str, export_format: str, output_dir: str,
+                model, shard_size: int = SHARD_NOTES, coverage: Optional[PendingCoverage] = None) -> List[str]:
+    """
+    Stream the cards of a deck into TSV, JSONL or .apkg shard files; runs on a TaskRunner worker.
+
+    A cancelled job removes the files it has written so far.
+
+    :param task: Handle of the running task.
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the deck.
+    :param export_format: One of writer_utils.EXPORT_FORMATS.
+    :param output_dir: Directory the files are written to.
+    :param model: genanki Model of the notes in .apkg shards.
+    :param shard_size: Maximum number of notes per .apkg shard.
+    :param coverage: Generated chunks of the cards, recorded in the coverage index once they are exported.
+    :return: Paths of the exported files.
+    """
+
+    def on_progress(done):
+        task.check_cancelled()
+        task.progress("exporting", done, len(cards))
+
+    task.progress("exporting", 0, len(cards))
+    with create_writer(export_format, output_dir, deck_title, model, shard_size) as writer:
+        writer.write_many(cards, on_progress=on_progress)
+
+    task.progress("indexing")
+    get_search_index().add_cards(cards, writer.deck_title)
+    if coverage is not None:
+        coverage.record(cards)
+    if export_format == "apkg":
+        for path in writer.paths:
+            get_duplicate_index().index_package(path)
+
+    return writer.paths
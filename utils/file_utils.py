@@ -1,8 +1,10 @@
 import os
-import customtkinter as ctk
-from PIL import Image
+import functools
 from typing import Tuple
 
+# Data files live next to the application, not in the directory it was started from.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 def get_package_dir():
     """
@@ -10,7 +12,79 @@ def get_package_dir():
 
     :return: The deck packages directory path as a string.
     """
-    return os.path.join(os.getcwd(), "deck_packages")
+    return os.path.join(PROJECT_DIR, "deck_packages")
+
+
+def get_cache_path():
+    """
+    Get the path of the LLM response cache database.
+
+    :return: The response cache file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "response_cache.sqlite")
+
+
+def get_dedup_index_path():
+    """
+    Get the path of the duplicate card index database.
+
+    :return: The duplicate index file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "dedup_index.sqlite")
+
+
+def get_metrics_path():
+    """
+    Get the path of the generation metrics database.
+
+    :return: The metrics file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "metrics.sqlite")
+
+
+def get_jobs_path():
+    """
+    Get the path of the document job queue database.
+
+    :return: The job queue file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "job_queue.sqlite")
+
+
+def get_coverage_path():
+    """
+    Get the path of the source coverage index database.
+
+    :return: The coverage index file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "source_coverage.sqlite")
+
+
+def get_library_cache_dir():
+    """
+    Get the directory of the deck library catalog and the collections extracted from packages.
+
+    :return: The deck library cache directory path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "deck_cache")
+
+
+def get_search_index_path():
+    """
+    Get the path of the full-text search index database.
+
+    :return: The search index file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "search_index.sqlite")
+
+
+def get_config_path():
+    """
+    Get the path of the settings file.
+
+    :return: The config.json file path as a string.
+    """
+    return os.path.join(PROJECT_DIR, "config.json")
 
 
 def get_icons_dir():
@@ -19,18 +93,24 @@ def get_icons_dir():
 
     :return: The icons directory path as a string.
     """
-    return os.path.join(os.getcwd(), "icons")
+    return os.path.join(PROJECT_DIR, "icons")
 
 
+@functools.lru_cache(maxsize=None)
 def get_icon(icon_name: str, size: Tuple = (30, 30)):
     """
     Get a custom tkinter image object for the specified icon.
 
+    Icons are decoded on first use and then shared by every widget and window showing them.
+
     :param icon_name: The name of the icon file.
     :param size: A tuple containing the width and height of the icon (default: (30, 30)).
     :return: A custom tkinter image object.
     """
 
+    import customtkinter as ctk
+    from PIL import Image
+
     icons_dir = get_icons_dir()
     icon = ctk.CTkImage(light_image=Image.open(os.path.join(icons_dir, icon_name)), size=size)
     return icon
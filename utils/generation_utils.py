@@ -0,0 +1,687 @@
+import re
+import time
+import random
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+from utils.cache_utils import ResponseCache
+from utils.llm_utils import (LLMBackend, LLMError, LLMRetryableError, LLMRateLimitError, LLMAuthenticationError,
+                             LLMInvalidRequestError, get_backend)
+from utils.metrics_utils import RequestMetrics, RunMetrics
+from utils.rate_limit_utils import take_throttle_wait
+from utils.settings_utils import CHUNK_MAX_TOKENS, DEFAULT_MODEL, MAX_RETRIES, MAX_WORKERS
+from utils.text_preprocessing_utils import iter_cards, CardStreamParser, ParseReport
+
+if TYPE_CHECKING:
+    from utils.coverage_utils import PendingCoverage
+
+# Rate limit errors have their own budget: the limiter slows down after each of them, so they are worth waiting out.
+MAX_RATE_LIMIT_RETRIES = 10
+BACKOFF_BASE = 1.0
+
+UNABLE_MSG = "Unable to generate flashcards"
+COVERED_MSG = "Every part of this text already has cards; uncheck \"Skip carded text\" to generate them again"
+
+SYSTEM_PROMPT = "You are an AI-powered assistant that creates AnkiWeb flashcards from the text. " \
+                "Your task is to identify the most significant and relevant information from the " \
+                "text and generate flashcards with the following format:" \
+                "Front: [question to test knowledge retention]" \
+                "Back: [answer to the question]" \
+                "\nImportant requirement: If text is not appropriate, you should reply with " \
+                f"'{UNABLE_MSG}'. Only with this sentence and nothing else"
+
+JSON_SYSTEM_PROMPT = "You are an AI-powered assistant that creates AnkiWeb flashcards from the text. " \
+                     "Your task is to identify the most significant and relevant information from the " \
+                     "text and generate flashcards. Reply with a JSON array only, one object per flashcard: " \
+                     '[{"front": "question to test knowledge retention", "back": "answer to the question"}]' \
+                     "\nImportant requirement: If text is not appropriate, you should reply with " \
+                     f"'{UNABLE_MSG}'. Only with this sentence and nothing else"
+
+RETRYABLE_ERRORS = (LLMRetryableError,)
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens the model will see for the given text.
+
+    :param text: Text to measure.
+    :return: Approximate token count (about four characters per token).
+    """
+
+    return (len(text) + 3) // 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    # tiktoken is optional and slow to import, so it is loaded by the first count instead of at startup.
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Count the tokens of a text with the model's tokenizer.
+
+    tiktoken is optional; without it the estimate_tokens heuristic is used.
+
+    :param text: Text to measure.
+    :param model: Name of the chat model.
+    :return: Number of tokens.
+    """
+
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return estimate_tokens(text)
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_prompt_tokens(chunk: str, system_prompt: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Count the prompt tokens of a flashcard request before it is sent.
+
+    :param chunk: Source text chunk.
+    :param system_prompt: System message describing the flashcard format.
+    :param model: Name of the chat model.
+    :return: Number of prompt tokens, including the per-message overhead of the chat format.
+    """
+
+    # Each message costs four tokens of role and separators, and the reply is primed with three more.
+    return count_tokens(system_prompt, model) + count_tokens(chunk, model) + 2 * 4 + 3
+
+
+def describe_error(error: BaseException) -> str:
+    """
+    Turn a generation error into a message for the user.
+
+    :param error: Exception raised while generating flashcards.
+    :return: A short description of what went wrong and, when known, how to fix it.
+    """
+
+    if isinstance(error, LLMAuthenticationError):
+        return f"The API key was rejected: {error}\nAdd or change the API key."
+    if isinstance(error, LLMRateLimitError):
+        return f"The API rate limit or quota was exceeded: {error}"
+    if isinstance(error, LLMInvalidRequestError):
+        return f"The request was rejected: {error}\nCheck the model name or lower the chunk size."
+    if isinstance(error, RETRYABLE_ERRORS):
+        return f"The API could not be reached after several retries: {error}"
+    if isinstance(error, LLMError):
+        return f"The API request failed: {error}"
+
+    return f"{type(error).__name__}: {error}"
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """
+    Split a single paragraph that does not fit into one chunk.
+
+    Sentences are used as split points first; a sentence that is still too long is cut on word boundaries.
+
+    :param text: Paragraph text.
+    :param max_tokens: Token budget of one piece.
+    :return: A list of pieces, each within the token budget.
+    """
+
+    pieces = []
+    for sentence in _SENTENCE_RE.split(text):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+
+        words = []
+        for word in sentence.split():
+            if words and estimate_tokens(" ".join(words + [word])) > max_tokens:
+                pieces.append(" ".join(words))
+                words = []
+            words.append(word)
+        if words:
+            pieces.append(" ".join(words))
+
+    return pieces
+
+
+def _pack(pieces: List[str], separator: str, max_tokens: int) -> List[str]:
+    """
+    Greedily join consecutive pieces into chunks that stay within the token budget.
+
+    :param pieces: Text pieces in source order.
+    :param separator: String placed between joined pieces.
+    :param max_tokens: Token budget of one chunk.
+    :return: A list of chunks in source order.
+    """
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    separator_tokens = estimate_tokens(separator)
+
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + separator_tokens + piece_tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current = []
+            current_tokens = 0
+        if current:
+            current_tokens += separator_tokens
+        current.append(piece)
+        current_tokens += piece_tokens
+
+    if current:
+        chunks.append(separator.join(current))
+
+    return chunks
+
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[str]:
+    """
+    Split the source text into token-bounded chunks on paragraph and sentence boundaries.
+
+    :param text: Source text entered by the user.
+    :param max_tokens: Token budget of one chunk (default: CHUNK_MAX_TOKENS).
+    :return: A list of non-empty chunks in source order.
+    """
+
+    paragraphs = [p.strip() for p in _PARAGRAPH_RE.split(text) if p.strip()]
+
+    pieces = []
+    for paragraph in paragraphs:
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_pack(_split_oversized(paragraph, max_tokens), " ", max_tokens))
+
+    return _pack(pieces, "\n\n", max_tokens)
+
+
+def _messages(chunk: str, system_prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system",
+         "content": system_prompt},
+        {"role": "user",
+         "content": chunk}
+    ]
+
+
+def request_flashcards(chunk: str, model: str, system_prompt: str, backend: Optional[LLMBackend] = None) -> str:
+    """
+    Send one chunk to the chat model and return the raw completion text.
+
+    :param chunk: Source text chunk.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: The content of the completion.
+    """
+
+    backend = backend or get_backend()
+    return backend.complete(_messages(chunk, system_prompt), model)
+
+
+def request_with_retry(chunk: str, model: str, system_prompt: str,
+                       max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_BASE,
+                       metrics: Optional[RequestMetrics] = None, backend: Optional[LLMBackend] = None) -> str:
+    """
+    Call request_flashcards, retrying transient API errors with exponential backoff and jitter.
+
+    Rate limit errors are retried up to MAX_RATE_LIMIT_RETRIES times on top of max_retries,
+    waiting at least as long as the server asked with Retry-After.
+
+    :param chunk: Source text chunk.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param max_retries: Number of retries after the first attempt.
+    :param backoff: Base delay in seconds, doubled after every failed attempt.
+    :param metrics: Measurements to fill with the network and throttle time, retries and completion tokens.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: The raw completion text.
+    """
+
+    failures = {"errors": 0, "rate_limited": 0}
+    while True:
+        started = time.perf_counter()
+        try:
+            response = request_flashcards(chunk, model, system_prompt, backend)
+        except RETRYABLE_ERRORS as error:
+            _record_attempt(metrics, started, error)
+            _wait_before_retry(error, failures, max_retries, backoff, metrics)
+        else:
+            _record_attempt(metrics, started)
+            if metrics is not None:
+                metrics.completion_tokens = count_tokens(response, model)
+            return response
+
+
+def _record_attempt(metrics: Optional[RequestMetrics], started: float, error: Optional[Exception] = None) -> None:
+    """
+    Add the time of one request attempt to its measurements, split into rate limiter waiting and network time.
+
+    :param metrics: Measurements of the request, or None.
+    :param started: perf_counter value at the start of the attempt.
+    :param error: Error the attempt failed with, if any.
+    """
+
+    throttle_s = take_throttle_wait()
+    if metrics is not None:
+        metrics.throttle_s += throttle_s
+        metrics.network_s += time.perf_counter() - started - throttle_s
+        metrics.rate_limited += isinstance(error, LLMRateLimitError)
+
+
+def _wait_before_retry(error: Exception, failures: Dict[str, int], max_retries: int, backoff: float,
+                       metrics: Optional[RequestMetrics] = None) -> None:
+    """
+    Re-raise an error whose retries are exhausted, or sleep before the next attempt.
+
+    :param error: Retryable error of the last attempt.
+    :param failures: Counts of the failed "errors" and "rate_limited" attempts so far, updated in place.
+    :param max_retries: Number of retries of errors other than rate limit errors.
+    :param backoff: Base delay in seconds, doubled after every failed attempt.
+    :param metrics: Measurements of the request whose retries are counted.
+    """
+
+    kind, limit = ("rate_limited", MAX_RATE_LIMIT_RETRIES) if isinstance(error, LLMRateLimitError) \
+        else ("errors", max_retries)
+    if failures[kind] >= limit:
+        raise error
+
+    delay = backoff * 2 ** failures[kind] + random.uniform(0, backoff)
+    failures[kind] += 1
+    if metrics is not None:
+        metrics.retries += 1
+    time.sleep(max(delay, getattr(error, "retry_after", None) or 0.0))
+
+
+def cached_request(chunk: str, model: str, system_prompt: str,
+                   cache: Optional[ResponseCache] = None, max_retries: int = MAX_RETRIES,
+                   metrics: Optional[RequestMetrics] = None, backend: Optional[LLMBackend] = None) -> str:
+    """
+    Return the cached response for a chunk, querying the model only on a cache miss.
+
+    :param chunk: Source text chunk.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param cache: Response cache to use, or None to always query the model.
+    :param max_retries: Number of retries for transient errors.
+    :param metrics: Measurements of the request to fill in.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: The raw completion text.
+    """
+
+    if metrics is not None:
+        metrics.start()
+        metrics.prompt_tokens = count_prompt_tokens(chunk, system_prompt, model)
+
+    if cache is None:
+        return request_with_retry(chunk, model, system_prompt, max_retries, metrics=metrics, backend=backend)
+
+    backend = backend or get_backend()
+    key = cache.make_key(model, system_prompt, chunk, backend.identity)
+    response = cache.get(key)
+    if response is None:
+        response = request_with_retry(chunk, model, system_prompt, max_retries, metrics=metrics, backend=backend)
+        cache.set(key, response)
+    elif metrics is not None:
+        metrics.cached = True
+        metrics.completion_tokens = count_tokens(response, model)
+
+    return response
+
+
+def measured(metrics: Optional[RequestMetrics], fn: Callable, /, *args, **kwargs):
+    """
+    Call fn and record the error it raises, if any, in the request measurements.
+
+    :param metrics: Measurements of the request, or None.
+    :param fn: Function performing the request.
+    :return: The result of fn.
+    """
+
+    try:
+        return fn(*args, **kwargs)
+    except BaseException as error:
+        if metrics is not None:
+            metrics.error = describe_error(error)
+        raise
+
+
+def parse_response(response: str, report: Optional[ParseReport] = None,
+                   metrics: Optional[RequestMetrics] = None, label: str = "") -> List[Dict[str, str]]:
+    """
+    Parse the response of one chunk.
+
+    :param response: Raw completion text.
+    :param report: Report collecting the parse problems.
+    :param metrics: Measurements of the request to fill with the parse time and cards.
+    :param label: Prefix of the problems in the report, e.g. "chunk 3".
+    :return: The flashcard dictionaries, none if the model was unable to generate cards.
+    """
+
+    if response.strip().startswith(UNABLE_MSG):
+        return []
+
+    started = time.perf_counter()
+    chunk_report = ParseReport()
+    cards = list(iter_cards(response, chunk_report))
+    if metrics is not None:
+        metrics.parse_s = time.perf_counter() - started
+        metrics.cards = chunk_report.cards
+    if report is not None:
+        report.merge(chunk_report, label)
+
+    return cards
+
+
+def merge_responses(responses: List[str], report: Optional[ParseReport] = None,
+                    metrics: Optional[List[RequestMetrics]] = None) -> Dict[int, Dict[str, str]]:
+    """
+    Parse the per-chunk responses and merge the cards into one dictionary in source order.
+
+    :param responses: Raw completion texts, ordered like the chunks they were generated from.
+    :param report: Report collecting the parse problems of every chunk.
+    :param metrics: Measurements of the requests, ordered like the responses, to fill with parse times and cards.
+    :return: A dictionary with consecutive integer keys and flashcard data as values.
+    """
+
+    flash_cards = {}
+    for index, response in enumerate(responses):
+        for card in parse_response(response, report, metrics[index] if metrics is not None else None,
+                                   f"chunk {index + 1}"):
+            flash_cards[len(flash_cards)] = card
+
+    return flash_cards
+
+
+def generate_flashcards(text: str,
+                        model: str = DEFAULT_MODEL,
+                        system_prompt: str = SYSTEM_PROMPT,
+                        max_tokens: int = CHUNK_MAX_TOKENS,
+                        max_workers: int = MAX_WORKERS,
+                        max_retries: int = MAX_RETRIES,
+                        cache: Optional[ResponseCache] = None,
+                        report: Optional[ParseReport] = None,
+                        run: Optional[RunMetrics] = None,
+                        backend: Optional[LLMBackend] = None) -> Dict[int, Dict[str, str]]:
+    """
+    Generate flashcards for a text of any length.
+
+    The text is split into chunks which are sent through a bounded pool of worker threads.
+    Cards are merged in source order regardless of which request finishes first.
+    Chunks whose response is already cached are not sent again.
+
+    :param text: Source text entered by the user.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param max_tokens: Token budget of one chunk.
+    :param max_workers: Maximum number of requests in flight.
+    :param max_retries: Number of retries per chunk for transient errors.
+    :param cache: Response cache to use, or None to bypass caching.
+    :param report: Report collecting the parse problems of every chunk.
+    :param run: Measurements of the generation, filled with one RequestMetrics per chunk.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: A dictionary with integer keys and flashcard data as values.
+    """
+
+    chunks = split_into_chunks(text, max_tokens)
+    if not chunks:
+        return {}
+
+    metrics = [run.new_request(index) if run is not None else None for index in range(len(chunks))]
+    backend = backend or get_backend()
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        responses = list(executor.map(
+            lambda chunk, request: measured(request, cached_request, chunk, model, system_prompt, cache,
+                                            max_retries, metrics=request, backend=backend),
+            chunks, metrics
+        ))
+
+    return merge_responses(responses, report, metrics if run is not None else None)
+
+
+def stream_completion(chunk: str, model: str, system_prompt: str,
+                      backend: Optional[LLMBackend] = None) -> Iterator[str]:
+    """
+    Send one chunk to the chat model using the streaming API.
+
+    :param chunk: Source text chunk.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: An iterator over the content deltas of the completion.
+    """
+
+    backend = backend or get_backend()
+    return backend.stream(_messages(chunk, system_prompt), model)
+
+
+def stream_chunk_cards(chunk: str, model: str, system_prompt: str,
+                       cache: Optional[ResponseCache] = None,
+                       max_retries: int = MAX_RETRIES, backoff: float = BACKOFF_BASE,
+                       cancel_event: Optional[threading.Event] = None,
+                       report: Optional[ParseReport] = None,
+                       metrics: Optional[RequestMetrics] = None,
+                       backend: Optional[LLMBackend] = None) -> Iterator[Dict[str, str]]:
+    """
+    Yield the flashcards of one chunk as soon as each of them is complete.
+
+    A cached response is parsed at once. Otherwise the completion is streamed and the full text is stored
+    in the cache when it ends. Transient errors are retried only while no card of the chunk was yielded yet.
+
+    :param chunk: Source text chunk.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param cache: Response cache to use, or None to always query the model.
+    :param max_retries: Number of retries after the first attempt.
+    :param backoff: Base delay in seconds, doubled after every failed attempt.
+    :param cancel_event: Event that stops the stream with CancelledError once it is set.
+    :param report: Report collecting the parse problems of the response that was used.
+    :param metrics: Measurements of the request to fill in; time spent by the consumer of the cards is
+        neither counted as network nor as parse time.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :return: An iterator over flashcard dictionaries.
+    """
+
+    report = report if report is not None else ParseReport()
+    metrics = metrics if metrics is not None else RequestMetrics(0)
+    metrics.start()
+    metrics.prompt_tokens = count_prompt_tokens(chunk, system_prompt, model)
+
+    backend = backend or get_backend()
+    key = cache.make_key(model, system_prompt, chunk, backend.identity) if cache is not None else None
+    response = cache.get(key) if cache is not None else None
+
+    if response is not None:
+        metrics.cached = True
+        metrics.completion_tokens = count_tokens(response, model)
+        if not response.strip().startswith(UNABLE_MSG):
+            started = time.perf_counter()
+            cards = list(iter_cards(response, report))
+            metrics.parse_s = time.perf_counter() - started
+            metrics.cards = len(cards)
+            yield from cards
+        return
+
+    failures = {"errors": 0, "rate_limited": 0}
+    while True:
+        # A failed attempt is parsed again from scratch, so only the last attempt reports its problems.
+        parser = CardStreamParser(ParseReport())
+        parts = []
+        yielded = False
+        try:
+            waiting = time.perf_counter()
+            for delta in stream_completion(chunk, model, system_prompt, backend):
+                received = time.perf_counter()
+                metrics.network_s += received - waiting
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+                parts.append(delta)
+                cards = parser.feed(delta)
+                metrics.parse_s += time.perf_counter() - received
+                for card in cards:
+                    yielded = True
+                    yield card
+                waiting = time.perf_counter()
+            _record_attempt(metrics, time.perf_counter())
+            break
+        except RETRYABLE_ERRORS as error:
+            _record_attempt(metrics, waiting, error)
+            if yielded:
+                raise
+            _wait_before_retry(error, failures, max_retries, backoff, metrics)
+
+    started = time.perf_counter()
+    cards = parser.close()
+    metrics.parse_s += time.perf_counter() - started
+    yield from cards
+    report.merge(parser.report)
+
+    metrics.completion_tokens = count_tokens("".join(parts), model)
+    metrics.cards = parser.report.cards
+
+    if cache is not None:
+        cache.set(key, "".join(parts))
+
+
+class _OrderedEmitter:
+    """Forward cards produced by concurrent chunk workers in source order."""
+
+    def __init__(self, chunks_count: int, on_card: Callable[[Dict[str, str]], None]):
+        """
+        Initialize the emitter.
+
+        :param chunks_count: Number of chunks being generated.
+        :param on_card: Callback receiving every card in source order.
+        """
+
+        self.on_card = on_card
+        self._buffers = [[] for _ in range(chunks_count)]
+        self._done = [False] * chunks_count
+        self._current = 0
+        self._lock = threading.Lock()
+
+    def add(self, index: int, card: Dict[str, str]) -> None:
+        """Queue a card of the given chunk and emit everything that is next in order."""
+
+        with self._lock:
+            self._buffers[index].append(card)
+            self._flush()
+
+    def finish(self, index: int) -> None:
+        """Mark the given chunk as finished and emit everything that is next in order."""
+
+        with self._lock:
+            self._done[index] = True
+            self._flush()
+
+    def _flush(self) -> None:
+        while self._current < len(self._buffers):
+            buffer = self._buffers[self._current]
+            for card in buffer:
+                self.on_card(card)
+            buffer.clear()
+
+            if not self._done[self._current]:
+                return
+            self._current += 1
+
+
+def generate_flashcards_streaming(text: str,
+                                  on_card: Callable[[Dict[str, str]], None],
+                                  model: str = DEFAULT_MODEL,
+                                  system_prompt: str = SYSTEM_PROMPT,
+                                  max_tokens: int = CHUNK_MAX_TOKENS,
+                                  max_workers: int = MAX_WORKERS,
+                                  max_retries: int = MAX_RETRIES,
+                                  cache: Optional[ResponseCache] = None,
+                                  cancel_event: Optional[threading.Event] = None,
+                                  report: Optional[ParseReport] = None,
+                                  run: Optional[RunMetrics] = None,
+                                  backend: Optional[LLMBackend] = None,
+                                  coverage: Optional["PendingCoverage"] = None,
+                                  skip_covered: bool = True,
+                                  skipped: Optional[List[int]] = None) -> Dict[int, Dict[str, str]]:
+    """
+    Generate flashcards for a text of any length, reporting every card as soon as it is complete.
+
+    Chunks are streamed concurrently; cards of later chunks are held back until all earlier chunks
+    are finished, so on_card always sees them in source order. on_card is called from worker threads.
+    With a coverage index, chunks that already produced cards are not sent again and every fully generated
+    chunk is added to the pending coverage, to be recorded once its cards are delivered.
+
+    :param text: Source text entered by the user.
+    :param on_card: Callback receiving every flashcard dictionary.
+    :param model: Name of the chat model.
+    :param system_prompt: System message describing the flashcard format.
+    :param max_tokens: Token budget of one chunk.
+    :param max_workers: Maximum number of requests in flight.
+    :param max_retries: Number of retries per chunk for transient errors.
+    :param cache: Response cache to use, or None to bypass caching.
+    :param cancel_event: Event that stops the generation with CancelledError once it is set.
+    :param report: Report collecting the parse problems of every chunk.
+    :param run: Measurements of the generation, filled with one RequestMetrics per chunk.
+    :param backend: Chat completion backend, or None for the one configured in config.json.
+    :param coverage: Coverage of the document being generated, or None to not use the coverage index.
+    :param skip_covered: Skip the chunks covered by the index; with False they are generated again.
+    :param skipped: List receiving the indexes of the skipped chunks.
+    :return: A dictionary with all generated flashcards, like generate_flashcards.
+    """
+
+    chunks = split_into_chunks(text, max_tokens)
+    if not chunks:
+        return {}
+
+    flash_cards = {}
+    backend = backend or get_backend()
+    covered = coverage.find_many(chunks) if coverage is not None and skip_covered else {}
+    if skipped is not None:
+        skipped.extend(sorted(covered))
+
+    def collect(card):
+        flash_cards[len(flash_cards)] = card
+        on_card(card)
+
+    emitter = _OrderedEmitter(len(chunks), collect)
+
+    def generate_chunk(index, chunk, metrics):
+        chunk_report = ParseReport()
+        chunk_cards = []
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError()
+            for card in stream_chunk_cards(chunk, model, system_prompt, cache, max_retries,
+                                           cancel_event=cancel_event, report=chunk_report, metrics=metrics,
+                                           backend=backend):
+                chunk_cards.append((card["question"], card["answer"]))
+                emitter.add(index, card)
+            if coverage is not None:
+                coverage.add(chunk, chunk_cards)
+        finally:
+            emitter.finish(index)
+            if report is not None:
+                report.merge(chunk_report, f"chunk {index + 1}")
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        futures = []
+        for index, chunk in enumerate(chunks):
+            if index in covered:
+                emitter.finish(index)
+                continue
+            metrics = run.new_request(index) if run is not None else None
+            futures.append(executor.submit(measured, metrics, generate_chunk, index, chunk, metrics))
+        for future in futures:
+            future.result()
+
+    return flash_cards
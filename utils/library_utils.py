@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import zipfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.file_utils import get_package_dir, get_library_cache_dir
+
+PAGE_SIZE = 50
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+MMAP_BYTES = 256 * 1024 * 1024
+COLLECTION_NAMES = ("collection.anki21", "collection.anki2")
+CATALOG_FILENAME = "catalog.sqlite"
+
+_FIELD_SEPARATOR = "\x1f"
+
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    decks TEXT NOT NULL,
+    notes INTEGER NOT NULL
+);
+"""
+
+
+class PackageInfo:
+    """Summary of one .apkg file of the library."""
+
+    def __init__(self, path: str, decks: List[str], notes: int, size: int, mtime: float):
+        """
+        Initialize the summary.
+
+        :param path: Path of the .apkg file.
+        :param decks: Names of the decks holding the cards of the package.
+        :param notes: Number of notes in the package.
+        :param size: Size of the file in bytes.
+        :param mtime: Modification time of the file.
+        """
+
+        self.path = path
+        self.decks = decks
+        self.notes = notes
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def title(self) -> str:
+        """Deck names of the package, or its file name if it has no cards."""
+
+        return ", ".join(self.decks) or os.path.splitext(os.path.basename(self.path))[0]
+
+
+class NoteRow:
+    """One note read from a package."""
+
+    def __init__(self, note_id: int, guid: str, fields: List[str]):
+        """
+        Initialize the note.
+
+        :param note_id: ID of the note in the package's collection.
+        :param guid: GUID of the note.
+        :param fields: Field values, the question and the answer for the notes written by this application.
+        """
+
+        self.note_id = note_id
+        self.guid = guid
+        self.fields = fields
+
+    @property
+    def question(self) -> str:
+        """The first field of the note."""
+
+        return self.fields[0] if self.fields else ""
+
+    @property
+    def answer(self) -> str:
+        """The second field of the note."""
+
+        return self.fields[1] if len(self.fields) > 1 else ""
+
+
+def _like_pattern(search: str) -> str:
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class DeckPackage:
+    """
+    An .apkg file opened for reading its notes page by page.
+
+    Only the zip central directory is read when the package is opened. SQLite cannot query a database
+    stored inside a zip archive, so the collection member is extracted once into the library cache, keyed
+    by the path, size and modification time of the package, and then queried in place through a read-only,
+    memory-mapped connection. Media files are never extracted.
+    """
+
+    def __init__(self, path: str, cache_dir: str):
+        """
+        Open a package.
+
+        :param path: Path of the .apkg file.
+        :param cache_dir: Directory of the extracted collections.
+        :raises ValueError: If the file has no Anki collection.
+        """
+
+        self.path = path
+        self.cache_dir = cache_dir
+
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+        with zipfile.ZipFile(path) as package:
+            names = set(package.namelist())
+        self.collection = next((name for name in COLLECTION_NAMES if name in names), None)
+        if self.collection is None:
+            raise ValueError(f"{path} is not an Anki package")
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _cache_path(self) -> str:
+        key = hashlib.sha1(f"{os.path.abspath(self.path)}|{self.size}|{self.mtime}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.anki2")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the extracted collection, extracting it on first use; called with the lock held."""
+
+        if self._conn is not None:
+            return self._conn
+
+        cache_path = self._cache_path()
+        if not os.path.exists(cache_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with zipfile.ZipFile(self.path) as package, package.open(self.collection) as src, \
+                    open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, cache_path)
+            trim_cache(self.cache_dir)
+        else:
+            # Recently used collections are the last to be evicted.
+            os.utime(cache_path)
+
+        self._conn = sqlite3.connect(f"file:{cache_path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+        return self._conn
+
+    def _query(self, query: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._connection().execute(query, params).fetchall()
+
+    def deck_names(self) -> List[str]:
+        """
+        Get the names of the decks that hold cards of the package.
+
+        :return: Deck names in alphabetical order.
+        """
+
+        decks = json.loads(self._query("SELECT decks FROM col")[0][0] or "{}")
+        used = {str(deck_id) for deck_id, in self._query("SELECT DISTINCT did FROM cards")}
+        return sorted(deck["name"] for deck_id, deck in decks.items() if deck_id in used)
+
+    def count(self, search: str = "") -> int:
+        """
+        Count the notes of the package.
+
+        :param search: Text the notes must contain, case-insensitive for ASCII letters; empty for all notes.
+        :return: Number of matching notes.
+        """
+
+        if search:
+            return self._query("SELECT COUNT(*) FROM notes WHERE flds LIKE ? ESCAPE '\\'",
+                               (_like_pattern(search),))[0][0]
+        return self._query("SELECT COUNT(*) FROM notes")[0][0]
+
+    def notes(self, offset: int = 0, limit: int = PAGE_SIZE, search: str = "") -> List[NoteRow]:
+        """
+        Read one page of notes, in the order they were added.
+
+        :param offset: Number of matching notes to skip.
+        :param limit: Maximum number of notes to return.
+        :param search: Text the notes must contain, case-insensitive for ASCII letters; empty for all notes.
+        :return: The notes of the page.
+        """
+
+        if search:
+            rows = self._query("SELECT id, guid, flds FROM notes WHERE flds LIKE ? ESCAPE '\\' "
+                               "ORDER BY id LIMIT ? OFFSET ?", (_like_pattern(search), limit, offset))
+        else:
+            rows = self._query("SELECT id, guid, flds FROM notes ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
+
+        return [NoteRow(note_id, guid, fields.split(_FIELD_SEPARATOR)) for note_id, guid, fields in rows]
+
+    def update_notes(self, edits: Dict[int, Tuple[str, str]]) -> int:
+        """
+        Change the question and answer of notes and rewrite the package.
+
+        The notes keep their IDs and GUIDs and get a new modification time and sort field checksum, so importing
+        the package into Anki again updates the existing notes. The file is replaced atomically, and later reads see the new version.
+
+        :param edits: New question and answer by note ID.
+        :return: Number of notes changed.
+        """
+
+        # Imported here: the packaging engine and its process pool are not needed to browse the library.
+        from utils.bulk_package_utils import field_checksum
+
+        with self._lock:
+            self._connection()
+            self._conn.close()
+            self._conn = None
+
+            tmp_db = f"{self.path}.{threading.get_ident()}.db.tmp"
+            tmp_package = f"{self.path}.{threading.get_ident()}.tmp"
+            shutil.copyfile(self._cache_path(), tmp_db)
+            try:
+                conn = sqlite3.connect(tmp_db)
+                try:
+                    modified = int(time.time())
+                    changed = 0
+                    for note_id, (question, answer) in edits.items():
+                        row = conn.execute("SELECT flds FROM notes WHERE id = ?", (note_id,)).fetchone()
+                        if row is None:
+                            continue
+                        fields = row[0].split(_FIELD_SEPARATOR)
+                        fields[:2] = [question, answer]
+                        # Anki finds duplicates by the checksum of the sort field, so it changes with the field.
+                        conn.execute("UPDATE notes SET flds = ?, sfld = ?, csum = ?, mod = ?, usn = -1 WHERE id = ?",
+                                     (_FIELD_SEPARATOR.join(fields), question, field_checksum(question), modified,
+                                      note_id))
+                        changed += 1
+                    conn.commit()
+                finally:
+                    conn.close()
+
+                with zipfile.ZipFile(self.path) as src, \
+                        zipfile.ZipFile(tmp_package, "w", zipfile.ZIP_DEFLATED) as dst:
+                    for info in src.infolist():
+                        if info.filename == self.collection:
+                            dst.write(tmp_db, info.filename)
+                        else:
+                            dst.writestr(info, src.read(info))
+                os.replace(tmp_package, self.path)
+            finally:
+                for path in (tmp_db, tmp_package):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            stat = os.stat(self.path)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+
+        return changed
+
+    def close(self) -> None:
+        """Close the connection to the extracted collection."""
+
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def trim_cache(cache_dir: str, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    """
+    Remove the least recently used extracted collections until the cache fits its size limit.
+
+    :param cache_dir: Directory of the extracted collections.
+    :param max_bytes: Maximum total size of the extracted collections.
+    """
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".anki2"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open on a platform that does not allow removing open files; it is evicted later.
+            continue
+        total -= size
+
+
+class DeckLibrary:
+    """
+    The .apkg files of a directory with their decks and note counts.
+
+    The counts are kept in a catalog next to the extracted collections and read again only for files whose
+    size or modification time changed, so listing hundreds of packages costs one stat call per file.
+    """
+
+    def __init__(self, package_dir: str, cache_dir: str):
+        """
+        Open (or create) the catalog of a package directory.
+
+        :param package_dir: Directory with the packages.
+        :param cache_dir: Directory of the catalog and the extracted collections.
+        """
+
+        self.package_dir = package_dir
+        self.cache_dir = cache_dir
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, CATALOG_FILENAME), check_same_thread=False)
+        self._conn.executescript(_CATALOG_SCHEMA)
+
+    def packages(self, search: str = "") -> List[PackageInfo]:
+        """
+        List the packages of the directory.
+
+        :param search: Text the deck names or file names must contain, case-insensitive; empty for all packages.
+        :return: The packages sorted by file name.
+        """
+
+        if not os.path.isdir(self.package_dir):
+            return []
+
+        with self._lock:
+            recorded = {path: (mtime, size, decks, notes) for path, mtime, size, decks, notes in
+                        self._conn.execute("SELECT path, mtime, size, decks, notes FROM packages")}
+
+            packages = []
+            for entry in sorted(os.scandir(self.package_dir), key=lambda entry: entry.name):
+                if not entry.name.endswith(".apkg") or not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                row = recorded.pop(entry.path, None)
+                if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+                    info = PackageInfo(entry.path, json.loads(row[2]), row[3], stat.st_size, stat.st_mtime)
+                else:
+                    info = self._read_info(entry.path)
+                    if info is None:
+                        continue
+                packages.append(info)
+
+            for path in recorded:
+                self._conn.execute("DELETE FROM packages WHERE path = ?", (path,))
+            self._conn.commit()
+
+        search = search.lower()
+        return [info for info in packages
+                if not search or search in info.title.lower() or search in os.path.basename(info.path).lower()]
+
+    def _read_info(self, path: str) -> Optional[PackageInfo]:
+        """Read the decks and note count of a package into the catalog; called with the lock held."""
+
+        try:
+            package = DeckPackage(path, self.cache_dir)
+            try:
+                info = PackageInfo(path, package.deck_names(), package.count(), package.size, package.mtime)
+            finally:
+                package.close()
+        except (OSError, ValueError, zipfile.BadZipFile, sqlite3.DatabaseError) as error:
+            print(f"Could not read {path}: {error}")
+            return None
+
+        self._conn.execute("INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)",
+                           (path, info.mtime, info.size, json.dumps(info.decks), info.notes))
+        return info
+
+    def open(self, path: str) -> DeckPackage:
+        """
+        Open a package for browsing.
+
+        :param path: Path of the .apkg file.
+        :return: The opened package; close it when done.
+        """
+
+        return DeckPackage(path, self.cache_dir)
+
+
+_default_library = None
+_default_library_lock = threading.Lock()
+
+
+def get_deck_library() -> DeckLibrary:
+    """
+    Get the library of the deck packages directory, opening it on first use.
+
+    :return: The shared DeckLibrary instance.
+    """
+
+    global _default_library
+
+    with _default_library_lock:
+        if _default_library is None:
+            _default_library = DeckLibrary(get_package_dir(), get_library_cache_dir())
+        return _default_library
@@ -0,0 +1,649 @@
+import re
+import json
+import time
+import zlib
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Mapping, Optional
+
+from utils.settings_utils import HTTP_TIMEOUT, get_settings
+
+OPENAI_BACKEND = "openai"
+HTTP_BACKEND = "http"
+FAKE_BACKEND = "fake"
+BACKENDS = (OPENAI_BACKEND, HTTP_BACKEND, FAKE_BACKEND)
+
+FAKE_LATENCY = 0.5
+FAKE_TOKEN_LATENCY = 0.0
+FAKE_ERROR_RATE = 0.0
+FAKE_CARDS_PER_CHUNK = 5
+
+# Headers of the OpenAI API (and compatible servers) announcing the rate limits of the account.
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "limit_requests",
+    "x-ratelimit-remaining-requests": "remaining_requests",
+    "x-ratelimit-reset-requests": "reset_requests",
+    "x-ratelimit-limit-tokens": "limit_tokens",
+    "x-ratelimit-remaining-tokens": "remaining_tokens",
+    "x-ratelimit-reset-tokens": "reset_tokens",
+}
+
+if TYPE_CHECKING:
+    import requests
+
+Messages = List[Dict[str, str]]
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the reset time of a rate limit header.
+
+    :param value: A number of seconds or a duration such as "1s", "6m0s" or "250ms".
+    :return: The duration in seconds, or None if the value cannot be parsed.
+    """
+
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = _DURATION_RE.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value.strip():
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header.
+
+    :param value: A number of seconds or an HTTP date.
+    :return: The number of seconds to wait, or None if the value cannot be parsed.
+    """
+
+    seconds = parse_duration(value)
+    if seconds is not None or not value:
+        return seconds
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rate_limits(headers: Mapping[str, str]) -> Dict[str, float]:
+    """
+    Read the rate limit headers of a response.
+
+    :param headers: Response headers.
+    :return: The values found among "limit_requests", "remaining_requests", "reset_requests", "limit_tokens",
+        "remaining_tokens", "reset_tokens" (seconds) and "retry_after" (seconds).
+    """
+
+    limits = {}
+    for header, value in headers.items():
+        header = header.lower()
+        if header in RATE_LIMIT_HEADERS:
+            number = parse_duration(value)
+            if number is not None:
+                limits[RATE_LIMIT_HEADERS[header]] = number
+        elif header == "retry-after":
+            retry_after = parse_retry_after(value)
+            if retry_after is not None:
+                limits["retry_after"] = retry_after
+    return limits
+
+
+class LLMError(Exception):
+    """Raised when a chat completion backend fails."""
+
+
+class LLMRetryableError(LLMError):
+    """Transient failure (connection problem, overloaded server, rate limit) worth retrying."""
+
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        """
+        Initialize the error.
+
+        :param message: Description of the failure.
+        :param retry_after: Seconds the server asked to wait before the next request, if it said so.
+        """
+
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMRetryableError):
+    """The backend refused the request because of a rate limit or an exhausted quota."""
+
+
+class LLMAuthenticationError(LLMError):
+    """The backend rejected the API key."""
+
+
+class LLMInvalidRequestError(LLMError):
+    """The backend rejected the request itself, e.g. an unknown model or a too long prompt."""
+
+
+class LLMBackend:
+    """Chat completion service the flashcards are generated with."""
+
+    name = ""
+    # Called with the parsed rate limit headers of every response; set by the rate limiter.
+    on_rate_limits: Optional[Callable[[Dict[str, float]], None]] = None
+
+    def _report_rate_limits(self, headers: Optional[Mapping[str, str]]) -> Dict[str, float]:
+        """
+        Parse the rate limit headers of a response and pass them to on_rate_limits.
+
+        :param headers: Response headers, or None if the response had none.
+        :return: The parsed limits.
+        """
+
+        limits = parse_rate_limits(headers or {})
+        if limits and self.on_rate_limits is not None:
+            self.on_rate_limits(limits)
+        return limits
+
+    @property
+    def identity(self) -> str:
+        """The service the completions come from; responses of different services are cached apart."""
+
+        return self.name
+
+    def complete(self, messages: Messages, model: str) -> str:
+        """
+        Request a chat completion.
+
+        :param messages: Chat messages with "role" and "content" keys.
+        :param model: Name of the chat model.
+        :return: The content of the completion.
+        """
+
+        raise NotImplementedError
+
+    def stream(self, messages: Messages, model: str) -> Iterator[str]:
+        """
+        Request a chat completion and receive it piece by piece.
+
+        :param messages: Chat messages with "role" and "content" keys.
+        :param model: Name of the chat model.
+        :return: An iterator over the content deltas of the completion.
+        """
+
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI API, with the API key passed to every request instead of set globally."""
+
+    name = OPENAI_BACKEND
+
+    def __init__(self, api_key: str, organization: Optional[str] = None, timeout: float = HTTP_TIMEOUT):
+        """
+        Initialize the backend.
+
+        :param api_key: OpenAI API key.
+        :param organization: OpenAI organization id, if any.
+        :param timeout: Timeout of one request in seconds.
+        """
+
+        self.api_key = api_key
+        self.organization = organization
+        self.timeout = timeout
+
+    def _create(self, messages: Messages, model: str, stream: bool) -> Any:
+        import openai
+
+        try:
+            return openai.ChatCompletion.create(model=model, messages=messages, stream=stream,
+                                                api_key=self.api_key, organization=self.organization,
+                                                request_timeout=self.timeout)
+        except openai.error.OpenAIError as error:
+            raise self._translate(error) from error
+
+    def _translate(self, error: Exception) -> LLMError:
+        import openai
+
+        # The openai package only exposes the response headers of failed requests.
+        retry_after = self._report_rate_limits(getattr(error, "headers", None)).get("retry_after")
+
+        if isinstance(error, openai.error.AuthenticationError):
+            return LLMAuthenticationError(str(error))
+        if isinstance(error, openai.error.RateLimitError):
+            return LLMRateLimitError(str(error), retry_after)
+        if isinstance(error, openai.error.InvalidRequestError):
+            return LLMInvalidRequestError(str(error))
+        if isinstance(error, (openai.error.APIError, openai.error.APIConnectionError,
+                              openai.error.ServiceUnavailableError, openai.error.Timeout, openai.error.TryAgain)):
+            return LLMRetryableError(str(error), retry_after)
+        return LLMError(str(error))
+
+    def complete(self, messages: Messages, model: str) -> str:
+        return self._create(messages, model, False)["choices"][0]["message"]["content"]
+
+    def stream(self, messages: Messages, model: str) -> Iterator[str]:
+        import openai
+
+        events = self._create(messages, model, True)
+        try:
+            for event in events:
+                delta = event["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except openai.error.OpenAIError as error:
+            raise self._translate(error) from error
+
+
+class HTTPBackend(LLMBackend):
+    """Any server implementing the OpenAI chat completions endpoint, e.g. a local llama.cpp or vLLM server."""
+
+    name = HTTP_BACKEND
+
+    def __init__(self, api_base: str, api_key: str = "", timeout: float = HTTP_TIMEOUT, pool_size: int = 8):
+        """
+        Initialize the backend.
+
+        :param api_base: Base URL of the API, e.g. "http://localhost:8000/v1".
+        :param api_key: Bearer token sent to the server, if it needs one.
+        :param timeout: Read timeout of one request in seconds.
+        :param pool_size: Maximum number of kept-alive connections.
+        """
+
+        import requests
+
+        self.api_base = api_base.rstrip('/')
+        self.url = f"{self.api_base}/chat/completions"
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    @property
+    def identity(self) -> str:
+        return f"{self.name}:{self.api_base}"
+
+    def _post(self, messages: Messages, model: str, stream: bool) -> "requests.Response":
+        import requests
+
+        try:
+            response = self.session.post(self.url, json={"model": model, "messages": messages, "stream": stream},
+                                         timeout=self.timeout, stream=stream)
+        except requests.exceptions.RequestException as error:
+            raise LLMRetryableError(f"{self.url}: {error}") from error
+
+        limits = self._report_rate_limits(response.headers)
+        if response.status_code >= 400:
+            raise self._error_for(response, limits.get("retry_after"))
+        return response
+
+    @staticmethod
+    def _error_for(response: "requests.Response", retry_after: Optional[float] = None) -> LLMError:
+        try:
+            message = response.json()["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text[:200]
+
+        message = f"HTTP {response.status_code}: {message}"
+        if response.status_code in (401, 403):
+            return LLMAuthenticationError(message)
+        if response.status_code == 429:
+            return LLMRateLimitError(message, retry_after)
+        if response.status_code >= 500 or response.status_code == 408:
+            return LLMRetryableError(message, retry_after)
+        return LLMInvalidRequestError(message)
+
+    def complete(self, messages: Messages, model: str) -> str:
+        try:
+            return self._post(messages, model, False).json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError) as error:
+            raise LLMRetryableError(f"{self.url}: malformed response ({error})") from error
+
+    def stream(self, messages: Messages, model: str) -> Iterator[str]:
+        import requests
+
+        with self._post(messages, model, True) as response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+            except requests.exceptions.RequestException as error:
+                raise LLMRetryableError(f"{self.url}: {error}") from error
+            except (ValueError, KeyError, IndexError) as error:
+                raise LLMRetryableError(f"{self.url}: malformed stream ({error})") from error
+
+
+def fake_completion(messages: Messages, cards: int = FAKE_CARDS_PER_CHUNK) -> str:
+    """
+    Build a deterministic "Front:/Back:" completion from the last user message.
+
+    :param messages: Chat messages with "role" and "content" keys.
+    :param cards: Maximum number of cards; one card is made from each of the first sentences.
+    :return: The completion text.
+    """
+
+    text = next((message["content"] for message in reversed(messages) if message["role"] == "user"), "")
+    sentences = [sentence.strip() for sentence in text.replace("\n", " ").split(". ") if sentence.strip()]
+
+    lines = []
+    for sentence in sentences[:cards]:
+        words = sentence.split()
+        lines.append(f"Front: What does the text say about \"{' '.join(words[:4])}\"?")
+        lines.append(f"Back: {sentence.rstrip('.')}.")
+        lines.append("")
+
+    return "\n".join(lines) if lines else "Unable to generate flashcards"
+
+
+class FakeBackend(LLMBackend):
+    """
+    Offline stand-in for a chat model with configurable latency and error rate.
+
+    Completions and failures are deterministic: they depend only on the seed, the prompt and how many times
+    the same prompt was requested before, so a load test replays identically.
+    """
+
+    name = FAKE_BACKEND
+
+    def __init__(self, latency: float = FAKE_LATENCY, token_latency: float = FAKE_TOKEN_LATENCY,
+                 error_rate: float = FAKE_ERROR_RATE, seed: int = 0, cards: int = FAKE_CARDS_PER_CHUNK,
+                 requests_per_minute: int = 0):
+        """
+        Initialize the backend.
+
+        :param latency: Seconds before the first token of every response.
+        :param token_latency: Seconds per streamed token (a token is about four characters).
+        :param error_rate: Probability that a request fails with a retryable or rate limit error.
+        :param seed: Seed of the failures.
+        :param cards: Maximum number of cards per completion.
+        :param requests_per_minute: Simulated account limit; requests beyond it in any 60 second window are
+            refused with a rate limit error and a retry delay. 0 for no limit.
+        """
+
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.cards = cards
+        self.requests_per_minute = requests_per_minute
+
+        self._attempts: Dict[int, int] = {}
+        self._window: deque = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self._window and now - self._window[0] >= 60:
+            self._window.popleft()
+
+    def rate_limit_headers(self) -> Dict[str, str]:
+        """
+        Describe the simulated limit like the OpenAI API does.
+
+        :return: The x-ratelimit-*-requests headers, empty without a limit.
+        """
+
+        if not self.requests_per_minute:
+            return {}
+
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            remaining = max(0, self.requests_per_minute - len(self._window))
+            reset = 60 - (now - self._window[0]) if self._window else 0.0
+
+        return {"x-ratelimit-limit-requests": str(self.requests_per_minute),
+                "x-ratelimit-remaining-requests": str(remaining),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+
+    def _admit(self) -> None:
+        """
+        Count a request against the simulated limit.
+
+        :raise LLMRateLimitError: If the limit is reached, with the seconds until a request is allowed again.
+        """
+
+        if not self.requests_per_minute:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            retry_after = None
+            if len(self._window) >= self.requests_per_minute:
+                retry_after = 60 - (now - self._window[0])
+            else:
+                self._window.append(now)
+
+        self._report_rate_limits(self.rate_limit_headers())
+        if retry_after is not None:
+            raise LLMRateLimitError("fake backend: requests per minute limit reached", retry_after)
+
+    def _begin(self, messages: Messages) -> str:
+        """
+        Simulate the start of a request: wait for the first token and maybe fail.
+
+        :param messages: Chat messages of the request.
+        :return: The completion text.
+        """
+
+        self._admit()
+
+        prompt_hash = zlib.crc32(json.dumps(messages, sort_keys=True).encode("utf-8"))
+        with self._lock:
+            attempt = self._attempts[prompt_hash] = self._attempts.get(prompt_hash, 0) + 1
+
+        rng = random.Random(f"{self.seed}:{prompt_hash}:{attempt}")
+        time.sleep(self.latency)
+
+        if rng.random() < self.error_rate:
+            if rng.random() < 0.5:
+                raise LLMRateLimitError("fake backend: rate limit reached")
+            raise LLMRetryableError("fake backend: server overloaded")
+
+        return fake_completion(messages, self.cards)
+
+    def complete(self, messages: Messages, model: str) -> str:
+        completion = self._begin(messages)
+        time.sleep(self.token_latency * ((len(completion) + 3) // 4))
+        return completion
+
+    def stream(self, messages: Messages, model: str) -> Iterator[str]:
+        completion = self._begin(messages)
+        for start in range(0, len(completion), 4):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield completion[start:start + 4]
+
+
+def _fake_server_handler(backend: FakeBackend) -> type:
+    """
+    Create the request handler class of a FakeLLMServer.
+
+    http.server is only imported here: it is slow to import and the application never needs it.
+
+    :param backend: Fake model answering the requests.
+    :return: A BaseHTTPRequestHandler subclass.
+    """
+
+    from http.server import BaseHTTPRequestHandler
+
+    class FakeServerHandler(BaseHTTPRequestHandler):
+        """OpenAI-compatible chat completions endpoint answered by a FakeBackend."""
+
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately; without this every response waits for a delayed ACK.
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages, model = body.get("messages", []), body.get("model", "fake")
+
+            try:
+                if body.get("stream"):
+                    deltas = self.backend.stream(messages, model)
+                    first = next(deltas, None)
+                else:
+                    completion = self.backend.complete(messages, model)
+            except LLMError as error:
+                status = 429 if isinstance(error, LLMRateLimitError) else 503
+                headers = {"Retry-After": f"{error.retry_after:.3f}"} if getattr(error, "retry_after", None) else {}
+                self._send_json(status, {"error": {"message": str(error), "type": "fake_error"}}, headers)
+                return
+
+            if not body.get("stream"):
+                self._send_json(200, {"object": "chat.completion", "model": model,
+                                      "choices": [{"index": 0, "finish_reason": "stop",
+                                                   "message": {"role": "assistant", "content": completion}}]})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self._send_rate_limit_headers()
+            self.end_headers()
+            self.close_connection = True
+            for delta in self._chain(first, deltas):
+                event = {"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        @staticmethod
+        def _chain(first: Optional[str], deltas: Iterator[str]) -> Iterator[str]:
+            if first is not None:
+                yield first
+            yield from deltas
+
+        def _send_rate_limit_headers(self, extra: Optional[Dict[str, str]] = None) -> None:
+            for header, value in dict(self.backend.rate_limit_headers(), **(extra or {})).items():
+                self.send_header(header, value)
+
+        def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self._send_rate_limit_headers(headers)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    FakeServerHandler.backend = backend
+    return FakeServerHandler
+
+
+class FakeLLMServer:
+    """Local HTTP server speaking the OpenAI chat completions protocol, for load tests through HTTPBackend."""
+
+    def __init__(self, backend: Optional[FakeBackend] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Create the server; port 0 picks a free port.
+
+        :param backend: Fake model answering the requests.
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+
+        from http.server import ThreadingHTTPServer
+
+        self.httpd = ThreadingHTTPServer((host, port), _fake_server_handler(backend or FakeBackend()))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_base(self) -> str:
+        """Base URL to pass to HTTPBackend."""
+
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        """Serve requests on a background thread."""
+
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve requests on the calling thread until interrupted."""
+
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def create_backend(config: Dict[str, Any]) -> LLMBackend:
+    """
+    Create the backend described by the application configuration.
+
+    :param config: Settings from config.json: "BACKEND" (openai, http or fake), "API_KEY", "API_BASE",
+        "REQUEST_TIMEOUT" and, for the fake backend, "FAKE_LATENCY", "FAKE_ERROR_RATE", "FAKE_SEED" and "FAKE_RPM".
+    :return: The configured backend.
+    """
+
+    backend = config.get("BACKEND") or OPENAI_BACKEND
+    timeout = float(config.get("REQUEST_TIMEOUT") or HTTP_TIMEOUT)
+
+    if backend == OPENAI_BACKEND:
+        return OpenAIBackend(config.get("API_KEY", ""), timeout=timeout)
+    if backend == HTTP_BACKEND:
+        if not config.get("API_BASE"):
+            raise ValueError("The http backend needs an API_BASE URL")
+        return HTTPBackend(config["API_BASE"], config.get("API_KEY", ""), timeout=timeout)
+    if backend == FAKE_BACKEND:
+        return FakeBackend(latency=float(config.get("FAKE_LATENCY", FAKE_LATENCY)),
+                           error_rate=float(config.get("FAKE_ERROR_RATE", FAKE_ERROR_RATE)),
+                           seed=int(config.get("FAKE_SEED", 0)),
+                           requests_per_minute=int(config.get("FAKE_RPM", 0)))
+
+    raise ValueError(f"Unknown backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+
+
+_default_backend = None
+_default_backend_version = None
+_default_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """
+    Get the backend configured in config.json, recreating it when the settings change.
+
+    The backend goes through the application-wide rate limiter.
+
+    :return: The shared LLMBackend instance.
+    """
+
+    global _default_backend, _default_backend_version
+
+    # Imported here because the rate limit module imports the backend classes of this one.
+    from utils.rate_limit_utils import rate_limited
+
+    settings = get_settings()
+    config = settings.values()
+    with _default_backend_lock:
+        if _default_backend is None or settings.version != _default_backend_version:
+            _default_backend = rate_limited(create_backend(config))
+            _default_backend_version = settings.version
+        return _default_backend
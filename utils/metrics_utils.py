@@ -0,0 +1,333 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, IO, List, Optional
+
+from utils.file_utils import get_metrics_path
+from utils.llm_utils import OPENAI_BACKEND, FAKE_BACKEND
+
+# USD per 1000 prompt and completion tokens.
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    model TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    wall_s REAL NOT NULL,
+    chunk_tokens INTEGER NOT NULL,
+    workers INTEGER NOT NULL,
+    error TEXT,
+    backend TEXT NOT NULL DEFAULT 'openai'
+);
+CREATE TABLE IF NOT EXISTS requests (
+    run_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    cached INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    queue_s REAL NOT NULL,
+    network_s REAL NOT NULL,
+    parse_s REAL NOT NULL,
+    retries INTEGER NOT NULL,
+    cards INTEGER NOT NULL,
+    error TEXT,
+    throttle_s REAL NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, chunk_index)
+);
+"""
+
+# Columns added after the first release, with their definition for databases created before.
+_ADDED_RUN_COLUMNS = {"backend": "TEXT NOT NULL DEFAULT 'openai'"}
+_ADDED_REQUEST_COLUMNS = {"throttle_s": "REAL NOT NULL DEFAULT 0", "rate_limited": "INTEGER NOT NULL DEFAULT 0"}
+
+_RUN_COLUMNS = ("run_id", "source", "model", "started_at", "wall_s", "chunk_tokens", "workers", "error", "backend")
+
+_REQUEST_COLUMNS = ("chunk_index", "started_at", "cached", "prompt_tokens", "completion_tokens",
+                    "queue_s", "network_s", "parse_s", "retries", "cards", "error", "throttle_s", "rate_limited")
+_SUMMED_COLUMNS = ("prompt_tokens", "completion_tokens", "queue_s", "network_s", "parse_s", "retries", "cards",
+                   "throttle_s", "rate_limited")
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int,
+                  backend: str = OPENAI_BACKEND) -> Optional[float]:
+    """
+    Estimate the price of a request.
+
+    :param model: Name of the chat model; dated snapshots use the price of their base model.
+    :param prompt_tokens: Number of tokens sent.
+    :param completion_tokens: Number of tokens received.
+    :param backend: Name of the backend that answered; only OpenAI prices are known.
+    :return: The price in USD, 0 for the fake backend, or None for an unknown price.
+    """
+
+    if backend == FAKE_BACKEND:
+        return 0.0
+    if backend != OPENAI_BACKEND:
+        return None
+
+    name = next((name for name in sorted(MODEL_PRICES, key=len, reverse=True) if model.startswith(name)), None)
+    if name is None:
+        return None
+
+    prompt_price, completion_price = MODEL_PRICES[name]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class RequestMetrics:
+    """Measurements of the request generating the cards of one chunk."""
+
+    def __init__(self, chunk_index: int):
+        """
+        Start measuring a request when it is queued.
+
+        :param chunk_index: Position of the chunk in the source text.
+        """
+
+        self.chunk_index = chunk_index
+        self.started_at = time.time()
+        self.cached = False
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.queue_s = 0.0
+        self.network_s = 0.0
+        self.parse_s = 0.0
+        self.retries = 0
+        self.cards = 0
+        self.error: Optional[str] = None
+        self.throttle_s = 0.0
+        self.rate_limited = 0
+
+        self._queued = time.perf_counter()
+
+    def start(self) -> None:
+        """Mark the moment a worker picks up the request, ending its queueing time."""
+
+        self.queue_s = time.perf_counter() - self._queued
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the measurements to a dictionary.
+
+        :return: A dictionary with one key per measurement.
+        """
+
+        return {column: getattr(self, column) for column in _REQUEST_COLUMNS}
+
+
+class RunMetrics:
+    """Measurements of one generation, made of one request per chunk."""
+
+    def __init__(self, source: str, model: str, chunk_tokens: int, workers: int, backend: str = OPENAI_BACKEND):
+        """
+        Start measuring a generation.
+
+        :param source: What started the generation, e.g. "gui" or "cli".
+        :param model: Name of the chat model.
+        :param chunk_tokens: Token budget of one chunk.
+        :param workers: Maximum number of requests in flight.
+        :param backend: Name of the chat backend answering the requests.
+        """
+
+        self.run_id = uuid.uuid4().hex
+        self.source = source
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.workers = workers
+        self.backend = backend
+        self.started_at = time.time()
+        self.wall_s = 0.0
+        self.error: Optional[str] = None
+        self.requests: List[RequestMetrics] = []
+
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def new_request(self, chunk_index: int) -> RequestMetrics:
+        """
+        Start measuring the request of a chunk; safe to call from several threads.
+
+        :param chunk_index: Position of the chunk in the source text.
+        :return: The measurements of the request, filled in by the generation functions.
+        """
+
+        request = RequestMetrics(chunk_index)
+        with self._lock:
+            self.requests.append(request)
+        return request
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """
+        Stop the wall clock of the generation.
+
+        :param error: Description of the error that ended the generation, if any.
+        """
+
+        self.wall_s = time.perf_counter() - self._started
+        self.error = error
+
+    def totals(self) -> Dict[str, Any]:
+        """
+        Add up the measurements of every request.
+
+        :return: Token, card, retry and latency sums plus the estimated cost.
+        """
+
+        totals = dict({key: 0 for key in _SUMMED_COLUMNS}, requests=len(self.requests), cached=0, errors=0)
+        for request in self.requests:
+            totals["cached"] += request.cached
+            totals["errors"] += request.error is not None
+            for key in _SUMMED_COLUMNS:
+                totals[key] += getattr(request, key)
+
+        totals["wall_s"] = self.wall_s
+        totals["cost"] = estimate_cost(self.model, totals["prompt_tokens"], totals["completion_tokens"], self.backend)
+        return totals
+
+    def summary(self) -> str:
+        """
+        Describe the generation in a few lines.
+
+        :return: Tokens, cost, cards and the latency split of the generation.
+        """
+
+        return format_totals(self.totals())
+
+
+def format_totals(totals: Dict[str, Any]) -> str:
+    """
+    Describe summed measurements in a few lines.
+
+    :param totals: Dictionary returned by RunMetrics.totals or MetricsStore.totals.
+    :return: A human-readable summary.
+    """
+
+    requests = max(totals["requests"], 1)
+    cost = "unknown cost" if totals["cost"] is None else f"${totals['cost']:.4f}"
+    return (f"{totals['requests']} requests ({totals['cached']} cached, {totals['retries']} retries, "
+            f"{totals['errors']} failed), {totals['cards']} cards\n"
+            f"{totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens, {cost}\n"
+            f"{totals['wall_s']:.1f}s wall; per request: queue {totals['queue_s'] / requests:.2f}s, "
+            f"throttled {totals['throttle_s'] / requests:.2f}s, network {totals['network_s'] / requests:.2f}s, "
+            f"parse {totals['parse_s'] / requests * 1000:.1f}ms; {totals['rate_limited']} rate limit errors")
+
+
+class MetricsStore:
+    """SQLite store of generation measurements."""
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the metrics database.
+
+        :param path: Path of the SQLite database file.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+        for table, added in (("runs", _ADDED_RUN_COLUMNS), ("requests", _ADDED_REQUEST_COLUMNS)):
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in added.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self._conn.commit()
+
+    def record(self, run: RunMetrics) -> None:
+        """
+        Store a finished generation and its requests.
+
+        :param run: Measurements of the generation.
+        """
+
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO runs ({', '.join(_RUN_COLUMNS)}) "
+                               f"VALUES ({', '.join('?' * len(_RUN_COLUMNS))})",
+                               tuple(getattr(run, column) for column in _RUN_COLUMNS))
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO requests (run_id, {', '.join(_REQUEST_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(_REQUEST_COLUMNS))})",
+                [(run.run_id, *(getattr(request, column) for column in _REQUEST_COLUMNS))
+                 for request in run.requests])
+            self._conn.commit()
+
+    def totals(self, since: float = 0.0) -> Dict[str, Any]:
+        """
+        Add up the measurements of every generation started after a point in time.
+
+        :param since: Unix time; 0 includes every stored generation.
+        :return: The same keys as RunMetrics.totals.
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(q.cached), 0), COALESCE(SUM(q.error IS NOT NULL), 0), "
+                f"{', '.join(f'COALESCE(SUM(q.{column}), 0)' for column in _SUMMED_COLUMNS)} "
+                "FROM requests q JOIN runs r ON r.run_id = q.run_id WHERE r.started_at >= ?", (since,)).fetchone()
+            wall_s = self._conn.execute("SELECT COALESCE(SUM(wall_s), 0) FROM runs WHERE started_at >= ?",
+                                        (since,)).fetchone()[0]
+            tokens_by_model = self._conn.execute(
+                "SELECT r.model, SUM(q.prompt_tokens), SUM(q.completion_tokens), r.backend "
+                "FROM requests q JOIN runs r ON r.run_id = q.run_id WHERE r.started_at >= ? "
+                "GROUP BY r.model, r.backend", (since,)).fetchall()
+
+        totals = dict(zip(("requests", "cached", "errors", *_SUMMED_COLUMNS), row))
+        totals["wall_s"] = wall_s
+
+        costs = [estimate_cost(model, prompt, completion, backend)
+                 for model, prompt, completion, backend in tokens_by_model]
+        totals["cost"] = None if None in costs else sum(costs)
+        return totals
+
+    def export_jsonl(self, output: IO[str], since: float = 0.0) -> int:
+        """
+        Write one JSON line per stored request, with the details of its generation.
+
+        :param output: Text file to write to.
+        :param since: Unix time; 0 exports every stored generation.
+        :return: Number of lines written.
+        """
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT r.run_id, r.source, r.backend, r.model, r.chunk_tokens, r.workers, "
+                f"{', '.join('q.' + column for column in _REQUEST_COLUMNS)} "
+                "FROM requests q JOIN runs r ON r.run_id = q.run_id WHERE r.started_at >= ? "
+                "ORDER BY q.started_at, q.chunk_index", (since,))
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+
+        for row in rows:
+            output.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+        return len(rows)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_metrics_store() -> MetricsStore:
+    """
+    Get the application-wide metrics store, opening it on first use.
+
+    :return: The shared MetricsStore instance.
+    """
+
+    global _default_store
+
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MetricsStore(get_metrics_path())
+        return _default_store
@@ -0,0 +1,446 @@
+import os
+import random
+import shutil
+import hashlib
+import sqlite3
+import zipfile
+import tempfile
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from utils.file_utils import get_library_cache_dir
+
+# genanki is imported by the functions that write packages, so reading packages and the GUI start without it.
+if TYPE_CHECKING:
+    from genanki import Model
+
+MODEL_NAME = 'Flash card model'
+MODEL_FIELDS = [
+    {'name': 'Question'},
+    {'name': 'Answer'},
+]
+MODEL_TEMPLATES = [
+    {
+        'name': 'Card',
+        'qfmt': '{{Question}}',
+        'afmt': '{{FrontSide}}<hr id="answer">{{Answer}}',
+    },
+]
+
+MANIFEST_PREFIX = "manifest-"
+PART_INFIX = ".part"
+MANIFEST_QUERY_BATCH = 500
+PROGRESS_STEP = 500
+
+_deck_locks = defaultdict(threading.Lock)
+_deck_locks_lock = threading.Lock()
+
+_MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    path TEXT PRIMARY KEY,
+    deck TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    PRIMARY KEY (path, guid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS notes_deck_guid ON notes (deck, guid);
+"""
+
+
+def generate_random_id() -> int:
+    """
+    Generate a random ID for decks and models.
+
+    :return: A random ten-digit integer.
+    """
+
+    return random.randint(10 ** 9, 10 ** 10 - 1)
+
+
+def stable_id(*values) -> int:
+    """
+    Derive an Anki ID from content, so the same deck or note type gets the same ID in every session.
+
+    :param values: Values identifying the object, e.g. the deck title.
+    :return: An integer in the range genanki recommends for model and deck IDs.
+    """
+
+    digest = hashlib.sha256("\x1f".join(str(value) for value in values).encode("utf-8")).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], "big") % (1 << 30)
+
+
+def deck_id_for(deck_title: str) -> int:
+    """
+    Get the stable ID of a deck.
+
+    :param deck_title: Name of the deck.
+    :return: The deck ID.
+    """
+
+    return stable_id("deck", deck_title)
+
+
+def note_guid(question: str, answer: str) -> str:
+    """
+    Get the stable GUID of a note, the same one genanki derives from the note fields.
+
+    :param question: Text of the front side.
+    :param answer: Text of the back side.
+    :return: The note GUID.
+    """
+
+    from genanki import guid_for
+
+    return guid_for(question, answer)
+
+
+def create_model(model_id: Optional[int] = None) -> "Model":
+    """
+    Create the question/answer note type used for generated flashcards.
+
+    :param model_id: ID of the note type, derived from its fields and templates if omitted.
+    :return: A genanki Model.
+    """
+
+    if model_id is None:
+        model_id = stable_id(MODEL_NAME,
+                             *(field['name'] for field in MODEL_FIELDS),
+                             *(template['qfmt'] + template['afmt'] for template in MODEL_TEMPLATES))
+
+    from genanki import Model
+
+    return Model(model_id, MODEL_NAME, fields=MODEL_FIELDS, templates=MODEL_TEMPLATES)
+
+
+def package_path_for(package_dir: str, deck_title: str) -> str:
+    """
+    Get the path of the main package of a deck.
+
+    :param package_dir: Directory with the packages.
+    :param deck_title: Name of the deck.
+    :return: The path of <deck_title>.apkg.
+    """
+
+    return os.path.join(package_dir, f"{deck_title}.apkg")
+
+
+def _deck_parts(package_dir: str, deck_title: str) -> List[Tuple[int, str]]:
+    if not os.path.isdir(package_dir):
+        return []
+
+    prefix = f"{deck_title}{PART_INFIX}"
+    parts = []
+    for filename in os.listdir(package_dir):
+        number = filename[len(prefix):-len(".apkg")]
+        if filename.startswith(prefix) and filename.endswith(".apkg") and number.isdigit():
+            parts.append((int(number), os.path.join(package_dir, filename)))
+
+    return sorted(parts)
+
+
+def deck_part_paths(package_dir: str, deck_title: str) -> List[str]:
+    """
+    List the packages appended to a deck after its main package, in the order they were written.
+
+    :param package_dir: Directory with the packages.
+    :param deck_title: Name of the deck.
+    :return: Paths of the <deck_title>.part<N>.apkg files.
+    """
+
+    return [path for _, path in _deck_parts(package_dir, deck_title)]
+
+
+def write_notes(notes: List[Tuple[Optional[str], str, str]], deck_title: str, package_path: str,
+                model: "Model", deck_id: Optional[int],
+                on_progress: Optional[Callable[[int, int], None]] = None,
+                bulk: Optional[bool] = None) -> None:
+    """
+    Write notes into a new package file.
+
+    :param notes: Triples of GUID, question and answer; a GUID of None is derived from the fields.
+    :param deck_title: Name of the deck.
+    :param package_path: Path of the package file.
+    :param model: Note type of the cards.
+    :param deck_id: ID of the deck, derived from the title if omitted.
+    :param on_progress: Callback called with (notes added, total notes) while the deck is built;
+        an exception raised by it aborts the write before the file is created.
+    :param bulk: Write with the bulk packaging engine instead of genanki's notes; by default it is used
+        for note types with a single template, which includes the one of create_model.
+    """
+
+    if bulk is None:
+        bulk = len(model.templates) == 1
+    if bulk:
+        # bulk_package_utils builds on this module.
+        from utils.bulk_package_utils import write_notes_bulk
+
+        write_notes_bulk(notes, deck_title, package_path, model, deck_id, on_progress)
+        return
+
+    from genanki import Note, Deck, Package
+
+    deck = Deck(deck_id if deck_id is not None else deck_id_for(deck_title), deck_title)
+    for index, (guid, question, answer) in enumerate(notes):
+        deck.add_note(Note(model=model, fields=[question, answer], guid=guid or note_guid(question, answer)))
+        if on_progress is not None and index % PROGRESS_STEP == 0:
+            on_progress(index, len(notes))
+
+    if on_progress is not None:
+        on_progress(len(notes), len(notes))
+
+    os.makedirs(os.path.dirname(package_path) or ".", exist_ok=True)
+    Package(deck).write_to_file(package_path)
+
+
+def write_package(cards: Iterable[Tuple[str, str]], deck_title: str, package_dir: str,
+                  model: Optional["Model"] = None, deck_id: Optional[int] = None) -> str:
+    """
+    Write flashcards into an Anki package, replacing the deck's earlier package and appended parts.
+
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the deck; a random name is used if it is empty.
+    :param package_dir: Directory the package is written to.
+    :param model: Note type of the cards, the default note type if omitted.
+    :param deck_id: ID of the deck, derived from the title if omitted.
+    :return: The path of the written package.
+    """
+
+    if model is None:
+        model = create_model()
+
+    if len(deck_title) <= 0:
+        deck_title = f"Package{generate_random_id()}"
+
+    package_path = package_path_for(package_dir, deck_title)
+    write_notes([(None, question, answer) for question, answer in cards], deck_title, package_path, model, deck_id)
+
+    for part_path in deck_part_paths(package_dir, deck_title):
+        os.remove(part_path)
+
+    return package_path
+
+
+def append_package(cards: Iterable[Tuple[str, str]], deck_title: str, package_dir: str,
+                   model: Optional["Model"] = None,
+                   on_progress: Optional[Callable[[int, int], None]] = None) -> Optional[str]:
+    """
+    Add the cards a deck does not contain yet, without rewriting the packages written before.
+
+    The first call writes the main <deck_title>.apkg; later calls write a small <deck_title>.part<N>.apkg
+    with only the new notes. All of them share the deck ID, note type and note GUIDs, so importing them
+    into Anki in any order extends the same deck without duplicates. The cost depends on the number of
+    new cards only: the notes already written are looked up in the manifest of the package directory.
+
+    :param cards: Pairs of question and answer.
+    :param deck_title: Name of the deck; a random name is used if it is empty.
+    :param package_dir: Directory the package is written to.
+    :param model: Note type of the cards, the default note type if omitted.
+    :param on_progress: Callback called with (notes added, total new notes) while the package is built.
+    :return: The path of the written package, or None if every card was already in the deck.
+    """
+
+    if model is None:
+        model = create_model()
+
+    if len(deck_title) <= 0:
+        deck_title = f"Package{generate_random_id()}"
+
+    notes = {}
+    for question, answer in cards:
+        notes.setdefault(note_guid(question, answer), (question, answer))
+
+    os.makedirs(package_dir, exist_ok=True)
+    # Background jobs may append to the same deck at once; each of them must see the parts of the others.
+    with _deck_locks_lock:
+        deck_lock = _deck_locks[package_path_for(os.path.abspath(package_dir), deck_title)]
+
+    with deck_lock:
+        return _append_new_notes(notes, deck_title, package_dir, model, on_progress)
+
+
+def _append_new_notes(notes: dict, deck_title: str, package_dir: str, model: "Model",
+                      on_progress: Optional[Callable[[int, int], None]]) -> Optional[str]:
+    manifest = DeckManifest(package_dir)
+    try:
+        manifest.sync(deck_title)
+        known = manifest.known_guids(deck_title, list(notes))
+        new_notes = [(guid, question, answer) for guid, (question, answer) in notes.items() if guid not in known]
+        if not new_notes:
+            return None
+
+        package_path = package_path_for(package_dir, deck_title)
+        if os.path.exists(package_path):
+            parts = _deck_parts(package_dir, deck_title)
+            number = parts[-1][0] + 1 if parts else 1
+            package_path = os.path.join(package_dir, f"{deck_title}{PART_INFIX}{number}.apkg")
+
+        write_notes(new_notes, deck_title, package_path, model, None, on_progress)
+        manifest.record(deck_title, package_path, [guid for guid, _, _ in new_notes])
+    finally:
+        manifest.close()
+
+    return package_path
+
+
+def manifest_path(package_dir: str, cache_dir: str) -> str:
+    """
+    Get the path of the manifest of a package directory.
+
+    :param package_dir: Directory with the packages.
+    :param cache_dir: Directory of the manifests.
+    :return: The path of manifest-<hash of the package directory>.sqlite in the cache directory.
+    """
+
+    key = hashlib.sha1(os.path.abspath(package_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{MANIFEST_PREFIX}{key}.sqlite")
+
+
+class DeckManifest:
+    """GUIDs of the notes stored in the packages of a directory, so appends do not have to read them."""
+
+    def __init__(self, package_dir: str, cache_dir: Optional[str] = None):
+        """
+        Open (or create) the manifest of a package directory.
+
+        :param package_dir: Directory with the packages.
+        :param cache_dir: Directory of the manifests, the deck library cache if omitted; the package directory
+            only ever holds packages.
+        """
+
+        self.package_dir = package_dir
+        self.cache_dir = cache_dir if cache_dir is not None else get_library_cache_dir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(manifest_path(package_dir, self.cache_dir))
+        self._conn.executescript(_MANIFEST_SCHEMA)
+
+    def sync(self, deck_title: str) -> None:
+        """
+        Bring the entries of a deck up to date with its package files.
+
+        Only packages that were changed, added or removed by something else than append_package are read.
+
+        :param deck_title: Name of the deck.
+        """
+
+        main_path = package_path_for(self.package_dir, deck_title)
+        paths = ([main_path] if os.path.exists(main_path) else []) + deck_part_paths(self.package_dir, deck_title)
+        stats = {path: os.stat(path) for path in paths}
+
+        recorded = {path: (mtime, size) for path, mtime, size in
+                    self._conn.execute("SELECT path, mtime, size FROM packages WHERE deck = ?", (deck_title,))}
+
+        for path, (mtime, size) in recorded.items():
+            stat = stats.get(path)
+            if stat is None or stat.st_mtime != mtime or stat.st_size != size:
+                self._forget(path)
+                recorded[path] = None
+
+        for path in paths:
+            if recorded.get(path) is None:
+                self.record(deck_title, path, read_package_guids(path))
+
+        self._conn.commit()
+
+    def known_guids(self, deck_title: str, guids: List[str]) -> set:
+        """
+        Find which of the given notes are already in a deck.
+
+        :param deck_title: Name of the deck.
+        :param guids: GUIDs of the notes to look up.
+        :return: The subset of GUIDs stored in the deck's packages.
+        """
+
+        known = set()
+        for start in range(0, len(guids), MANIFEST_QUERY_BATCH):
+            batch = guids[start:start + MANIFEST_QUERY_BATCH]
+            known.update(guid for guid, in self._conn.execute(
+                f"SELECT guid FROM notes WHERE deck = ? AND guid IN ({','.join('?' * len(batch))})",
+                [deck_title, *batch]))
+
+        return known
+
+    def record(self, deck_title: str, package_path: str, guids: Iterable[str]) -> None:
+        """
+        Register the notes of a package file written for a deck.
+
+        :param deck_title: Name of the deck.
+        :param package_path: Path of the package file.
+        :param guids: GUIDs of the notes in the file.
+        """
+
+        stat = os.stat(package_path)
+        self._forget(package_path)
+        self._conn.execute("INSERT INTO packages VALUES (?, ?, ?, ?)",
+                           (package_path, deck_title, stat.st_mtime, stat.st_size))
+        self._conn.executemany("INSERT OR IGNORE INTO notes VALUES (?, ?, ?)",
+                               ((package_path, guid, deck_title) for guid in guids))
+        self._conn.commit()
+
+    def _forget(self, package_path: str) -> None:
+        self._conn.execute("DELETE FROM notes WHERE path = ?", (package_path,))
+        self._conn.execute("DELETE FROM packages WHERE path = ?", (package_path,))
+
+    def close(self) -> None:
+        """Close the manifest database."""
+
+        self._conn.close()
+
+
+def _query_collection(package_path: str, query: str) -> Iterator[tuple]:
+    """
+    Run a query on the collection database stored in an Anki package.
+
+    Only the collection database is extracted from the archive; media files are skipped.
+
+    :param package_path: The path of the .apkg file.
+    :param query: SQL query to run.
+    :return: An iterator over the result rows.
+    """
+
+    with zipfile.ZipFile(package_path) as package:
+        names = set(package.namelist())
+        collection = next((name for name in ("collection.anki21", "collection.anki2") if name in names), None)
+        if collection is None:
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "collection.db")
+            with package.open(collection) as src, open(db_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+            conn = sqlite3.connect(db_path)
+            try:
+                yield from conn.execute(query)
+            finally:
+                conn.close()
+
+
+def read_package_notes(package_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Read the first two fields of every note stored in an Anki package.
+
+    :param package_path: The path of the .apkg file.
+    :return: An iterator over pairs of question and answer.
+    """
+
+    for flds, in _query_collection(package_path, "SELECT flds FROM notes ORDER BY id"):
+        fields = flds.split("\x1f")
+        yield fields[0], fields[1] if len(fields) > 1 else ""
+
+
+def read_package_guids(package_path: str) -> Iterator[str]:
+    """
+    Read the GUID of every note stored in an Anki package.
+
+    :param package_path: The path of the .apkg file.
+    :return: An iterator over note GUIDs.
+    """
+
+    for guid, in _query_collection(package_path, "SELECT guid FROM notes"):
+        yield guid
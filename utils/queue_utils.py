@@ -0,0 +1,721 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.card_utils import CardStore, Card, PENDING
+from utils.cache_utils import ResponseCache
+from utils.coverage_utils import CoverageIndex, PendingCoverage, get_coverage_index
+from utils.search_utils import SearchIndex, get_search_index
+from utils.dedup_utils import get_duplicate_index
+from utils.file_utils import get_jobs_path, get_package_dir
+from utils.generation_utils import (cached_request, describe_error, parse_response, split_into_chunks,
+                                    measured, CHUNK_MAX_TOKENS, DEFAULT_MODEL, MAX_RETRIES, SYSTEM_PROMPT)
+from utils.llm_utils import LLMBackend, get_backend
+from utils.metrics_utils import RunMetrics, get_metrics_store
+from utils.settings_utils import JOB_WORKERS, get_settings
+from utils.task_utils import QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+IDLE_POLL_S = 5.0
+# A running job whose queue has not renewed its lease for this long is considered abandoned.
+LEASE_S = 60.0
+
+# Generated and waiting for the user to review the cards.
+REVIEW = "review"
+
+PRIORITIES = {"Low": -1, "Normal": 0, "High": 1, "Urgent": 2}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    source TEXT,
+    text TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    model TEXT NOT NULL,
+    chunk_tokens INTEGER NOT NULL,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    cards INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    backend TEXT NOT NULL DEFAULT '',
+    owner TEXT NOT NULL DEFAULT '',
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_next ON jobs (state, priority DESC, job_id);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id INTEGER NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    response TEXT NOT NULL,
+    PRIMARY KEY (job_id, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS job_cards (
+    job_id INTEGER NOT NULL,
+    card_index INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duplicate TEXT,
+    PRIMARY KEY (job_id, card_index)
+);
+"""
+
+# Columns added after the first release, with their definition for databases created before.
+_ADDED_JOB_COLUMNS = {"backend": "TEXT NOT NULL DEFAULT ''", "owner": "TEXT NOT NULL DEFAULT ''",
+                      "lease_until": "REAL NOT NULL DEFAULT 0"}
+
+_JOB_COLUMNS = ("job_id", "title", "source", "priority", "state", "model", "chunk_tokens",
+                "chunks", "chunks_done", "cards", "error", "created_at", "updated_at", "backend", "owner",
+                "lease_until")
+
+
+class Job:
+    """One document of the job queue, without its text."""
+
+    def __init__(self, job_id: int, title: str, source: Optional[str], priority: int, state: str, model: str,
+                 chunk_tokens: int, chunks: int, chunks_done: int, cards: int, error: Optional[str],
+                 created_at: float, updated_at: float, backend: str = "", owner: str = "",
+                 lease_until: float = 0.0):
+        """
+        Initialize the job from a row of the jobs table.
+
+        :param job_id: Id of the job.
+        :param title: Name shown to the user, also the default deck title.
+        :param source: Path of the document the text was read from, if any.
+        :param priority: Jobs with a higher priority are generated first.
+        :param state: QUEUED, RUNNING, REVIEW, DONE, FAILED or CANCELLED.
+        :param model: Name of the chat model.
+        :param chunk_tokens: Token budget of one chunk.
+        :param chunks: Number of chunks of the text, 0 until the job first runs.
+        :param chunks_done: Number of chunks with a stored response.
+        :param cards: Number of generated cards.
+        :param error: Description of the error that failed the job.
+        :param created_at: Unix time the job was added.
+        :param updated_at: Unix time of the last change.
+        :param backend: Identity of the backend that generated the cards, empty until the job first runs.
+        :param owner: Id of the queue that last claimed the job.
+        :param lease_until: Unix time until which the owner holds a running job, unless it renews the lease.
+        """
+
+        self.job_id = job_id
+        self.title = title
+        self.source = source
+        self.priority = priority
+        self.state = state
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.chunks = chunks
+        self.chunks_done = chunks_done
+        self.cards = cards
+        self.error = error
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.backend = backend
+        self.owner = owner
+        self.lease_until = lease_until
+
+    def describe(self) -> str:
+        """
+        Describe the state of the job in a few words.
+
+        :return: The state with the chunk progress, card count or error.
+        """
+
+        if self.state == RUNNING and self.chunks:
+            return f"{RUNNING} {self.chunks_done}/{self.chunks}"
+        if self.state in (REVIEW, DONE):
+            return f"{self.state}: {self.cards} cards"
+        if self.state == FAILED and self.error:
+            return f"{FAILED}: {self.error.splitlines()[0]}"
+        return self.state
+
+
+class JobStore:
+    """SQLite store of the queued documents, the responses of their chunks and their cards."""
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the job database.
+
+        :param path: Path of the SQLite database file.
+        """
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(_SCHEMA)
+
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in _ADDED_JOB_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.commit()
+
+    def add(self, text: str, title: str, priority: int = 0, source: Optional[str] = None,
+            model: str = DEFAULT_MODEL, chunk_tokens: int = CHUNK_MAX_TOKENS) -> int:
+        """
+        Queue a document.
+
+        :param text: Text to generate cards from.
+        :param title: Name shown to the user.
+        :param priority: Jobs with a higher priority are generated first.
+        :param source: Path of the document the text was read from, if any.
+        :param model: Name of the chat model.
+        :param chunk_tokens: Token budget of one chunk.
+        :return: Id of the new job.
+        """
+
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (title, source, text, priority, state, model, chunk_tokens, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (title, source, text, priority, QUEUED, model, chunk_tokens, now, now))
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Job]:
+        """
+        Get one job.
+
+        :param job_id: Id of the job.
+        :return: The job, or None if it does not exist.
+        """
+
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+        return Job(*row) if row is not None else None
+
+    def jobs(self, limit: int = -1) -> List[Job]:
+        """
+        List the jobs, running ones first, then queued ones in the order they will run, then the rest.
+
+        :param limit: Maximum number of jobs, -1 for all of them.
+        :return: The jobs without their text.
+        """
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs ORDER BY "
+                "CASE state WHEN ? THEN 0 WHEN ? THEN 1 ELSE 2 END, "
+                "CASE WHEN state = ? THEN -priority ELSE 0 END, "
+                "CASE WHEN state IN (?, ?) THEN job_id ELSE -updated_at END LIMIT ?",
+                (RUNNING, QUEUED, QUEUED, RUNNING, QUEUED, limit)).fetchall()
+        return [Job(*row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the jobs in every state.
+
+        :return: A dictionary from state to number of jobs.
+        """
+
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def text(self, job_id: int) -> str:
+        """
+        Get the text of a job.
+
+        :param job_id: Id of the job.
+        :return: The document text.
+        """
+
+        with self._lock:
+            return self._conn.execute("SELECT text FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def claim_next(self, owner: str, lease_s: float = LEASE_S) -> Optional[Job]:
+        """
+        Mark the queued job with the highest priority, oldest first, as running, leased to a queue.
+
+        Safe to call from several threads and processes: a job is only ever claimed once.
+
+        :param owner: Id of the claiming queue.
+        :param lease_s: Seconds the job stays leased to the owner unless it renews the lease.
+        :return: The claimed job, or None if no job is queued.
+        """
+
+        with self._lock:
+            while True:
+                row = self._conn.execute("SELECT job_id FROM jobs WHERE state = ? "
+                                         "ORDER BY priority DESC, job_id LIMIT 1", (QUEUED,)).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                cursor = self._conn.execute("UPDATE jobs SET state = ?, error = NULL, owner = ?, lease_until = ?, "
+                                            "updated_at = ? WHERE job_id = ? AND state = ?",
+                                            (RUNNING, owner, now + lease_s, now, row[0], QUEUED))
+                self._conn.commit()
+                if cursor.rowcount:
+                    break
+
+        return self.get(row[0])
+
+    def renew(self, owner: str, lease_s: float = LEASE_S) -> int:
+        """
+        Extend the lease of every job a queue is running.
+
+        :param owner: Id of the queue.
+        :param lease_s: Seconds from now the leases last.
+        :return: Number of renewed jobs.
+        """
+
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET lease_until = ? WHERE state = ? AND owner = ?",
+                                        (time.time() + lease_s, RUNNING, owner))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def recover(self, owner: str = "") -> int:
+        """
+        Queue again the running jobs whose lease expired, left by a process that stopped; their finished chunks
+        are kept. Jobs of other queues that still renew their lease are left alone.
+
+        :param owner: Id of the recovering queue; its own running jobs, interrupted by stop, are queued too.
+        :return: Number of recovered jobs.
+        """
+
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET state = ?, updated_at = ? "
+                                        "WHERE state = ? AND (lease_until < ? OR owner = ?)",
+                                        (QUEUED, now, RUNNING, now, owner))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _set(self, job_id: int, where: str = "", where_args: tuple = (), **values) -> bool:
+        values["updated_at"] = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in values)} WHERE job_id = ? {where}",
+                (*values.values(), job_id, *where_args))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def set_state(self, job_id: int, state: str, error: Optional[str] = None) -> None:
+        """
+        Change the state of a job.
+
+        :param job_id: Id of the job.
+        :param state: New state.
+        :param error: Description of the error, for FAILED.
+        """
+
+        self._set(job_id, state=state, error=error)
+
+    def fail(self, job_id: int, error: str, owner: str) -> bool:
+        """
+        Mark a job as failed, if the queue still runs it.
+
+        :param job_id: Id of the job.
+        :param error: Description of the error.
+        :param owner: Id of the queue that ran the job.
+        :return: True if the job was marked as failed.
+        """
+
+        return self._set(job_id, "AND state = ? AND owner = ?", (RUNNING, owner), state=FAILED, error=error)
+
+    def set_priority(self, job_id: int, priority: int) -> None:
+        """
+        Change the priority of a job.
+
+        :param job_id: Id of the job.
+        :param priority: New priority; higher runs first.
+        """
+
+        self._set(job_id, priority=priority)
+
+    def set_chunks(self, job_id: int, chunks: int, backend: str) -> None:
+        """
+        Record the number of chunks of a job and the backend generating them.
+
+        :param job_id: Id of the job.
+        :param chunks: Number of chunks of its text.
+        :param backend: Identity of the backend; see LLMBackend.identity.
+        """
+
+        self._set(job_id, chunks=chunks, backend=backend)
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job; a running job stops after its current chunk.
+
+        :param job_id: Id of the job.
+        :return: True if the job was cancelled.
+        """
+
+        return self._set(job_id, "AND state IN (?, ?)", (QUEUED, RUNNING), state=CANCELLED)
+
+    def retry(self, job_id: int) -> bool:
+        """
+        Queue a failed or cancelled job again; it resumes after its last finished chunk.
+
+        :param job_id: Id of the job.
+        :return: True if the job was queued.
+        """
+
+        return self._set(job_id, "AND state IN (?, ?)", (FAILED, CANCELLED), state=QUEUED, error=None)
+
+    def remove(self, job_id: int) -> None:
+        """
+        Delete a job with its responses and cards.
+
+        :param job_id: Id of the job.
+        """
+
+        with self._lock:
+            for table in ("job_cards", "job_chunks", "jobs"):
+                self._conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def save_chunk(self, job_id: int, chunk_index: int, response: str) -> None:
+        """
+        Store the response of one chunk so that a restarted job does not request it again.
+
+        :param job_id: Id of the job.
+        :param chunk_index: Position of the chunk in the text.
+        :param response: Raw completion text.
+        """
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO job_chunks VALUES (?, ?, ?)", (job_id, chunk_index, response))
+            self._conn.execute("UPDATE jobs SET chunks_done = (SELECT COUNT(*) FROM job_chunks WHERE job_id = ?), "
+                               "updated_at = ? WHERE job_id = ?", (job_id, time.time(), job_id))
+            self._conn.commit()
+
+    def chunk_responses(self, job_id: int) -> Dict[int, str]:
+        """
+        Get the stored responses of a job.
+
+        :param job_id: Id of the job.
+        :return: A dictionary from chunk index to raw completion text.
+        """
+
+        with self._lock:
+            return dict(self._conn.execute("SELECT chunk_index, response FROM job_chunks WHERE job_id = ?",
+                                           (job_id,)).fetchall())
+
+    def coverage(self, job_id: int, index: CoverageIndex) -> Optional[PendingCoverage]:
+        """
+        Get the generated chunks of a job with their cards, to be recorded once the reviewed deck is delivered.
+
+        :param job_id: Id of the job.
+        :param index: Coverage index to record the chunks into.
+        :return: The pending coverage, or None for a job that does not exist or never ran.
+        """
+
+        job = self.get(job_id)
+        if job is None or not job.backend:
+            return None
+
+        coverage = PendingCoverage(index, job.title, job.backend)
+        chunks = split_into_chunks(self.text(job_id), job.chunk_tokens)
+        for chunk_index, response in sorted(self.chunk_responses(job_id).items()):
+            if chunk_index < len(chunks):
+                coverage.add(chunks[chunk_index], [(card["question"], card["answer"])
+                                                   for card in parse_response(response)])
+        return coverage
+
+    def finish(self, job_id: int, cards: CardStore, owner: str) -> bool:
+        """
+        Store the generated cards of a job and mark it ready for review, if the queue still runs it.
+
+        A job cancelled or taken over by another queue while its last chunk was generated is left as it is.
+
+        :param job_id: Id of the job.
+        :param cards: The generated cards, some of them flagged as duplicates.
+        :param owner: Id of the queue that generated the cards.
+        :return: True if the cards were stored.
+        """
+
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET state = ?, cards = ?, updated_at = ? "
+                                        "WHERE job_id = ? AND state = ? AND owner = ?",
+                                        (REVIEW, len(cards), time.time(), job_id, RUNNING, owner))
+            if cursor.rowcount:
+                self._conn.execute("DELETE FROM job_cards WHERE job_id = ?", (job_id,))
+                self._conn.executemany("INSERT INTO job_cards VALUES (?, ?, ?, ?, ?, ?)",
+                                       ((job_id, index, card.question, card.answer, PENDING, card.duplicate)
+                                        for index, card in enumerate(cards)))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def cards(self, job_id: int) -> CardStore:
+        """
+        Load the cards of a job with their review status.
+
+        :param job_id: Id of the job.
+        :return: A CardStore in the order the cards were generated.
+        """
+
+        cards = CardStore()
+        with self._lock:
+            for question, answer, status, duplicate in self._conn.execute(
+                    "SELECT question, answer, status, duplicate FROM job_cards WHERE job_id = ? ORDER BY card_index",
+                    (job_id,)):
+                cards.add_card(question, answer, status, duplicate)
+        return cards
+
+    def save_card(self, job_id: int, index: int, card: Card) -> None:
+        """
+        Store the review of one card.
+
+        :param job_id: Id of the job.
+        :param index: Index of the card.
+        :param card: The reviewed card.
+        """
+
+        self.save_cards(job_id, [(index, card)])
+
+    def save_cards(self, job_id: int, cards: Iterable[Tuple[int, Card]]) -> None:
+        """
+        Store the review of several cards in one transaction.
+
+        :param job_id: Id of the job.
+        :param cards: Pairs of card index and reviewed card, e.g. enumerate(card_store).
+        """
+
+        with self._lock:
+            self._conn.executemany("UPDATE job_cards SET question = ?, answer = ?, status = ? "
+                                   "WHERE job_id = ? AND card_index = ?",
+                                   ((card.question, card.answer, card.status, job_id, index)
+                                    for index, card in cards))
+            self._conn.commit()
+
+
+class JobQueue:
+    """
+    Worker threads generating the cards of the queued documents, highest priority first.
+
+    Every chunk response is stored as soon as it arrives, so jobs interrupted by a crash or a restart resume
+    where they stopped. The chunks of one job are requested one after another; requests of all workers share
+    the rate limit of the backend. Claimed jobs are leased to the queue and the lease is renewed while it runs,
+    so several queues, e.g. the GUI and `cli.py queue run`, can share one job store.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS,
+                 backend: Optional[LLMBackend] = None,
+                 cache: Optional[ResponseCache] = None,
+                 max_retries: int = MAX_RETRIES,
+                 system_prompt: str = SYSTEM_PROMPT,
+                 on_change: Optional[Callable[[Job], None]] = None,
+                 coverage: Optional[CoverageIndex] = None,
+                 search_index: Optional[SearchIndex] = None):
+        """
+        Initialize the queue; no job runs before start is called.
+
+        :param store: Store of the jobs.
+        :param workers: Number of jobs generated at the same time.
+        :param backend: Chat completion backend, or None for the one configured in config.json.
+        :param cache: Response cache to use, or None to always query the model.
+        :param max_retries: Number of retries per chunk for transient errors.
+        :param system_prompt: System message describing the flashcard format.
+        :param on_change: Callback called from the worker threads when a job starts, fails or finishes.
+        :param coverage: Index of the source chunks that already produced cards; covered chunks are skipped.
+            None to generate every chunk. Generated chunks are recorded when the reviewed deck is delivered.
+        :param search_index: Full-text index the text of a finished job is added to, or None to not index it.
+        """
+
+        self.store = store
+        self.workers = workers
+        self.backend = backend
+        self.cache = cache
+        self.max_retries = max_retries
+        self.system_prompt = system_prompt
+        self.on_change = on_change
+        self.coverage = coverage
+        self.search_index = search_index
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Condition()
+        self._stopping = False
+        self._exit_when_idle = False
+
+    @property
+    def running(self) -> bool:
+        """True while any worker thread is alive."""
+
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, exit_when_idle: bool = False) -> int:
+        """
+        Queue again the jobs interrupted by the last run and start the worker threads.
+
+        :param exit_when_idle: Stop the workers once no job is left instead of waiting for new ones.
+        :return: Number of interrupted jobs that were queued again.
+        """
+
+        recovered = self.store.recover(self.owner)
+        self._stopping = False
+        self._exit_when_idle = exit_when_idle
+        self._threads = [threading.Thread(target=self._work, name=f"job-queue-{index}", daemon=True)
+                         for index in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        threading.Thread(target=self._heartbeat, name="job-queue-heartbeat", daemon=True).start()
+        return recovered
+
+    def wake(self) -> None:
+        """Make the idle workers look for queued jobs now, e.g. after adding jobs."""
+
+        with self._wake:
+            self._wake.notify_all()
+
+    def stop(self) -> None:
+        """Stop the workers after their current chunk; unfinished jobs are resumed by the next start."""
+
+        self._stopping = True
+        self.wake()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait for the worker threads to exit.
+
+        :param timeout: Maximum number of seconds to wait for each thread.
+        """
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _heartbeat(self) -> None:
+        while self.running:
+            self.store.renew(self.owner)
+            with self._wake:
+                self._wake.wait(LEASE_S / 4)
+
+    def _work(self) -> None:
+        while not self._stopping:
+            job = self.store.claim_next(self.owner)
+            if job is None:
+                if self._exit_when_idle:
+                    return
+                with self._wake:
+                    self._wake.wait(IDLE_POLL_S)
+                continue
+            self._notify(job.job_id)
+            self._run(job)
+            self._notify(job.job_id)
+
+    def _notify(self, job_id: int) -> None:
+        if self.on_change is not None:
+            job = self.store.get(job_id)
+            if job is not None:
+                self.on_change(job)
+
+    def _interrupted(self, job_id: int) -> bool:
+        if self._stopping:
+            return True
+        job = self.store.get(job_id)
+        # A job recovered by another queue after its lease expired belongs to that queue now.
+        return job is None or job.state != RUNNING or job.owner != self.owner
+
+    def _run(self, job: Job) -> None:
+        """
+        Generate the missing chunks of a job, then parse every response and store the cards.
+
+        :param job: The claimed job.
+        """
+
+        backend = self.backend or get_backend()
+        text = self.store.text(job.job_id)
+        chunks = split_into_chunks(text, job.chunk_tokens)
+        self.store.set_chunks(job.job_id, len(chunks), backend.identity)
+        responses = self.store.chunk_responses(job.job_id)
+
+        run = RunMetrics("queue", job.model, job.chunk_tokens, self.workers, backend.name)
+        try:
+            if self.coverage is not None:
+                missing = [index for index in range(len(chunks)) if index not in responses]
+                # A covered chunk is stored with an empty response, so it adds no cards to the review.
+                for position in self.coverage.find_many([chunks[index] for index in missing], backend.identity):
+                    responses[missing[position]] = ""
+                    self.store.save_chunk(job.job_id, missing[position], "")
+
+            for index, chunk in enumerate(chunks):
+                if index in responses:
+                    continue
+                if self._interrupted(job.job_id):
+                    # Cancelled, removed or stopping: the state is left for retry or recover.
+                    return
+                metrics = run.new_request(index)
+                responses[index] = measured(metrics, cached_request, chunk, job.model, self.system_prompt,
+                                            self.cache, self.max_retries, metrics=metrics, backend=backend)
+                self.store.save_chunk(job.job_id, index, responses[index])
+
+            card_store = CardStore()
+            for index in range(len(chunks)):
+                for card in parse_response(responses[index]):
+                    card_store.add(card)
+            self._flag_duplicates(card_store)
+            if self.store.finish(job.job_id, card_store, self.owner):
+                # The cards are indexed when they are saved in the review, with their final deck.
+                if self.search_index is not None:
+                    self.search_index.add_source(job.title, text)
+        except Exception as error:
+            run.finish(describe_error(error))
+            print(f"Job {job.job_id} ({job.title}) failed: {error}")
+            self.store.fail(job.job_id, describe_error(error), self.owner)
+        else:
+            run.finish()
+        finally:
+            if run.requests:
+                get_metrics_store().record(run)
+
+    @staticmethod
+    def _flag_duplicates(cards: CardStore) -> None:
+        duplicate_index = get_duplicate_index()
+        if os.path.isdir(get_package_dir()):
+            duplicate_index.index_package_dir(get_package_dir())
+
+        for index in range(len(cards)):
+            duplicate = duplicate_index.find_duplicate(cards.questions[index], cards.answers[index])
+            if duplicate is not None:
+                cards.set_duplicate(index, duplicate["source"])
+
+
+_default_store = None
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """
+    Get the application-wide job store, opening it on first use.
+
+    :return: The shared JobStore instance.
+    """
+
+    global _default_store
+
+    with _default_lock:
+        if _default_store is None:
+            _default_store = JobStore(get_jobs_path())
+        return _default_store
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the application-wide job queue, configured from config.json; it is not started.
+
+    :return: The shared JobQueue instance.
+    """
+
+    global _default_queue
+
+    from utils.cache_utils import get_response_cache
+
+    store = get_job_store()
+    with _default_lock:
+        if _default_queue is None:
+            settings = get_settings()
+            _default_queue = JobQueue(store, settings.queue_workers, cache=get_response_cache(),
+                                      max_retries=settings.max_retries, coverage=get_coverage_index(),
+                                      search_index=get_search_index())
+        return _default_queue
@@ -0,0 +1,378 @@
+import time
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+from utils.llm_utils import LLMBackend, LLMRateLimitError, Messages
+from utils.settings_utils import MAX_CONCURRENCY, get_settings
+
+# Completion tokens reserved for a request until its actual length is known.
+EXPECTED_COMPLETION_TOKENS = 500
+
+# AIMD: the concurrency window grows by one request per window of successful requests
+# and is halved by a rate limit error, at most once per pause.
+CONCURRENCY_INCREASE = 1.0
+CONCURRENCY_DECREASE = 0.5
+# Pause of every request after a rate limit error without a Retry-After header, in seconds.
+RATE_LIMIT_PAUSE = 1.0
+
+_local = threading.local()
+
+
+def take_throttle_wait() -> float:
+    """
+    Get the time the calling thread spent waiting for the rate limiter since the last call, and reset it.
+
+    :return: The waiting time in seconds.
+    """
+
+    waited = getattr(_local, "wait_s", 0.0)
+    _local.wait_s = 0.0
+    return waited
+
+
+def _count_tokens(text: str, model: str) -> int:
+    # Imported here because generation_utils imports this module.
+    from utils.generation_utils import count_tokens
+
+    return count_tokens(text, model)
+
+
+class _Bucket:
+    """Token bucket holding up to one minute of a per-minute limit; a limit of 0 disables it."""
+
+    def __init__(self):
+        self.limit = 0.0
+        self.level = 0.0
+
+    def set_limit(self, limit: float) -> None:
+        # A bucket that was unlimited starts full; a lowered limit keeps what was already used.
+        self.level = limit if not self.limit else min(self.level, limit)
+        self.limit = limit
+
+    def refill(self, elapsed: float) -> None:
+        if self.limit:
+            self.level = min(self.limit, self.level + elapsed * self.limit / 60)
+
+    def wait_time(self, amount: float) -> float:
+        if not self.limit or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.limit
+
+
+class RateLimiter:
+    """
+    Shared limiter of the model requests of every thread.
+
+    Requests per minute and tokens per minute are enforced with token buckets that hold up to one minute of
+    their limit and refill continuously. The limits are the configured ones, lowered to the ones announced by
+    the x-ratelimit-* response headers, and the buckets follow the remaining counts of those headers.
+
+    The number of requests in flight is adapted AIMD-style: it grows by one per window of successful requests
+    up to max_concurrency, and is halved when the server answers with a rate limit error, after which every
+    request waits for the Retry-After delay. Throughput therefore settles just below the account's ceiling
+    instead of bouncing off it with bursts of 429 errors.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        """
+        Initialize the limiter with full buckets.
+
+        :param requests_per_minute: Maximum number of requests per minute, 0 for no limit.
+        :param tokens_per_minute: Maximum number of prompt plus completion tokens per minute, 0 for no limit.
+        :param max_concurrency: Maximum number of requests in flight.
+        """
+
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.max_concurrency = max_concurrency
+        self.server_requests_per_minute = 0
+        self.server_tokens_per_minute = 0
+
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+
+        self.throttled = 0
+        self.waited_s = 0.0
+        self.rate_limited = 0
+        self.decreases = 0
+
+        self._requests = _Bucket()
+        self._tokens = _Bucket()
+        self._paused_until = 0.0
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+        self.configure(requests_per_minute, tokens_per_minute, max_concurrency)
+
+    @staticmethod
+    def _effective(configured: float, announced: float) -> float:
+        return min(limit for limit in (configured, announced) if limit) if configured or announced else 0
+
+    def _update_limits(self) -> None:
+        self._requests.set_limit(self._effective(self.requests_per_minute, self.server_requests_per_minute))
+        self._tokens.set_limit(self._effective(self.tokens_per_minute, self.server_tokens_per_minute))
+
+    def configure(self, requests_per_minute: int, tokens_per_minute: int,
+                  max_concurrency: Optional[int] = None) -> None:
+        """
+        Change the configured limits, keeping the requests already made in the current minute.
+
+        :param requests_per_minute: Maximum number of requests per minute, 0 for no limit.
+        :param tokens_per_minute: Maximum number of tokens per minute, 0 for no limit.
+        :param max_concurrency: Maximum number of requests in flight, None to keep the current one.
+        """
+
+        with self._condition:
+            self._refill()
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+                self.concurrency = min(self.concurrency, max_concurrency)
+            self._update_limits()
+            self._condition.notify_all()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests.refill(elapsed)
+        self._tokens.refill(elapsed)
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(self._paused_until - time.monotonic(),
+                   self._requests.wait_time(1),
+                   self._tokens.wait_time(tokens))
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Wait until one more request fits in the concurrency window and both limits, then account for it.
+
+        A request larger than the whole token limit waits for a full bucket instead of forever.
+        Every acquire must be followed by on_success, on_rate_limited or on_failure.
+
+        :param tokens: Estimated prompt plus completion tokens of the request.
+        :return: The time spent waiting in seconds.
+        """
+
+        started = time.monotonic()
+        waited = False
+        with self._condition:
+            while True:
+                self._refill()
+                needed = min(tokens, self._tokens.limit) if self._tokens.limit else 0
+                wait = self._wait_time(needed)
+                if wait <= 0 and self.in_flight < int(self.concurrency):
+                    break
+                if not waited:
+                    waited = True
+                    self.throttled += 1
+                # Without a bucket to wait for, a finishing request notifies the condition.
+                self._condition.wait(min(wait, 1.0) if wait > 0 else 1.0)
+
+            if self._requests.limit:
+                self._requests.level -= 1
+            if self._tokens.limit:
+                self._tokens.level -= needed
+            self.in_flight += 1
+
+            waited_s = time.monotonic() - started if waited else 0.0
+            self.waited_s += waited_s
+        return waited_s
+
+    def on_success(self, extra_tokens: int = 0) -> None:
+        """
+        Release a request that succeeded and widen the concurrency window.
+
+        :param extra_tokens: Tokens used beyond the estimate passed to acquire, negative to give unused ones back.
+        """
+
+        with self._condition:
+            self.in_flight -= 1
+            self.concurrency = min(self.max_concurrency, self.concurrency + CONCURRENCY_INCREASE / self.concurrency)
+            self._adjust_tokens(extra_tokens)
+            self._condition.notify_all()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """
+        Release a request refused with a rate limit error, pause every request and narrow the concurrency window.
+
+        :param retry_after: Seconds the server asked to wait, if it said so.
+        """
+
+        with self._condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.rate_limited += 1
+
+            # One burst of refused requests is one congestion signal.
+            if now >= self._paused_until:
+                self.concurrency = max(1.0, self.concurrency * CONCURRENCY_DECREASE)
+                self.decreases += 1
+            self._paused_until = max(self._paused_until, now + (retry_after or RATE_LIMIT_PAUSE))
+            self._condition.notify_all()
+
+    def on_failure(self) -> None:
+        """Release a request that failed for another reason, without changing the window."""
+
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _adjust_tokens(self, tokens: int) -> None:
+        if self._tokens.limit and tokens:
+            self._refill()
+            self._tokens.level = min(self._tokens.limit, self._tokens.level - tokens)
+
+    def observe(self, limits: Dict[str, float]) -> None:
+        """
+        Follow the rate limits announced by the server in the headers of a response.
+
+        :param limits: Values returned by llm_utils.parse_rate_limits.
+        """
+
+        with self._condition:
+            self._refill()
+            self.server_requests_per_minute = int(limits.get("limit_requests", self.server_requests_per_minute))
+            self.server_tokens_per_minute = int(limits.get("limit_tokens", self.server_tokens_per_minute))
+            self._update_limits()
+
+            for bucket, remaining, reset in ((self._requests, "remaining_requests", "reset_requests"),
+                                             (self._tokens, "remaining_tokens", "reset_tokens")):
+                if remaining not in limits:
+                    continue
+                if bucket.limit:
+                    bucket.level = min(bucket.level, limits[remaining])
+                if limits[remaining] <= 0 and limits.get(reset):
+                    self._paused_until = max(self._paused_until, time.monotonic() + limits[reset])
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the state of the limiter and its throttle events so far.
+
+        :return: Effective limits, concurrency window, requests in flight, pause and event counts.
+        """
+
+        with self._condition:
+            self._refill()
+            return {"requests_per_minute": self._requests.limit, "tokens_per_minute": self._tokens.limit,
+                    "concurrency": self.concurrency, "max_concurrency": self.max_concurrency,
+                    "in_flight": self.in_flight, "paused_s": max(0.0, self._paused_until - time.monotonic()),
+                    "throttled": self.throttled, "waited_s": self.waited_s,
+                    "rate_limited": self.rate_limited, "decreases": self.decreases}
+
+
+def format_limiter(stats: Dict[str, Any]) -> str:
+    """
+    Describe the state of a rate limiter in one line.
+
+    :param stats: Dictionary returned by RateLimiter.stats.
+    :return: A human-readable summary.
+    """
+
+    limits = [f"{stats['requests_per_minute']:g} rpm" if stats["requests_per_minute"] else "",
+              f"{stats['tokens_per_minute']:g} tpm" if stats["tokens_per_minute"] else ""]
+    paused = f", paused {stats['paused_s']:.1f}s" if stats["paused_s"] else ""
+    return (f"Rate limit: {' / '.join(limit for limit in limits if limit) or 'none'}, "
+            f"concurrency {stats['concurrency']:.1f}/{stats['max_concurrency']} ({stats['in_flight']} in flight"
+            f"{paused}); {stats['throttled']} throttled for {stats['waited_s']:.1f}s, "
+            f"{stats['rate_limited']} rate limited")
+
+
+class RateLimitedBackend(LLMBackend):
+    """Backend wrapper sending every request through a RateLimiter and feeding it the outcome."""
+
+    def __init__(self, backend: LLMBackend, limiter: RateLimiter,
+                 expected_completion_tokens: int = EXPECTED_COMPLETION_TOKENS):
+        """
+        Wrap a backend and let the limiter follow its rate limit headers.
+
+        :param backend: Backend sending the requests.
+        :param limiter: Limiter shared by every request of the application.
+        :param expected_completion_tokens: Completion tokens reserved for a request before it is sent.
+        """
+
+        self.backend = backend
+        self.limiter = limiter
+        self.expected_completion_tokens = expected_completion_tokens
+        self.name = backend.name
+
+        backend.on_rate_limits = limiter.observe
+
+    @property
+    def identity(self) -> str:
+        return self.backend.identity
+
+    def _acquire(self, messages: Messages, model: str) -> None:
+        tokens = sum(_count_tokens(message["content"], model) for message in messages)
+        _local.wait_s = getattr(_local, "wait_s", 0.0) + self.limiter.acquire(tokens + self.expected_completion_tokens)
+
+    def _release(self, completion: str, model: str) -> None:
+        self.limiter.on_success(_count_tokens(completion, model) - self.expected_completion_tokens)
+
+    def complete(self, messages: Messages, model: str) -> str:
+        self._acquire(messages, model)
+        try:
+            completion = self.backend.complete(messages, model)
+        except LLMRateLimitError as error:
+            self.limiter.on_rate_limited(error.retry_after)
+            raise
+        except BaseException:
+            self.limiter.on_failure()
+            raise
+        self._release(completion, model)
+        return completion
+
+    def stream(self, messages: Messages, model: str) -> Iterator[str]:
+        self._acquire(messages, model)
+        deltas = []
+        try:
+            for delta in self.backend.stream(messages, model):
+                deltas.append(delta)
+                yield delta
+        except LLMRateLimitError as error:
+            self.limiter.on_rate_limited(error.retry_after)
+            raise
+        except BaseException:
+            # Also a stream abandoned by its reader.
+            self.limiter.on_failure()
+            raise
+        self._release("".join(deltas), model)
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the application-wide rate limiter, configured with RATE_LIMIT_RPM, RATE_LIMIT_TPM and
+    RATE_LIMIT_CONCURRENCY from config.json.
+
+    :return: The shared RateLimiter instance.
+    """
+
+    global _default_limiter
+
+    settings = get_settings()
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter(settings.rate_limit_rpm, settings.rate_limit_tpm,
+                                           settings.rate_limit_concurrency)
+        else:
+            _default_limiter.configure(settings.rate_limit_rpm, settings.rate_limit_tpm,
+                                       settings.rate_limit_concurrency)
+        return _default_limiter
+
+
+def rate_limited(backend: LLMBackend) -> LLMBackend:
+    """
+    Wrap a backend with the application-wide rate limiter.
+
+    :param backend: Backend to wrap.
+    :return: The wrapped backend.
+    """
+
+    return RateLimitedBackend(backend, get_rate_limiter())
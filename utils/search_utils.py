@@ -0,0 +1,302 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple
+
+from utils.file_utils import get_search_index_path
+from utils.package_utils import note_guid, read_package_notes
+
+SEARCH_LIMIT = 20
+SNIPPET_TOKENS = 12
+PREFIX_MIN_CHARS = 3
+
+_PACKAGE_SUFFIX_RE = re.compile(r"\.(part|shard)\d+$")
+
+CARDS = "cards"
+SOURCES = "sources"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    guid TEXT NOT NULL UNIQUE,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    source TEXT NOT NULL,
+    model TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+    question, answer, deck, source,
+    content='cards', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS cards_ai AFTER INSERT ON cards BEGIN
+    INSERT INTO cards_fts (rowid, question, answer, deck, source)
+    VALUES (new.id, new.question, new.answer, new.deck, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS cards_ad AFTER DELETE ON cards BEGIN
+    INSERT INTO cards_fts (cards_fts, rowid, question, answer, deck, source)
+    VALUES ('delete', old.id, old.question, old.answer, old.deck, old.source);
+END;
+CREATE TRIGGER IF NOT EXISTS cards_au AFTER UPDATE ON cards BEGIN
+    INSERT INTO cards_fts (cards_fts, rowid, question, answer, deck, source)
+    VALUES ('delete', old.id, old.question, old.answer, old.deck, old.source);
+    INSERT INTO cards_fts (rowid, question, answer, deck, source)
+    VALUES (new.id, new.question, new.answer, new.deck, new.source);
+END;
+
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS sources_fts USING fts5(
+    name, text,
+    content='sources', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS sources_ai AFTER INSERT ON sources BEGIN
+    INSERT INTO sources_fts (rowid, name, text) VALUES (new.id, new.name, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS sources_ad AFTER DELETE ON sources BEGIN
+    INSERT INTO sources_fts (sources_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS sources_au AFTER UPDATE ON sources BEGIN
+    INSERT INTO sources_fts (sources_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+    INSERT INTO sources_fts (rowid, name, text) VALUES (new.id, new.name, new.text);
+END;
+
+CREATE TABLE IF NOT EXISTS packages (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def match_query(text: str) -> str:
+    """
+    Turn the words typed by the user into an FTS5 query matching the entries that contain all of them.
+
+    Every word is quoted, so punctuation and FTS5 operators are searched for literally. The last word also
+    matches longer words starting with it, unless it is shorter than PREFIX_MIN_CHARS and would match too many.
+
+    :param text: Search text.
+    :return: The FTS5 query, empty if the text has no words.
+    """
+
+    terms = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if terms and len(text.split()[-1]) >= PREFIX_MIN_CHARS:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchHit:
+    """A card or source text found by a search."""
+
+    def __init__(self, kind: str, title: str, question: str, answer: str, snippet: str,
+                 source: str = "", origin: str = "", model: str = "", updated: float = 0.0):
+        """
+        Initialize the hit.
+
+        :param kind: CARDS or SOURCES.
+        :param title: Deck of a card, name of a source text.
+        :param question: Question of a card; empty for a source text.
+        :param answer: Answer of a card; empty for a source text.
+        :param snippet: The matching part of the entry with the matched words in [brackets].
+        :param source: Source document a card was generated from.
+        :param origin: Where a card was saved: "gui", "cli", "queue" or "package".
+        :param model: Chat model that generated a card.
+        :param updated: Time the entry was last indexed.
+        """
+
+        self.kind = kind
+        self.title = title
+        self.question = question
+        self.answer = answer
+        self.snippet = snippet
+        self.source = source
+        self.origin = origin
+        self.model = model
+        self.updated = updated
+
+
+class SearchIndex:
+    """
+    Full-text index of the saved cards and of the source texts they were generated from, backed by SQLite FTS5.
+
+    Cards are keyed by their note GUID, so saving a card again only updates its deck and metadata; metadata
+    left empty keeps its earlier value, and indexing a package does not change where a known card was saved.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the index database.
+
+        :param path: Path of the SQLite database file.
+        """
+
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def add_cards(self, cards: Iterable[Tuple[str, str]], deck: str = "", source: str = "",
+                  model: str = "", origin: str = "") -> None:
+        """
+        Index or update cards in one transaction.
+
+        :param cards: Pairs of question and answer.
+        :param deck: Name of the deck the cards are saved to.
+        :param source: Name of the source document.
+        :param model: Chat model that generated the cards.
+        :param origin: Where the cards were saved: "gui", "cli", "queue" or "package".
+        """
+
+        now = time.time()
+        rows = [(note_guid(question, answer), question, answer, deck, source, model, origin, now)
+                for question, answer in cards]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO cards (guid, question, answer, deck, source, model, origin, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guid) DO UPDATE SET deck = excluded.deck, "
+                "source = CASE WHEN excluded.source = '' THEN source ELSE excluded.source END, "
+                "model = CASE WHEN excluded.model = '' THEN model ELSE excluded.model END, "
+                "origin = CASE WHEN excluded.origin IN ('', 'package') THEN origin ELSE excluded.origin END, "
+                "updated = excluded.updated", rows)
+            self._conn.commit()
+
+    def add_source(self, name: str, text: str) -> None:
+        """
+        Index or replace a source text.
+
+        :param name: Name of the source document.
+        :param text: Full text of the document.
+        """
+
+        with self._lock:
+            self._conn.execute("INSERT INTO sources (name, text, updated) VALUES (?, ?, ?) "
+                               "ON CONFLICT (name) DO UPDATE SET text = excluded.text, updated = excluded.updated",
+                               (name, text, time.time()))
+            self._conn.commit()
+
+    def index_package(self, package_path: str) -> int:
+        """
+        Index the notes of an Anki package unless it was indexed since its last change.
+
+        :param package_path: The path of the .apkg file.
+        :return: Number of notes indexed.
+        """
+
+        stat = os.stat(package_path)
+        with self._lock:
+            row = self._conn.execute("SELECT mtime, size FROM packages WHERE path = ?", (package_path,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            return 0
+
+        notes = list(read_package_notes(package_path))
+        deck = _PACKAGE_SUFFIX_RE.sub("", os.path.splitext(os.path.basename(package_path))[0])
+        self.add_cards(notes, deck, origin="package")
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO packages VALUES (?, ?, ?)",
+                               (package_path, stat.st_mtime, stat.st_size))
+            self._conn.commit()
+
+        return len(notes)
+
+    def index_package_dir(self, package_dir: str) -> int:
+        """
+        Index every changed Anki package in a directory.
+
+        :param package_dir: Directory with .apkg files.
+        :return: Number of notes indexed.
+        """
+
+        if not os.path.isdir(package_dir):
+            return 0
+
+        return sum(self.index_package(os.path.join(package_dir, filename))
+                   for filename in sorted(os.listdir(package_dir)) if filename.endswith(".apkg"))
+
+    def search(self, text: str, kind: str = CARDS, limit: int = SEARCH_LIMIT, raw: bool = False) -> List[SearchHit]:
+        """
+        Find the best matching cards or source texts.
+
+        :param text: Words to search for, or an FTS5 query with raw=True.
+        :param kind: CARDS or SOURCES.
+        :param limit: Maximum number of hits.
+        :param raw: Pass the text to FTS5 as it is, e.g. 'question:inflation AND deck:economics'.
+        :return: The hits, best match first.
+        :raises ValueError: If a raw query is not valid FTS5 syntax.
+        """
+
+        query = text if raw else match_query(text)
+        if not query:
+            return []
+
+        if kind == SOURCES:
+            sql = (f"SELECT s.name, snippet(sources_fts, 1, '[', ']', '...', {SNIPPET_TOKENS}), s.updated "
+                   "FROM sources_fts JOIN sources s ON s.id = sources_fts.rowid "
+                   "WHERE sources_fts MATCH ? ORDER BY rank LIMIT ?")
+        else:
+            sql = (f"SELECT c.deck, c.question, c.answer, "
+                   f"snippet(cards_fts, -1, '[', ']', '...', {SNIPPET_TOKENS}), "
+                   "c.source, c.origin, c.model, c.updated "
+                   "FROM cards_fts JOIN cards c ON c.id = cards_fts.rowid "
+                   "WHERE cards_fts MATCH ? ORDER BY rank LIMIT ?")
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(sql, (query, limit)).fetchall()
+        except sqlite3.OperationalError as error:
+            raise ValueError(f"Invalid search query '{text}': {error}") from error
+
+        if kind == SOURCES:
+            return [SearchHit(SOURCES, name, "", "", snippet, updated=updated) for name, snippet, updated in rows]
+        return [SearchHit(CARDS, deck, question, answer, snippet, source, origin, model, updated)
+                for deck, question, answer, snippet, source, origin, model, updated in rows]
+
+    def counts(self) -> Tuple[int, int]:
+        """
+        Count the indexed entries.
+
+        :return: Number of cards and of source texts.
+        """
+
+        with self._lock:
+            return (self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0],
+                    self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0])
+
+    def close(self) -> None:
+        """Close the index database."""
+
+        with self._lock:
+            self._conn.close()
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """
+    Get the application-wide search index, opening it on first use.
+
+    :return: The shared SearchIndex instance.
+    """
+
+    global _default_index
+
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex(get_search_index_path())
+        return _default_index
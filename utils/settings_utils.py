@@ -0,0 +1,308 @@
+import os
+import json
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.file_utils import get_config_path
+
+MB = 1024 * 1024
+
+# Defaults of the settings, imported from here by the modules that use them,
+# so that reading the settings does not import the generation machinery.
+DEFAULT_BACKEND = "openai"
+DEFAULT_MODEL = "gpt-3.5-turbo"
+CHUNK_MAX_TOKENS = 1500
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+CACHE_MAX_ENTRIES = 5000
+CACHE_MAX_BYTES = 50 * MB
+HTTP_TIMEOUT = 120
+ANKI_CONNECT_TIMEOUT = 10
+MAX_CONCURRENCY = 16
+JOB_WORKERS = 2
+SIMILARITY_THRESHOLD = 0.9
+
+# config.json key -> (type, default, minimum); keys not listed here are kept as they are.
+SETTINGS_SCHEMA = {
+    "API_KEY": (str, "", None),
+    "BACKEND": (str, DEFAULT_BACKEND, None),
+    "API_BASE": (str, "", None),
+    "MODEL": (str, DEFAULT_MODEL, None),
+    "MAX_WORKERS": (int, MAX_WORKERS, 1),
+    "CHUNK_TOKENS": (int, CHUNK_MAX_TOKENS, 100),
+    "MAX_RETRIES": (int, MAX_RETRIES, 0),
+    "CACHE_MAX_ENTRIES": (int, CACHE_MAX_ENTRIES, 0),
+    "CACHE_MAX_MB": (float, CACHE_MAX_BYTES / MB, 0),
+    "REQUEST_TIMEOUT": (float, HTTP_TIMEOUT, 1),
+    "ANKI_CONNECT_TIMEOUT": (float, ANKI_CONNECT_TIMEOUT, 1),
+    "RATE_LIMIT_RPM": (int, 0, 0),
+    "RATE_LIMIT_TPM": (int, 0, 0),
+    "RATE_LIMIT_CONCURRENCY": (int, MAX_CONCURRENCY, 1),
+    "QUEUE_WORKERS": (int, JOB_WORKERS, 1),
+    "COVERAGE_SIMILARITY": (float, SIMILARITY_THRESHOLD, 0),
+    "PACKAGE_WORKERS": (int, 0, 0),
+}
+
+
+class Settings:
+    """
+    Application settings stored in config.json, kept in memory.
+
+    The file is parsed once and again only when its modification time or size changes, so reading a setting
+    costs a stat call. Saving replaces the file atomically and notifies the subscribers.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the settings; the file is read on first access.
+
+        :param path: Path of the JSON settings file.
+        """
+
+        self.path = path
+        self.version = 0
+
+        self._data: Dict[str, Any] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._listeners: List[Callable[["Settings"], None]] = []
+        self._lock = threading.RLock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> bool:
+        """
+        Reload the file if it changed since it was last read.
+
+        :return: True if the settings changed.
+        """
+
+        signature = self._stat()
+        if self._loaded and signature == self._signature:
+            return False
+
+        data = {}
+        if signature is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as settings_file:
+                    data = json.load(settings_file)
+            except (OSError, ValueError) as error:
+                print(f"Could not read {self.path}, keeping the previous settings: {error}")
+                data = self._data
+
+        changed = self._loaded and data != self._data
+        self._data = data if isinstance(data, dict) else {}
+        self._signature = signature
+        self._loaded = True
+        self.version += 1
+        return changed
+
+    def values(self) -> Dict[str, Any]:
+        """
+        Get every setting as stored in the file.
+
+        :return: A copy of the settings dictionary.
+        """
+
+        with self._lock:
+            changed = self._refresh()
+            data = dict(self._data)
+
+        if changed:
+            self._notify()
+        return data
+
+    def get(self, key: str) -> Any:
+        """
+        Get a setting converted to the type of SETTINGS_SCHEMA.
+
+        A missing or invalid value falls back to the schema default.
+
+        :param key: Name of the setting in config.json.
+        :return: The typed value, or the raw value for keys outside the schema.
+        """
+
+        value = self.values().get(key)
+        if key not in SETTINGS_SCHEMA:
+            return value
+
+        kind, default, minimum = SETTINGS_SCHEMA[key]
+        if value is None or value == "":
+            return default
+
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            print(f"Invalid {key} in {self.path}: {value!r}, using {default!r}")
+            return default
+
+        if minimum is not None and value < minimum:
+            print(f"{key} in {self.path} must be at least {minimum}, using {default!r}")
+            return default
+        return value
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """
+        Change some settings and save them, keeping every other setting in the file.
+
+        The file is written to a temporary file next to it and renamed over it,
+        so a crash never leaves a truncated config.json behind.
+
+        :param values: Settings to change.
+        """
+
+        with self._lock:
+            self._refresh()
+            data = dict(self._data, **values)
+
+            directory = os.path.dirname(self.path) or "."
+            fd, temp_path = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+                    json.dump(data, temp_file, indent=4)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            self._data = data
+            self._signature = self._stat()
+            self.version += 1
+
+        self._notify()
+
+    def subscribe(self, callback: Callable[["Settings"], None]) -> None:
+        """
+        Call a function whenever the settings are saved or the file is changed by someone else.
+
+        :param callback: Function receiving the Settings instance.
+        """
+
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self._listeners):
+            callback(self)
+
+    @property
+    def api_key(self) -> str:
+        return self.get("API_KEY")
+
+    @property
+    def backend(self) -> str:
+        return self.get("BACKEND")
+
+    @property
+    def api_base(self) -> str:
+        return self.get("API_BASE")
+
+    @property
+    def model(self) -> str:
+        return self.get("MODEL")
+
+    @property
+    def max_workers(self) -> int:
+        """Maximum number of generation requests in flight."""
+
+        return self.get("MAX_WORKERS")
+
+    @property
+    def chunk_tokens(self) -> int:
+        """Token budget of one chunk of the source text."""
+
+        return self.get("CHUNK_TOKENS")
+
+    @property
+    def max_retries(self) -> int:
+        """Number of retries of a chunk after a transient error."""
+
+        return self.get("MAX_RETRIES")
+
+    @property
+    def cache_max_entries(self) -> int:
+        """Maximum number of responses in the response cache."""
+
+        return self.get("CACHE_MAX_ENTRIES")
+
+    @property
+    def cache_max_bytes(self) -> int:
+        """Maximum total size of the response cache in bytes."""
+
+        return int(self.get("CACHE_MAX_MB") * MB)
+
+    @property
+    def request_timeout(self) -> float:
+        """Read timeout of one model request in seconds."""
+
+        return self.get("REQUEST_TIMEOUT")
+
+    @property
+    def anki_connect_timeout(self) -> float:
+        """Timeout of one AnkiConnect request in seconds."""
+
+        return self.get("ANKI_CONNECT_TIMEOUT")
+
+    @property
+    def rate_limit_rpm(self) -> int:
+        """Maximum number of model requests per minute, 0 for no limit."""
+
+        return self.get("RATE_LIMIT_RPM")
+
+    @property
+    def rate_limit_tpm(self) -> int:
+        """Maximum number of prompt plus completion tokens per minute, 0 for no limit."""
+
+        return self.get("RATE_LIMIT_TPM")
+
+    @property
+    def rate_limit_concurrency(self) -> int:
+        """Maximum number of model requests in flight; lowered automatically after rate limit errors."""
+
+        return self.get("RATE_LIMIT_CONCURRENCY")
+
+    @property
+    def queue_workers(self) -> int:
+        """Number of documents of the job queue generated at the same time."""
+
+        return self.get("QUEUE_WORKERS")
+
+    @property
+    def coverage_similarity(self) -> float:
+        """Minimum similarity of a source chunk to an already carded one for the chunk to be skipped."""
+
+        return self.get("COVERAGE_SIMILARITY")
+
+    @property
+    def package_workers(self) -> int:
+        """Number of processes preparing the notes of large packages, 0 for one per CPU."""
+
+        return self.get("PACKAGE_WORKERS")
+
+
+_default_settings = None
+_default_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """
+    Get the application-wide settings, stored in config.json in the project directory.
+
+    :return: The shared Settings instance.
+    """
+
+    global _default_settings
+
+    with _default_settings_lock:
+        if _default_settings is None:
+            _default_settings = Settings(get_config_path())
+        return _default_settings
@@ -0,0 +1,197 @@
+import queue
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from typing import Any, Callable, Optional
+
+TASK_WORKERS = 4
+POLL_INTERVAL_MS = 50
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Task:
+    """Handle of a function running on a TaskRunner worker thread."""
+
+    def __init__(self, task_id: int, runner: "TaskRunner",
+                 on_event: Optional[Callable] = None,
+                 on_done: Optional[Callable] = None,
+                 on_error: Optional[Callable] = None,
+                 name: str = ""):
+        """
+        Initialize the task handle.
+
+        :param task_id: Sequential id of the task.
+        :param runner: Runner executing the task.
+        :param on_event: Callback called with (task, event, payload) for every posted event.
+        :param on_done: Callback called with (task, result) when the function returns.
+        :param on_error: Callback called with (task, error) when the function raises or is cancelled.
+        :param name: Description of the task shown to the user.
+        """
+
+        self.task_id = task_id
+        self.name = name or f"Task {task_id}"
+        self.runner = runner
+        self.on_event = on_event
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.finished = False
+
+        self.state = QUEUED
+        self.stage = ""
+        self.done = 0
+        self.total = 0
+        self.error: Optional[BaseException] = None
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel was called."""
+
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """Ask the task to stop; a task that has not started yet never runs."""
+
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.runner.events.put((self, "error", CancelledError()))
+
+    def check_cancelled(self) -> None:
+        """Raise CancelledError in the worker thread if the task was cancelled."""
+
+        if self.cancelled:
+            raise CancelledError()
+
+    def post(self, event: str, payload: Any = None) -> None:
+        """
+        Send an event from the worker thread to the thread processing the runner events.
+
+        :param event: Name of the event.
+        :param payload: Data attached to the event.
+        """
+
+        self.runner.events.put((self, "event", (event, payload)))
+
+    def progress(self, stage: str, done: int = 0, total: int = 0) -> None:
+        """
+        Report the progress of the task from the worker thread.
+
+        The stage and counts are stored on the task by process_events and are not passed to on_event.
+
+        :param stage: Name of the current stage, e.g. "packaging".
+        :param done: Units of work finished in this stage.
+        :param total: Units of work in this stage, 0 if unknown.
+        """
+
+        self.runner.events.put((self, "progress", (stage, done, total)))
+
+
+class TaskRunner:
+    """Thread pool whose results are delivered through a queue polled by the GUI thread."""
+
+    def __init__(self, max_workers: int = TASK_WORKERS):
+        """
+        Initialize the runner.
+
+        :param max_workers: Maximum number of tasks running at the same time.
+        """
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.events = queue.Queue()
+        self.tasks = []
+        self._ids = itertools.count(1)
+
+    @property
+    def active(self) -> bool:
+        """True while any submitted task has not been reported as finished."""
+
+        return bool(self.tasks)
+
+    def submit(self, fn: Callable, *args,
+               on_event: Optional[Callable] = None,
+               on_done: Optional[Callable] = None,
+               on_error: Optional[Callable] = None,
+               name: str = "") -> Task:
+        """
+        Run fn(task, *args) on a worker thread.
+
+        The callbacks are only ever called from process_events, i.e. in the thread polling the runner.
+
+        :param fn: Function to run; it receives the Task handle as its first argument.
+        :param args: Additional positional arguments for fn.
+        :param on_event: Callback called with (task, event, payload) for every event posted by fn.
+        :param on_done: Callback called with (task, result) when fn returns.
+        :param on_error: Callback called with (task, error) when fn raises or the task is cancelled.
+        :param name: Description of the task shown to the user.
+        :return: The task handle.
+        """
+
+        task = Task(next(self._ids), self, on_event, on_done, on_error, name)
+        self.tasks.append(task)
+        task.future = self.executor.submit(self._run, task, fn, args)
+        return task
+
+    def _run(self, task: Task, fn: Callable, args: tuple) -> None:
+        try:
+            task.check_cancelled()
+            task.state = RUNNING
+            result = fn(task, *args)
+            task.check_cancelled()
+        except BaseException as error:
+            self.events.put((task, "error", error))
+        else:
+            self.events.put((task, "done", result))
+
+    def process_events(self) -> None:
+        """Deliver every queued event to the task callbacks."""
+
+        while True:
+            try:
+                task, kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+
+            if task.finished:
+                continue
+
+            if kind == "event":
+                if task.on_event is not None and not task.cancelled:
+                    task.on_event(task, *payload)
+                continue
+
+            if kind == "progress":
+                task.stage, task.done, task.total = payload
+                continue
+
+            task.finished = True
+            self.tasks.remove(task)
+
+            if kind == "done":
+                task.state = DONE
+            else:
+                task.state = CANCELLED if isinstance(payload, CancelledError) else FAILED
+                task.error = payload
+
+            if kind == "done" and task.on_done is not None:
+                task.on_done(task, payload)
+            elif kind == "error" and task.on_error is not None:
+                task.on_error(task, payload)
+
+    def cancel_all(self) -> None:
+        """Cancel every task that has not finished yet."""
+
+        for task in list(self.tasks):
+            task.cancel()
+
+    def shutdown(self) -> None:
+        """Cancel the remaining tasks and stop the worker threads."""
+
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
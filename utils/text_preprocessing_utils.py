@@ -1,27 +1,483 @@
-from typing import Dict
+import io
+import re
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+TEXT_MODE = "text"
+JSON_MODE = "json"
 
-def preprocess_response(text: str) -> Dict[int, Dict[str, str]]:
+_FRONT_LABELS = ("front", "question", "q")
+_BACK_LABELS = ("back", "answer", "a")
+
+# "Front: ...", "1. **Question:** ...", "- Q: ...", "### Back: ..." and similar list, heading and emphasis variants.
+_FIELD_RE = re.compile(
+    r"(?:[-*+>]\s+|#{1,6}\s*|(?i:card\s*)?\d+\s*[.):]\s*)*"
+    r"(?:\*\*|__)?\s*((?i:front|back|question|answer)|[QA])\s*(?:\*\*|__)?\s*[:：]\s*(?:\*\*)?\s*(.*)")
+# Lines that only separate cards: "Card 3", "**Flashcard 2:**", "---", code fences.
+_SEPARATOR_RE = re.compile(
+    r"(?:#{1,6}\s*)?(?:\*\*)?(?i:(?:flash)?card)\s*#?\d*\s*[.:)]?\s*(?:\*\*)?|[-=*_]{3,}|```\w*")
+_JSON_START_RE = re.compile(r"\s*(?:```[^\n]*\n)?\s*([\[{])")
+# A whole string (group 1 is None while the string is unterminated) or a bracket.
+_JSON_TOKEN_RE = re.compile(r'"(?:[^"\\]+|\\.)*(")?|[{}\[\]]')
+
+
+class ParseReport:
+    """Summary of what a parser recovered from and what it had to skip."""
+
+    def __init__(self):
+        """Initialize an empty report."""
+
+        self.mode: Optional[str] = None
+        self.cards = 0
+        self.skipped_lines = 0
+        self.issues: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def ok(self) -> bool:
+        """True if every card-like part of the response was turned into a card."""
+
+        return not self.issues
+
+    def add_issue(self, message: str) -> None:
+        """
+        Record a problem the parser recovered from.
+
+        :param message: Description of the problem, including where it happened.
+        """
+
+        self.issues.append(message)
+
+    def merge(self, other: "ParseReport", label: str = "") -> None:
+        """
+        Add the counts and issues of another report; safe to call from several threads.
+
+        :param other: Report of one response, e.g. of one chunk.
+        :param label: Prefix for the issues of the other report, e.g. "chunk 3".
+        """
+
+        with self._lock:
+            self.mode = self.mode or other.mode
+            self.cards += other.cards
+            self.skipped_lines += other.skipped_lines
+            self.issues.extend(f"{label}: {issue}" if label else issue for issue in other.issues)
+
+    def summary(self) -> str:
+        """
+        Describe the report in one line.
+
+        :return: Number of cards, skipped lines and issues.
+        """
+
+        return f"{self.cards} cards parsed, {self.skipped_lines} lines skipped, {len(self.issues)} issues"
+
+
+def detect_mode(head: str, final: bool = True) -> Optional[str]:
     """
-    Preprocess the given text and create a dictionary of flashcards.
+    Tell whether a response is a JSON document or "Front:/Back:" text from its first characters.
 
-    :param text: Text containing flashcard data.
-    :return: A dictionary with integer keys and flashcard data as values.
+    :param head: Beginning of the response.
+    :param final: True if no more text will follow, so the decision cannot be postponed.
+    :return: TEXT_MODE, JSON_MODE, or None if more text is needed to decide.
     """
 
+    head = head.lstrip()
+    if not head:
+        return TEXT_MODE if final else None
+    if head[0] in "[{":
+        return JSON_MODE
+    if "```".startswith(head[:3]) and not head.startswith("```"):
+        return TEXT_MODE if final else None
+    if head.startswith("```"):
+        newline = head.find("\n")
+        if newline < 0:
+            return (JSON_MODE if head[3:].strip().lower() == "json" else TEXT_MODE) if final else None
+        if head[3:newline].strip().lower() == "json":
+            return JSON_MODE
+        rest = head[newline + 1:].lstrip()
+        if not rest and not final:
+            return None
+        return JSON_MODE if rest[:1] in ("[", "{") else TEXT_MODE
+    return TEXT_MODE
+
+
+def _json_text(value: Any) -> str:
+    if isinstance(value, list):
+        return "\n".join(_json_text(item) for item in value)
+    return value.strip() if isinstance(value, str) else json.dumps(value)
+
+
+def _decode_document(text: str) -> Any:
+    """
+    Decode a JSON response, ignoring a surrounding code fence.
+
+    :param text: The whole response.
+    :return: The decoded document, or None if it is not valid JSON.
+    """
+
+    match = _JSON_START_RE.match(text)
+    if match is None:
+        return None
+
+    end = text.rfind("]" if match.group(1) == "[" else "}") + 1
     try:
-        splitted_cards = text.split("\n")
-        sorted_cards = list(filter(lambda t: len(t) > 0, splitted_cards))
+        return json.loads(text[match.start(1):end])
+    except json.JSONDecodeError:
+        return None
+
+
+def _document_items(document: Any) -> List[Any]:
+    """
+    Find the list of cards in a decoded JSON response.
+
+    :param document: A list of cards, an object holding one (e.g. {"cards": [...]}), or a single card.
+    :return: The items describing cards.
+    """
+
+    if isinstance(document, dict):
+        return next((value for value in document.values() if isinstance(value, list)), [document])
+    return document if isinstance(document, list) else [document]
+
+
+class CardStreamParser:
+    """
+    Single-pass parser turning a (possibly streamed) response into flashcards.
+
+    "Front:/Back:" text is processed line by line: numbering, bullets, headings and bold labels are ignored,
+    lines following a label continue its field, and a blank line or the next "Front:" completes the card.
+    A response starting with a JSON array or object (optionally in a ```json fence) is read as a list of
+    {"front", "back"} (or "question"/"answer") objects; array items are parsed as soon as each one is closed.
+    Anything that cannot be turned into a card is skipped and recorded in the report instead of raising.
+    """
+
+    def __init__(self, report: Optional[ParseReport] = None):
+        """
+        Initialize an empty parser.
+
+        :param report: Report collecting recovered problems, a new one is created if omitted.
+        """
+
+        self.report = report if report is not None else ParseReport()
+        self.mode: Optional[str] = None
+
+        self._buffer = ""
+        self._line_no = 0
+
+        self._question: Optional[List[str]] = None
+        self._answer: Optional[List[str]] = None
+        self._field: Optional[List[str]] = None
+        self._card_line = 0
+
+        self._json_pos = 0
+        self._json_started = False
+        self._json_object = False
+        self._json_done = False
+        self._json_depth = 0
+        self._json_item_start: Optional[int] = None
+        self._json_items = 0
+
+    def feed(self, text: str) -> List[Dict[str, str]]:
+        """
+        Feed the next piece of the response.
+
+        :param text: Text delta received from the model.
+        :return: A list of flashcards completed by this piece, possibly empty.
+        """
+
+        self._buffer += text
+
+        if self.mode is None:
+            self._set_mode(detect_mode(self._buffer[:64], final=False))
+            if self.mode is None:
+                return []
+
+        if self.mode == JSON_MODE:
+            return self._scan_json()
+
+        *lines, self._buffer = self._buffer.split("\n")
+        return [card for card in map(self._parse_line, lines) if card is not None]
+
+    def close(self) -> List[Dict[str, str]]:
+        """
+        Finish parsing: flush the last, unterminated line and the card still being read.
+
+        :return: A list of the flashcards completed by the end of the response.
+        """
+
+        if self.mode is None:
+            self._set_mode(detect_mode(self._buffer[:64]))
+
+        if self.mode == JSON_MODE:
+            cards = self._scan_json()
+            return cards + self._close_json()
+
+        line, self._buffer = self._buffer, ""
+        cards = [self._parse_line(line), self._finish_card()]
+        return [card for card in cards if card is not None]
+
+    def parse(self, text: str) -> Iterator[Dict[str, str]]:
+        """
+        Parse a complete response lazily, without splitting it into a list of lines.
+
+        :param text: The whole response.
+        :return: An iterator over flashcard dictionaries.
+        """
+
+        self._set_mode(detect_mode(text[:64]))
+
+        if self.mode == JSON_MODE:
+            # A well-formed document is decoded at once; the item scanner only has to recover broken ones.
+            document = _decode_document(text)
+            if document is not None:
+                for card in map(self._json_card, _document_items(document)):
+                    if card is not None:
+                        yield card
+                return
+            yield from self.feed(text)
+        else:
+            for line in io.StringIO(text):
+                card = self._parse_line(line)
+                if card is not None:
+                    yield card
 
-        cards_dict = {}
-        for index, card in enumerate(sorted_cards[::2]):
-            question = card.split("Front: ")[-1].strip()
-            answer = sorted_cards[index * 2 + 1].split("Back: ")[-1].strip()
-            cards_dict[index] = {"question": question, "answer": answer}
+        yield from self.close()
 
-        return cards_dict
-    except ValueError as err:
-        print(f"Error while preprocessing response: {err}")
+    def _set_mode(self, mode: Optional[str]) -> None:
+        self.mode = mode
+        if mode is not None:
+            self.report.mode = mode
+
+    def _parse_line(self, line: str) -> Optional[Dict[str, str]]:
+        """
+        Process one complete line of a text response.
+
+        :param line: Line of the response.
+        :return: A flashcard if the line completed one, otherwise None.
+        """
+
+        self._line_no += 1
+        line = line.strip()
+
+        if not line:
+            # A blank line ends a field that already has text; an answer that ends is a complete card.
+            if self._field:
+                if self._field is self._answer:
+                    return self._finish_card()
+                self._field = None
+            return None
+
+        if _SEPARATOR_RE.fullmatch(line):
+            if self._answer is not None:
+                return self._finish_card()
+            self._field = None
+            return None
+
+        match = _FIELD_RE.fullmatch(line)
+        if match is None:
+            if self._field is not None:
+                self._field.append(line)
+            else:
+                self.report.skipped_lines += 1
+            return None
+
+        label, value = match.group(1).lower(), match.group(2).strip()
+
+        if label in _FRONT_LABELS:
+            card = self._finish_card()
+            self._question = [value] if value else []
+            self._answer = None
+            self._field = self._question
+            self._card_line = self._line_no
+            return card
+
+        if self._question is None:
+            self.report.add_issue(f"line {self._line_no}: back without a front skipped")
+            self._field = None
+        elif self._answer is not None:
+            self.report.add_issue(f"line {self._line_no}: second back appended to the card of line "
+                                  f"{self._card_line}")
+            self._answer.append(value)
+            self._field = self._answer
+        else:
+            self._answer = [value] if value else []
+            self._field = self._answer
+
+        return None
+
+    def _finish_card(self) -> Optional[Dict[str, str]]:
+        """
+        Complete the card being read.
+
+        :return: The card, or None if there is no card or it has no back.
+        """
+
+        if self._question is None:
+            return None
+
+        question, answer = self._question, self._answer
+        self._question = self._answer = self._field = None
+
+        if answer is None:
+            self.report.add_issue(f"line {self._card_line}: card without a back skipped")
+            return None
+
+        return self._make_card("\n".join(question), "\n".join(answer), f"line {self._card_line}")
+
+    def _make_card(self, question: str, answer: str, where: str) -> Optional[Dict[str, str]]:
+        if not question or not answer:
+            self.report.add_issue(f"{where}: card with an empty {'front' if not question else 'back'} skipped")
+            return None
+
+        self.report.cards += 1
+        return {"question": question, "answer": answer}
+
+    def _json_card(self, item: Any) -> Optional[Dict[str, str]]:
+        """
+        Turn one decoded JSON item into a card.
+
+        :param item: An object with front/back (or question/answer) keys, or a [front, back] pair.
+        :return: The card, or None if the item does not describe one.
+        """
+
+        self._json_items += 1
+        where = f"item {self._json_items}"
+
+        if isinstance(item, list) and len(item) == 2:
+            return self._make_card(_json_text(item[0]), _json_text(item[1]), where)
+
+        if not isinstance(item, dict):
+            self.report.add_issue(f"{where}: not a card object, skipped")
+            return None
+
+        fields = {str(key).strip().lower(): value for key, value in item.items()}
+        question = next((fields[key] for key in _FRONT_LABELS if key in fields), None)
+        answer = next((fields[key] for key in _BACK_LABELS if key in fields), None)
+        if question is None or answer is None:
+            self.report.add_issue(f"{where}: object without a {'front' if question is None else 'back'} skipped")
+            return None
+
+        return self._make_card(_json_text(question), _json_text(answer), where)
+
+    def _scan_json(self) -> List[Dict[str, str]]:
+        """
+        Parse every item of a top-level JSON array that was closed in the buffer.
+
+        Brackets are matched with a regular expression that skips whole strings, so each item is decoded exactly once
+        and a malformed item only loses itself. A top-level object is parsed as a whole by close.
+
+        :return: A list of the flashcards completed so far.
+        """
+
+        buffer = self._buffer
+        if not self._json_started:
+            match = _JSON_START_RE.match(buffer)
+            if match is None:
+                return []
+            self._json_started = True
+            self._json_object = match.group(1) == "{"
+            self._json_pos = match.end()
+
+        if self._json_object or self._json_done:
+            return []
+
+        cards = []
+        pos = self._json_pos
+        while True:
+            match = _JSON_TOKEN_RE.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+
+            token = match.group()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # The string continues in the next piece of the response.
+                    pos = match.start()
+                    break
+                pos = match.end()
+                continue
+
+            pos = match.end()
+            if token in "{[":
+                if self._json_depth == 0:
+                    self._json_item_start = match.start()
+                self._json_depth += 1
+            else:
+                self._json_depth -= 1
+                if self._json_depth < 0:
+                    self._json_done = True
+                    break
+                if self._json_depth == 0:
+                    source = buffer[self._json_item_start:pos]
+                    self._json_item_start = None
+                    try:
+                        card = self._json_card(json.loads(source))
+                    except json.JSONDecodeError as error:
+                        self._json_items += 1
+                        self.report.add_issue(f"item {self._json_items}: invalid JSON ({error.msg}) skipped")
+                        card = None
+                    if card is not None:
+                        cards.append(card)
+
+        # Keep only the unfinished item so the buffer never holds more than one card.
+        keep = pos if self._json_item_start is None else self._json_item_start
+        self._buffer = buffer[keep:]
+        self._json_pos = pos - keep
+        if self._json_item_start is not None:
+            self._json_item_start -= keep
+
+        return cards
+
+    def _close_json(self) -> List[Dict[str, str]]:
+        """
+        Finish a JSON response: decode a top-level object, or report a truncated array.
+
+        :return: A list of the flashcards of a top-level object.
+        """
+
+        if not self._json_started:
+            self.report.add_issue("response is not valid JSON")
+            return []
+
+        if not self._json_object:
+            if self._json_item_start is not None:
+                self.report.add_issue(f"item {self._json_items + 1}: truncated, skipped")
+            elif not self._json_done:
+                self.report.add_issue("JSON array is not closed")
+            return []
+
+        document = _decode_document(self._buffer)
+        self._buffer = ""
+        if document is None:
+            self.report.add_issue("response is not valid JSON")
+            return []
+
+        return [card for card in map(self._json_card, _document_items(document)) if card is not None]
+
+
+def iter_cards(text: str, report: Optional[ParseReport] = None) -> Iterator[Dict[str, str]]:
+    """
+    Parse a complete response in one pass.
+
+    :param text: Text or JSON containing flashcard data.
+    :param report: Report collecting recovered problems.
+    :return: An iterator over flashcard dictionaries.
+    """
+
+    return CardStreamParser(report).parse(text)
+
+
+def preprocess_response(text: str, report: Optional[ParseReport] = None) -> Dict[int, Dict[str, str]]:
+    """
+    Preprocess the given text and create a dictionary of flashcards.
+
+    :param text: Text containing flashcard data.
+    :param report: Report collecting the lines and items that could not be turned into cards.
+    :return: A dictionary with integer keys and flashcard data as values.
+    """
+
+    return dict(enumerate(iter_cards(text, report)))
 
 
 def create_textbox_text(front: str, back: str) -> str:
@@ -35,3 +491,15 @@ def create_textbox_text(front: str, back: str) -> str:
     ...
 
     return f"Front: {front}\nBack: {back}"
+
+
+def parse_textbox_text(text: str) -> Tuple[str, str]:
+    """
+    Split the text of an edited flashcard text box back into its front and back.
+
+    :param text: Text in the format produced by create_textbox_text.
+    :return: A tuple with the front and back of the flashcard.
+    """
+
+    front, _, back = text.partition("Back:")
+    return front.split("Front:", 1)[-1].strip(), back.strip()
@@ -0,0 +1,291 @@
+import os
+import csv
+import json
+from typing import TYPE_CHECKING, Callable, Iterable, List, Optional, Tuple
+
+from utils.package_utils import (create_model, deck_id_for, generate_random_id, note_guid, write_notes,
+                                 PROGRESS_STEP)
+
+if TYPE_CHECKING:
+    from genanki import Model
+
+SHARD_NOTES = 10000
+SHARD_INFIX = ".shard"
+TSV_NOTETYPE = "Basic"
+
+
+class CardWriter:
+    """
+    Base of the exporters that stream cards into files.
+
+    Cards are written as they come, so memory use does not grow with the deck. The files appear under their
+    final names only when the writer is closed; a writer left through an exception removes what it wrote.
+    """
+
+    extension = ""
+
+    def __init__(self, output_dir: str, deck_title: str):
+        """
+        Start writing a deck.
+
+        :param output_dir: Directory the files are written to.
+        :param deck_title: Name of the deck; a random name is used if it is empty.
+        """
+
+        if len(deck_title) <= 0:
+            deck_title = f"Package{generate_random_id()}"
+
+        self.output_dir = output_dir
+        self.deck_title = deck_title
+        self.count = 0
+        self.paths = []
+        self.closed = False
+        os.makedirs(output_dir, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        """Path of the exported file."""
+
+        return os.path.join(self.output_dir, f"{self.deck_title}{self.extension}")
+
+    def write(self, question: str, answer: str) -> None:
+        """
+        Add a card to the export.
+
+        :param question: Text of the front side.
+        :param answer: Text of the back side.
+        """
+
+        if self.closed:
+            raise ValueError(f"The export of {self.deck_title} is already closed")
+
+        self._write_card(note_guid(question, answer), question, answer)
+        self.count += 1
+
+    def write_many(self, cards: Iterable[Tuple[str, str]],
+                   on_progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Add cards to the export.
+
+        :param cards: Pairs of question and answer; an iterator is consumed one card at a time.
+        :param on_progress: Callback called with the number of cards written so far; an exception raised by it
+            stops the export.
+        :return: Number of cards written.
+        """
+
+        written = 0
+        for question, answer in cards:
+            self.write(question, answer)
+            written += 1
+            if on_progress is not None and written % PROGRESS_STEP == 0:
+                on_progress(written)
+
+        return written
+
+    def close(self) -> List[str]:
+        """
+        Finish the export and move the files to their final names.
+
+        :return: Paths of the exported files.
+        """
+
+        if not self.closed:
+            self.closed = True
+            self.paths = self._finish()
+
+        return self.paths
+
+    def abort(self) -> None:
+        """Stop the export and remove the files written so far."""
+
+        if not self.closed:
+            self.closed = True
+            self._discard()
+
+    def __enter__(self) -> "CardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_card(self, guid: str, question: str, answer: str) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> List[str]:
+        raise NotImplementedError
+
+    def _discard(self) -> None:
+        raise NotImplementedError
+
+
+class _TextWriter(CardWriter):
+    """Writer of a single text file, written next to its final name and renamed when closed."""
+
+    def __init__(self, output_dir: str, deck_title: str):
+        super().__init__(output_dir, deck_title)
+        self._tmp_path = f"{self.path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8", newline="")
+        self._write_header()
+
+    def _write_header(self) -> None:
+        pass
+
+    def _finish(self) -> List[str]:
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return [self.path]
+
+    def _discard(self) -> None:
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+class TSVWriter(_TextWriter):
+    """
+    Tab-separated text in the format of Anki's "Import File" dialog.
+
+    The header lines select the deck, the note type and the GUID column, so importing the file again
+    updates the notes instead of duplicating them.
+    """
+
+    extension = ".tsv"
+
+    def __init__(self, output_dir: str, deck_title: str, notetype: str = TSV_NOTETYPE):
+        """
+        Start writing a deck.
+
+        :param output_dir: Directory the file is written to.
+        :param deck_title: Name of the deck; a random name is used if it is empty.
+        :param notetype: Name of the Anki note type the two fields are imported into.
+        """
+
+        self.notetype = notetype
+        super().__init__(output_dir, deck_title)
+        self._writer = csv.writer(self._file, delimiter="\t", lineterminator="\n")
+
+    def _write_header(self) -> None:
+        self._file.write("#separator:tab\n"
+                         "#html:true\n"
+                         f"#notetype:{self.notetype}\n"
+                         f"#deck:{self.deck_title}\n"
+                         "#columns:Question\tAnswer\tGUID\n"
+                         "#guid column:3\n")
+
+    def _write_card(self, guid: str, question: str, answer: str) -> None:
+        self._writer.writerow((question, answer, guid))
+
+
+class JSONLWriter(_TextWriter):
+    """One JSON object per line with the deck, GUID, question and answer of a card."""
+
+    extension = ".jsonl"
+
+    def _write_card(self, guid: str, question: str, answer: str) -> None:
+        self._file.write(json.dumps({"deck": self.deck_title, "guid": guid, "question": question, "answer": answer},
+                                    ensure_ascii=False))
+        self._file.write("\n")
+
+
+class ApkgShardWriter(CardWriter):
+    """
+    Anki packages of at most shard_size notes each, named <deck_title>.shard<N>.apkg.
+
+    Only the notes of the current shard are kept in memory. Every shard has the same deck ID and note type,
+    so importing all of them into Anki builds one deck.
+    """
+
+    extension = ".apkg"
+
+    def __init__(self, output_dir: str, deck_title: str, model: Optional["Model"] = None,
+                 shard_size: int = SHARD_NOTES):
+        """
+        Start writing a deck.
+
+        :param output_dir: Directory the packages are written to.
+        :param deck_title: Name of the deck; a random name is used if it is empty.
+        :param model: Note type of the cards, the default note type if omitted.
+        :param shard_size: Maximum number of notes per package.
+        """
+
+        super().__init__(output_dir, deck_title)
+        self.model = model if model is not None else create_model()
+        self.shard_size = max(1, shard_size)
+        self.deck_id = deck_id_for(self.deck_title)
+        self._notes = []
+        self._shards = []
+
+    def shard_path(self, number: int) -> str:
+        """
+        Get the path of a shard.
+
+        :param number: Number of the shard, starting at 1.
+        :return: The path of <deck_title>.shard<number>.apkg.
+        """
+
+        return os.path.join(self.output_dir, f"{self.deck_title}{SHARD_INFIX}{number}{self.extension}")
+
+    def _write_card(self, guid: str, question: str, answer: str) -> None:
+        self._notes.append((guid, question, answer))
+        if len(self._notes) >= self.shard_size:
+            self._write_shard()
+
+    def _write_shard(self) -> None:
+        tmp_path = f"{self.shard_path(len(self._shards) + 1)}.tmp"
+        write_notes(self._notes, self.deck_title, tmp_path, self.model, self.deck_id)
+        self._shards.append(tmp_path)
+        self._notes = []
+
+    def _finish(self) -> List[str]:
+        if self._notes or not self._shards:
+            self._write_shard()
+
+        paths = [self.shard_path(number) for number in range(1, len(self._shards) + 1)]
+        for tmp_path, path in zip(self._shards, paths):
+            os.replace(tmp_path, path)
+
+        # Shards of an earlier, larger export of the deck would be imported along with the new ones.
+        number = len(paths) + 1
+        while os.path.exists(self.shard_path(number)):
+            os.remove(self.shard_path(number))
+            number += 1
+
+        return paths
+
+    def _discard(self) -> None:
+        for tmp_path in self._shards:
+            os.remove(tmp_path)
+        self._notes = []
+
+
+WRITERS = {
+    "apkg": ApkgShardWriter,
+    "tsv": TSVWriter,
+    "jsonl": JSONLWriter,
+}
+EXPORT_FORMATS = tuple(WRITERS)
+
+
+def create_writer(export_format: str, output_dir: str, deck_title: str, model: Optional["Model"] = None,
+                  shard_size: int = SHARD_NOTES) -> CardWriter:
+    """
+    Create the streaming writer of an export format.
+
+    :param export_format: One of EXPORT_FORMATS.
+    :param output_dir: Directory the files are written to.
+    :param deck_title: Name of the deck; a random name is used if it is empty.
+    :param model: Note type of the cards in .apkg shards.
+    :param shard_size: Maximum number of notes per .apkg shard.
+    :return: The writer.
+    :raises ValueError: If the format is unknown.
+    """
+
+    if export_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {', '.join(EXPORT_FORMATS)}")
+
+    if export_format == "apkg":
+        return ApkgShardWriter(output_dir, deck_title, model, shard_size)
+
+    return WRITERS[export_format](output_dir, deck_title)